@@ -1,17 +1,26 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for
+from flask import Flask, render_template, jsonify, request, redirect, url_for, send_file, Response, stream_with_context
 from flask_cors import CORS
 import json
 import os
 import logging
+import threading
 from datetime import datetime
 from models.dataset_manager import DatasetManager
 from models.annotation_manager import AnnotationManager
 from models.video_download_manager import VideoDownloadManager
+from models.video_download_job_manager import VideoDownloadJobManager
 from models.qa_manager import QAManager
 from models.candidate_qa_manager import candidate_qa_manager, CandidateQAManager
 from models.quiz_manager import quiz_manager, QuizManager
 from models.qa_constructor_manager import qa_constructor_manager, QAConstructorManager
 from models.video_path_manager import video_path_manager
+from models.video_metadata_manager import video_metadata_manager
+from models.video_clip_manager import video_clip_manager, time_to_seconds, CLIP_REQUEST_WAIT
+from models.video_thumbnail_manager import video_thumbnail_manager
+from models.video_proxy_manager import video_proxy_manager
+from models.video_mosaic_manager import video_mosaic_manager
+from models.video_frame_manager import video_frame_manager, FRAME_MIMETYPES
+from models.video_faststart_manager import video_faststart_manager
 from config import config
 
 # 创建Flask应用
@@ -40,9 +49,29 @@ logger = logging.getLogger(__name__)
 dataset_manager = DatasetManager()
 annotation_manager = AnnotationManager()
 video_download_manager = VideoDownloadManager(dataset_manager=dataset_manager)
+video_download_job_manager = VideoDownloadJobManager(video_download_manager)
 qa_manager = QAManager()
 # 使用候选QA管理器作为主要QA管理器
 
+# /api/video/resolve 单次请求可解析的最大数量
+MAX_RESOLVE_PAIRS = 5000
+
+# 监听视频目录，下载器新增的视角文件无需手动重扫即可生效
+# 在第一个请求时才启动：导入模块不触发扫描，debug模式下reloader的监控进程也不会重复启动
+_video_watch_started = False
+_video_watch_lock = threading.Lock()
+
+@app.before_request
+def start_video_watch():
+    global _video_watch_started
+    if _video_watch_started or not app.config['VIDEO_WATCH']:
+        return
+    with _video_watch_lock:
+        if _video_watch_started:
+            return
+        _video_watch_started = True
+    video_path_manager.start_watching()
+
 @app.route('/')
 def index():
     """默认进入QA构造模式"""
@@ -172,40 +201,78 @@ def get_video_status():
 
 @app.route('/api/video/download', methods=['POST'])
 def download_video():
-    """下载视频"""
+    """
+    提交视频下载任务，立即返回job_id（202）；同一样本已在下载时返回已有任务
+    
+    请求中 wait=true 时等待下载完成并返回下载结果（兼容旧的同步调用方式）
+    """
     data = request.json
     dataset_name = data.get('dataset')
     sample_name = data.get('sample')
     video_type = data.get('type')  # 'youtube', 'single_video', 'multiple_videos'
-    video_info = data.get('video_info')  # 具体信息
+    video_info = data.get('video_info') or {}  # 具体信息
     
     if not dataset_name or not sample_name or not video_type:
         return jsonify({'error': '缺少必要参数'}), 400
+    if video_type not in ['youtube', 'single_video', 'multiple_videos']:
+        return jsonify({'error': '不支持的视频类型'}), 400
+    if video_type == 'youtube' and not video_info.get('youtube_url'):
+        return jsonify({'error': '缺少youtube_url'}), 400
     
     try:
-        if video_type == 'youtube':
-            # YouTube视频下载
-            youtube_url = video_info.get('youtube_url')
-            video_filename = f"{sample_name}_youtube.mp4"
-            
-            result = video_download_manager.download_youtube_video(
-                youtube_url, dataset_name, sample_name, video_filename
-            )
-            
-        elif video_type in ['single_video', 'multiple_videos']:
-            # HuggingFace视频下载
-            result = video_download_manager.download_huggingface_video(
-                dataset_name, sample_name
-            )
-            
-        else:
-            return jsonify({'error': '不支持的视频类型'}), 400
-        
-        return jsonify(result)
+        job = video_download_job_manager.submit(dataset_name, sample_name, video_type, video_info)
+        if data.get('wait'):
+            job = video_download_job_manager.wait(job['job_id']) or job
+            return jsonify(job['result'] or {'success': False, 'message': job['error'] or job['status']})
+        return jsonify(job), 202
         
     except Exception as e:
         return jsonify({'error': f'下载失败: {str(e)}'}), 500
 
+@app.route('/api/video/download/jobs')
+def list_download_jobs():
+    """列出下载任务（active=true 时只返回排队中/下载中的任务）"""
+    try:
+        active_only = request.args.get('active', 'false').lower() == 'true'
+        return jsonify({
+            'jobs': video_download_job_manager.list_jobs(active_only),
+            **video_download_job_manager.get_status()
+        })
+    except Exception as e:
+        return jsonify({'error': f'获取下载任务失败: {str(e)}'}), 500
+
+@app.route('/api/video/download/events')
+def stream_download_events():
+    """
+    以Server-Sent Events推送下载进度（phase: download/extract/validate/faststart，
+    downloaded_bytes、total_bytes、percent、rate、eta）；指定job_id时只推送该任务并在结束后关闭
+    """
+    job_id = request.args.get('job_id') or None
+    if job_id and not video_download_job_manager.get_job(job_id):
+        return jsonify({'error': '下载任务不存在'}), 404
+    return Response(
+        stream_with_context(video_download_job_manager.iter_events(job_id)),
+        mimetype='text/event-stream',
+        # 禁止代理缓冲，事件才能实时到达浏览器
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/video/download/<job_id>')
+def get_download_job(job_id):
+    """获取下载任务的状态、进度与结果"""
+    job = video_download_job_manager.get_job(job_id)
+    if not job:
+        return jsonify({'error': '下载任务不存在'}), 404
+    return jsonify(job)
+
+@app.route('/api/video/download/<job_id>/cancel', methods=['POST'])
+def cancel_download_job(job_id):
+    """取消下载任务"""
+    job = video_download_job_manager.cancel(job_id)
+    if not job:
+        return jsonify({'error': '下载任务不存在'}), 404
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/api/video/delete', methods=['POST'])
 def delete_video():
     """删除视频文件"""
@@ -375,6 +442,46 @@ def get_segment_video_path(segment_id):
     except Exception as e:
         return jsonify({'error': f'获取视频路径失败: {str(e)}'}), 500
 
+@app.route('/media/<video_name>/<perspective>')
+def stream_video(video_name, perspective):
+    """
+    视频播放专用路由：通过VideoPathManager解析文件，支持Range/206断点读取、
+    强ETag与Last-Modified条件请求；文件发送交给WSGI服务器的file_wrapper（sendfile）
+    或前置代理的X-Sendfile（USE_X_SENDFILE）
+    
+    quality=proxy 时优先返回低分辨率代理文件，代理尚未生成时返回原文件并在后台转码
+    """
+    video_path = video_path_manager.get_media_file(video_name, perspective)
+    if not video_path:
+        return jsonify({'error': '视频或视角不存在'}), 404
+    quality = 'original'
+    proxy_requested = request.args.get('quality') == 'proxy'
+    if proxy_requested:
+        proxy_path = video_proxy_manager.get_proxy_path(video_name, perspective)
+        if proxy_path:
+            video_path = proxy_path
+            quality = 'proxy'
+    # 代理尚未生成时返回的原文件不能长期缓存，否则代理生成后浏览器仍使用缓存的原文件
+    fallback = proxy_requested and quality == 'original'
+    try:
+        response = send_file(
+            video_path,
+            mimetype='video/mp4' if quality == 'proxy' else None,
+            conditional=True,
+            etag=True,
+            max_age=0 if fallback else app.config['MEDIA_CACHE_MAX_AGE']
+        )
+        if fallback:
+            # 每次使用前都用ETag重新验证，代理生成后ETag变化即返回代理文件
+            response.cache_control.no_cache = True
+        response.headers['X-Video-Quality'] = quality
+        return response
+    except FileNotFoundError:
+        # 目录索引尚未感知到文件删除
+        return jsonify({'error': '视频文件不存在'}), 404
+    except Exception as e:
+        return jsonify({'error': f'读取视频失败: {str(e)}'}), 500
+
 @app.route('/api/video/directory/set', methods=['POST'])
 def set_video_directory():
     """设置视频文件目录"""
@@ -389,14 +496,15 @@ def set_video_directory():
         candidate_qa_manager.set_video_base_directory(video_dir)
         video_path_manager.set_base_video_dir(video_dir)
         
-        # 扫描视频文件
-        video_map = video_path_manager.scan_video_directory()
+        # 扫描视频文件（默认复用持久化索引，仅重扫变化的目录）
+        video_map = video_path_manager.scan_video_directory(force=bool(data.get('force_rescan', False)))
         
         return jsonify({
             'success': True,
             'video_dir': video_dir,
             'video_count': len(video_map),
-            'videos': list(video_map.keys())
+            'videos': list(video_map.keys()),
+            'catalog_version': video_path_manager.catalog_version
         })
     except Exception as e:
         return jsonify({'error': f'设置视频目录失败: {str(e)}'}), 500
@@ -417,25 +525,264 @@ def list_all_videos():
     """列出所有可用的视频"""
     try:
         videos = video_path_manager.list_all_videos()
-        return jsonify({'videos': videos})
+        return jsonify({'videos': videos, 'catalog_version': video_path_manager.catalog_version})
     except Exception as e:
         return jsonify({'error': f'获取视频列表失败: {str(e)}'}), 500
 
+@app.route('/api/video/resolve', methods=['POST'])
+def resolve_video_paths():
+    """批量解析视频路径与视角列表（一次请求替代逐个视频查询）"""
+    try:
+        data = request.json or {}
+        items = data.get('pairs', [])
+        if not isinstance(items, list):
+            return jsonify({'error': 'pairs必须是列表'}), 400
+        if len(items) > MAX_RESOLVE_PAIRS:
+            return jsonify({'error': f'单次最多解析 {MAX_RESOLVE_PAIRS} 项'}), 400
+        
+        # 支持 {"video_name": ..., "perspective": ...} 或 [video_name, perspective]
+        pairs = []
+        for item in items:
+            if isinstance(item, dict):
+                pairs.append((str(item.get('video_name', '')), item.get('perspective')))
+            elif isinstance(item, (list, tuple)) and item:
+                pairs.append((str(item[0]), item[1] if len(item) > 1 else None))
+            else:
+                return jsonify({'error': f'无效的解析项: {item}'}), 400
+        
+        results = video_path_manager.resolve_many(pairs)
+        return jsonify({'results': results, 'catalog_version': video_path_manager.catalog_version})
+    except Exception as e:
+        return jsonify({'error': f'解析视频路径失败: {str(e)}'}), 500
+
+@app.route('/api/video/catalog/status')
+def get_video_catalog_status():
+    """获取视频目录索引版本与监听状态（客户端轮询此接口判断是否需要刷新视角）"""
+    try:
+        return jsonify(video_path_manager.get_catalog_status())
+    except Exception as e:
+        return jsonify({'error': f'获取视频目录状态失败: {str(e)}'}), 500
+
 @app.route('/api/video/<video_name>/perspectives')
 def get_video_perspectives(video_name):
     """获取指定视频的所有视角"""
     try:
         perspectives = video_path_manager.get_available_perspectives(video_name)
-        return jsonify({'perspectives': perspectives})
+        return jsonify({'perspectives': perspectives, 'catalog_version': video_path_manager.catalog_version})
     except Exception as e:
         return jsonify({'error': f'获取视频视角失败: {str(e)}'}), 500
 
+@app.route('/api/video/<video_name>/metadata')
+def get_video_metadata(video_name):
+    """获取视频各视角的元数据（时长、帧率、分辨率、编码、关键帧间隔），未缓存的按需探测"""
+    try:
+        perspective = request.args.get('perspective')
+        metadata = video_metadata_manager.get_video_metadata(video_name, perspective)
+        if metadata is None:
+            return jsonify({'error': '视频或视角不存在'}), 404
+        return jsonify({
+            'video_name': video_name,
+            'metadata': metadata,
+            'ffprobe_available': video_metadata_manager.ffprobe_available
+        })
+    except Exception as e:
+        return jsonify({'error': f'获取视频元数据失败: {str(e)}'}), 500
+
+@app.route('/api/video/metadata/probe', methods=['POST'])
+def start_video_metadata_probe():
+    """后台并行探测所有（或指定）视频的元数据"""
+    try:
+        data = request.json or {}
+        started = video_metadata_manager.start_background_probe(
+            video_names=data.get('video_names'),
+            workers=data.get('workers')
+        )
+        return jsonify({'success': started, **video_metadata_manager.get_status()})
+    except Exception as e:
+        return jsonify({'error': f'启动元数据探测失败: {str(e)}'}), 500
+
+@app.route('/api/video/metadata/status')
+def get_video_metadata_status():
+    """获取元数据缓存与后台探测任务状态"""
+    try:
+        return jsonify(video_metadata_manager.get_status())
+    except Exception as e:
+        return jsonify({'error': f'获取元数据状态失败: {str(e)}'}), 500
+
+@app.route('/api/video/<video_name>/thumbnails')
+def get_video_thumbnails(video_name):
+    """获取视角的缩略图雪碧图索引，尚未生成时提交后台任务（status为pending）"""
+    try:
+        perspective = request.args.get('perspective')
+        if not perspective:
+            return jsonify({'error': '缺少perspective参数'}), 400
+        thumbnails = video_thumbnail_manager.get_thumbnails(video_name, perspective)
+        if thumbnails is None:
+            return jsonify({'error': '视频或视角不存在'}), 404
+        status_code = 200 if thumbnails['status'] == 'ready' else 202
+        return jsonify({'video_name': video_name, 'perspective': perspective, **thumbnails}), status_code
+    except Exception as e:
+        return jsonify({'error': f'获取缩略图失败: {str(e)}'}), 500
+
+@app.route('/api/video/thumbnails/generate', methods=['POST'])
+def generate_video_thumbnails():
+    """为所有（或指定）视频批量生成缩略图"""
+    try:
+        data = request.json or {}
+        queued = video_thumbnail_manager.start_background_job(data.get('video_names'))
+        return jsonify({'success': True, 'queued': queued, **video_thumbnail_manager.get_status()})
+    except Exception as e:
+        return jsonify({'error': f'提交缩略图任务失败: {str(e)}'}), 500
+
+@app.route('/api/video/thumbnails/status')
+def get_video_thumbnails_status():
+    """获取缩略图后台任务状态"""
+    try:
+        return jsonify(video_thumbnail_manager.get_status())
+    except Exception as e:
+        return jsonify({'error': f'获取缩略图状态失败: {str(e)}'}), 500
+
+@app.route('/thumbnails/<key>/<file_name>')
+def serve_thumbnail_file(key, file_name):
+    """缩略图雪碧图/WebVTT文件（目录名由源文件与参数哈希得到，内容不变，可长期缓存）"""
+    file_path = video_thumbnail_manager.get_file_path(key, file_name)
+    if not file_path:
+        return jsonify({'error': '缩略图文件不存在'}), 404
+    mimetype = 'text/vtt' if file_name.endswith('.vtt') else 'image/jpeg'
+    return send_file(file_path, mimetype=mimetype, conditional=True, max_age=365 * 24 * 3600)
+
+@app.route('/api/video/<video_name>/mosaic')
+def get_video_mosaic(video_name):
+    """获取多视角拼接预览（所有视角按时间对齐拼成一路视频），尚未生成时提交后台任务（status为pending）"""
+    try:
+        mosaic = video_mosaic_manager.get_mosaic(video_name)
+        if mosaic is None:
+            return jsonify({'error': '视频不存在或没有可用视角'}), 404
+        status_code = 200 if mosaic['status'] == 'ready' else 202
+        return jsonify({'video_name': video_name, **mosaic}), status_code
+    except Exception as e:
+        return jsonify({'error': f'获取拼接预览失败: {str(e)}'}), 500
+
+@app.route('/api/video/mosaics/generate', methods=['POST'])
+def generate_video_mosaics():
+    """为所有（或指定）多视角视频批量生成拼接预览"""
+    try:
+        data = request.json or {}
+        queued = video_mosaic_manager.start_background_job(data.get('video_names'))
+        return jsonify({'success': True, 'queued': queued, **video_mosaic_manager.get_status()})
+    except Exception as e:
+        return jsonify({'error': f'提交拼接预览任务失败: {str(e)}'}), 500
+
+@app.route('/api/video/mosaics/status')
+def get_video_mosaics_status():
+    """获取拼接预览后台任务状态"""
+    try:
+        return jsonify(video_mosaic_manager.get_status())
+    except Exception as e:
+        return jsonify({'error': f'获取拼接预览状态失败: {str(e)}'}), 500
+
+@app.route('/mosaics/<file_name>')
+def serve_mosaic_file(file_name):
+    """拼接预览视频（文件名由视角文件与参数哈希得到，内容不变，可长期缓存）"""
+    file_path = video_mosaic_manager.get_file_path(file_name)
+    if not file_path:
+        return jsonify({'error': '拼接预览不存在'}), 404
+    return send_file(file_path, mimetype='video/mp4', conditional=True, max_age=365 * 24 * 3600)
+
+@app.route('/api/video/<video_name>/frame')
+def get_video_frame(video_name):
+    """
+    获取视角在指定时间点的单帧截图
+    
+    参数: perspective, time（秒或 mm:ss.xx）, format（jpg/webp）, width（像素，0为原始分辨率）
+    """
+    try:
+        perspective = request.args.get('perspective')
+        seconds = time_to_seconds(request.args.get('time'))
+        if not perspective or seconds is None:
+            return jsonify({'error': '缺少perspective或time参数'}), 400
+        options = video_frame_manager.normalize_options(request.args.get('format'), request.args.get('width'))
+        if not options:
+            return jsonify({'error': 'format或width参数无效'}), 400
+        
+        frame_path = video_frame_manager.get_frame(video_name, perspective, seconds, *options)
+        if not frame_path:
+            return jsonify({'error': '无法截取该时间点的画面'}), 404
+        return send_file(frame_path, mimetype=FRAME_MIMETYPES[options[0]], conditional=True,
+                         max_age=app.config['MEDIA_CACHE_MAX_AGE'])
+    except Exception as e:
+        return jsonify({'error': f'获取视频截图失败: {str(e)}'}), 500
+
+@app.route('/api/video/frames/precompute', methods=['POST'])
+def precompute_video_frames():
+    """为当前答题文件（source=quiz）或构造文件（source=constructor）的cut_point/提问视角_time预生成截图"""
+    try:
+        data = request.json or {}
+        source = data.get('source', 'quiz')
+        if source == 'quiz':
+            qas = quiz_manager.get_all_qas()
+        elif source == 'constructor':
+            qas = [qa for video_qas in qa_constructor_manager.qa_data.values() for qa in video_qas]
+        else:
+            return jsonify({'error': 'source参数必须是quiz或constructor'}), 400
+        if not video_frame_manager.normalize_options(data.get('format'), data.get('width')):
+            return jsonify({'error': 'format或width参数无效'}), 400
+        
+        started = video_frame_manager.start_precompute(qas, data.get('format'), data.get('width'))
+        return jsonify({'success': True, 'started': started, **video_frame_manager.get_status()})
+    except Exception as e:
+        return jsonify({'error': f'预生成视频截图失败: {str(e)}'}), 500
+
+@app.route('/api/video/frames/status')
+def get_video_frames_status():
+    """获取截图缓存统计与预生成任务状态"""
+    try:
+        return jsonify(video_frame_manager.get_status())
+    except Exception as e:
+        return jsonify({'error': f'获取截图状态失败: {str(e)}'}), 500
+
+@app.route('/api/video/faststart/remux', methods=['POST'])
+def remux_videos_faststart():
+    """后台检查所有（或指定）视频的视角文件，moov在末尾的MP4重新封装为faststart"""
+    try:
+        data = request.json or {}
+        started = video_faststart_manager.start_background_job(data.get('video_names'))
+        return jsonify({'success': True, 'started': started, **video_faststart_manager.get_status()})
+    except Exception as e:
+        return jsonify({'error': f'启动faststart封装失败: {str(e)}'}), 500
+
+@app.route('/api/video/faststart/status')
+def get_faststart_status():
+    """获取faststart记录统计与批量任务状态"""
+    try:
+        return jsonify(video_faststart_manager.get_status())
+    except Exception as e:
+        return jsonify({'error': f'获取faststart状态失败: {str(e)}'}), 500
+
+@app.route('/api/video/proxies/generate', methods=['POST'])
+def generate_video_proxies():
+    """为所有（或指定）视频批量生成低分辨率代理文件，已是最新的跳过"""
+    try:
+        data = request.json or {}
+        summary = video_proxy_manager.start_background_job(data.get('video_names'))
+        return jsonify({'success': True, **summary, **video_proxy_manager.get_status()})
+    except Exception as e:
+        return jsonify({'error': f'提交代理转码任务失败: {str(e)}'}), 500
+
+@app.route('/api/video/proxies/status')
+def get_video_proxies_status():
+    """获取代理转码任务状态"""
+    try:
+        return jsonify(video_proxy_manager.get_status())
+    except Exception as e:
+        return jsonify({'error': f'获取代理转码状态失败: {str(e)}'}), 500
+
 @app.route('/api/qa/save', methods=['POST'])
 def force_save_qa():
     """强制保存QA数据（与自动保存一致，写回当前文件）"""
     try:
         success = candidate_qa_manager.export_final_results()
-        return jsonify({'success': success, 'message': '已写回当前文件'})
+        return jsonify({'success': success, 'message': '已写回当前文件（编辑日志已压缩）'})
     except Exception as e:
         return jsonify({'error': f'保存失败: {str(e)}'}), 500
 
@@ -463,7 +810,8 @@ def get_current_json_file():
             'file_name': (input_file.split('/')[-1] if input_file else ''),
             'exists': input_exists,
             'absolute_input_file': os.path.abspath(input_file) if input_file else '',
-            'absolute_output_file': os.path.abspath(output_file) if output_file else ''
+            'absolute_output_file': os.path.abspath(output_file) if output_file else '',
+            'journal': candidate_qa_manager.get_journal_status()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -643,6 +991,74 @@ def get_quiz_qa(qa_id):
     except Exception as e:
         return jsonify({'error': f'获取QA失败: {str(e)}'}), 500
 
+@app.route('/api/quiz/qa/<qa_id>/video')
+def get_quiz_qa_video(qa_id):
+    """
+    获取QA对应的视频片段地址（只包含 start_time..end_time，cut_point在其中）
+    
+    clip_start为片段在原视频中的实际起点（流复制时是start_time之前最近的关键帧）；
+    片段在后台截取，尚未完成时返回202、clip_status为pending，不可用（如缺少ffmpeg、时间无效）时
+    clip_status为unavailable，两种情况都返回完整视频地址，clip_start为0
+    """
+    try:
+        qa = quiz_manager.get_qa_by_id(qa_id)
+        if not qa:
+            return jsonify({'error': 'QA不存在'}), 404
+        
+        video_name = qa.get('video_name', '')
+        perspectives = qa.get('视角', [])
+        perspective = request.args.get('perspective') or (perspectives[0] if perspectives else None)
+        exact = request.args.get('exact', 'false').lower() == 'true'
+        start = time_to_seconds(qa.get('start_time'))
+        end = time_to_seconds(qa.get('end_time'))
+        
+        clip = None
+        if perspective and start is not None and end is not None:
+            # 流复制很快，稍等片刻通常能直接返回片段；重编码不占用请求线程
+            clip = video_clip_manager.request_clip(video_name, perspective, start, end, exact=exact,
+                                                   wait=0 if exact else CLIP_REQUEST_WAIT)
+        
+        if clip and clip['status'] == 'ready':
+            return jsonify({
+                'clip_url': f"/clips/{clip['clip_name']}",
+                'clip_status': 'ready',
+                'clip_start': clip['clip_start'],
+                'clip_end': end,
+                'exact': exact,
+                'video_path': video_path_manager.get_web_video_path(video_name, perspective)
+            })
+        pending = clip is not None
+        return jsonify({
+            'clip_url': None,
+            'clip_status': 'pending' if pending else 'unavailable',
+            'clip_start': 0,
+            'clip_end': None,
+            'exact': False,
+            'video_path': video_path_manager.get_web_video_path(video_name, perspective)
+        }), 202 if pending else 200
+    except Exception as e:
+        return jsonify({'error': f'获取QA视频失败: {str(e)}'}), 500
+
+@app.route('/clips/<clip_name>')
+def stream_clip(clip_name):
+    """播放缓存的视频片段（支持Range/ETag）"""
+    clip_path = video_clip_manager.get_clip_path(clip_name)
+    if not clip_path:
+        return jsonify({'error': '片段不存在或已被淘汰'}), 404
+    try:
+        return send_file(clip_path, mimetype='video/mp4', conditional=True, etag=True,
+                         max_age=app.config['MEDIA_CACHE_MAX_AGE'])
+    except FileNotFoundError:
+        return jsonify({'error': '片段不存在或已被淘汰'}), 404
+
+@app.route('/api/clips/status')
+def get_clip_cache_status():
+    """获取片段缓存状态"""
+    try:
+        return jsonify(video_clip_manager.get_status())
+    except Exception as e:
+        return jsonify({'error': f'获取片段缓存状态失败: {str(e)}'}), 500
+
 @app.route('/api/quiz/qa/<qa_id>/answer', methods=['POST'])
 def set_quiz_answer(qa_id):
     """设置用户答案"""
@@ -715,6 +1131,38 @@ def get_quiz_statistics():
     except Exception as e:
         return jsonify({'error': f'获取统计信息失败: {str(e)}'}), 500
 
+@app.route('/api/quiz/export', methods=['POST'])
+def export_quiz_file():
+    """导出合并了答案的完整答题文件"""
+    try:
+        data = request.json or {}
+        file_name = data.get('file_name')
+        
+        # 未指定文件名时导出到 <原文件名>_answered.json
+        output_path = None
+        if file_name:
+            # 只接受data目录下的.json文件名，防止通过路径写到其他位置
+            data_dir = os.path.realpath(os.path.join(os.getcwd(), 'data'))
+            safe_name = os.path.basename(str(file_name))
+            if not safe_name.lower().endswith('.json') or safe_name != file_name:
+                return jsonify({'success': False, 'error': f'无效的文件名: {file_name}（只能是data目录下的.json文件）'}), 400
+            output_path = os.path.realpath(os.path.join(data_dir, safe_name))
+            if os.path.dirname(output_path) != data_dir:
+                return jsonify({'success': False, 'error': f'无效的文件名: {file_name}'}), 400
+        exported_path = quiz_manager.export_merged(output_path)
+        
+        if not exported_path:
+            return jsonify({'success': False, 'error': '导出失败'}), 500
+        
+        return jsonify({
+            'success': True,
+            'message': f'已导出: {os.path.basename(exported_path)}',
+            'file_path': exported_path,
+            'absolute_path': os.path.abspath(exported_path)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'导出失败: {str(e)}'}), 500
+
 @app.route('/api/quiz/load-file', methods=['POST'])
 def load_quiz_file():
     """加载答题JSON文件"""
@@ -741,7 +1189,8 @@ def load_quiz_file():
             'message': f'成功加载文件: {file_name}',
             'file_name': file_name,
             'file_path': quiz_manager.get_current_file(),
-            'absolute_path': os.path.abspath(file_path)
+            'absolute_path': os.path.abspath(file_path),
+            'duplicate_qa_ids': quiz_manager.duplicate_qa_ids
         })
         
     except Exception as e:
@@ -790,7 +1239,7 @@ def update_constructor_qa(qa_id):
         
         if success:
             print(f"[API] ✓ 更新成功")
-            return jsonify({'success': True, 'message': '已自动保存'})
+            return jsonify({'success': True, 'message': '已自动保存', **qa_constructor_manager.get_save_status()})
         else:
             print(f"[API] ✗ 更新失败")
             return jsonify({'success': False, 'error': '更新失败'}), 500
@@ -805,7 +1254,7 @@ def delete_constructor_qa(qa_id):
     """删除QA"""
     try:
         success = qa_constructor_manager.delete_qa(qa_id)
-        return jsonify({'success': success, 'message': '已自动保存'})
+        return jsonify({'success': success, 'message': '已自动保存', **qa_constructor_manager.get_save_status()})
     except Exception as e:
         return jsonify({'error': f'删除QA失败: {str(e)}'}), 500
 
@@ -826,9 +1275,10 @@ def duplicate_constructor_qa(qa_id):
                 if video_name:
                     qas = qa_constructor_manager.get_video_qas(video_name)
                     print(f"[API] ✓ 复制成功，当前QA数量: {len(qas)}")
-                    return jsonify({'success': True, 'message': '已自动保存', 'qas': qas})
+                    return jsonify({'success': True, 'message': '已自动保存', 'qas': qas,
+                                    **qa_constructor_manager.get_save_status()})
             
-            return jsonify({'success': True, 'message': '已自动保存'})
+            return jsonify({'success': True, 'message': '已自动保存', **qa_constructor_manager.get_save_status()})
         else:
             print(f"[API] ✗ 复制失败")
             return jsonify({'success': False, 'error': '复制QA失败'}), 500
@@ -850,7 +1300,8 @@ def create_constructor_qa(video_name):
             # 返回更新后的QA列表
             qas = qa_constructor_manager.get_video_qas(video_name)
             print(f"[API] ✓ 创建成功，当前QA数量: {len(qas)}")
-            return jsonify({'success': True, 'message': '已自动保存', 'qas': qas})
+            return jsonify({'success': True, 'message': '已自动保存', 'qas': qas,
+                            **qa_constructor_manager.get_save_status()})
         else:
             print(f"[API] ✗ 创建失败")
             return jsonify({'success': False, 'error': '创建QA失败'}), 500
@@ -864,8 +1315,12 @@ def create_constructor_qa(video_name):
 def get_constructor_perspectives(video_name):
     """获取视频的所有可用视角"""
     try:
+        # 客户端带上已缓存的目录索引版本，未变化时不再返回视角列表
+        catalog_version = video_path_manager.catalog_version
+        if request.args.get('catalog_version') == str(catalog_version) and catalog_version > 0:
+            return jsonify({'unchanged': True, 'catalog_version': catalog_version})
         perspectives = qa_constructor_manager.get_available_perspectives(video_name)
-        return jsonify({'perspectives': perspectives})
+        return jsonify({'perspectives': perspectives, 'catalog_version': video_path_manager.catalog_version})
     except Exception as e:
         return jsonify({'error': f'获取视角失败: {str(e)}'}), 500
 
@@ -904,8 +1359,9 @@ def load_constructor_file():
         if not os.path.exists(file_path):
             return jsonify({'success': False, 'error': f'文件不存在: {file_name}'}), 404
         
-        # 重新加载管理器
+        # 重新加载管理器（先把旧文件未写盘的修改落盘）
         global qa_constructor_manager
+        qa_constructor_manager.close()
         qa_constructor_manager = QAConstructorManager(file_path)
         
         return jsonify({
@@ -913,7 +1369,8 @@ def load_constructor_file():
             'message': f'成功加载文件: {file_name}',
             'file_name': file_name,
             'file_path': qa_constructor_manager.get_current_file(),
-            'absolute_path': os.path.abspath(file_path)
+            'absolute_path': os.path.abspath(file_path),
+            'duplicate_qa_ids': qa_constructor_manager.duplicate_qa_ids
         })
         
     except Exception as e:
@@ -924,10 +1381,18 @@ def save_constructor_file():
     """强制保存QA数据"""
     try:
         success = qa_constructor_manager.save_qa_data()
-        return jsonify({'success': success, 'message': '已保存'})
+        return jsonify({'success': success, 'message': '已保存', **qa_constructor_manager.get_save_status()})
     except Exception as e:
         return jsonify({'error': f'保存失败: {str(e)}'}), 500
 
+@app.route('/api/constructor/save-status')
+def get_constructor_save_status():
+    """获取持久化状态（已写盘到哪个版本）"""
+    try:
+        return jsonify(qa_constructor_manager.get_save_status())
+    except Exception as e:
+        return jsonify({'error': f'获取保存状态失败: {str(e)}'}), 500
+
 if __name__ == '__main__':
     print("=" * 60)
     print("🎬 SpatialBench 视频标注工具")
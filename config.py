@@ -17,6 +17,10 @@ class Config:
     DATA_DIR = os.environ.get('DATA_DIR', 'data')
     VIDEO_DIR = os.environ.get('VIDEO_DIR', 'static/videos')
     QA_FILE_PATH = os.environ.get('QA_FILE_PATH', 'qa_results.json')
+    # 派生数据缓存目录（视频目录索引等），可随时删除重建
+    CACHE_DIR = os.environ.get('CACHE_DIR', 'cache')
+    # 监听视频目录变化（安装watchdog时使用inotify，否则定时轮询），默认关闭；开启后在第一个请求时启动
+    VIDEO_WATCH = os.environ.get('VIDEO_WATCH', 'False').lower() == 'true'
     
     # 视频下载配置
     MAX_VIDEO_SIZE = int(os.environ.get('MAX_VIDEO_SIZE', 500 * 1024 * 1024))  # 500MB
@@ -30,6 +34,12 @@ class Config:
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     LOG_FILE = os.environ.get('LOG_FILE', 'logs/spatialbench.log')
     
+    # 视频播放（/media 路由）配置
+    # 浏览器缓存时长（秒），过期后通过ETag/Last-Modified条件请求校验
+    MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 86400))
+    # 部署在nginx/apache之后时可启用X-Sendfile，由前置服务器直接发送文件
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'False').lower() == 'true'
+    
     # 安全配置
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
@@ -39,6 +49,7 @@ class Config:
         # 创建必要的目录
         Path(Config.DATA_DIR).mkdir(exist_ok=True)
         Path(Config.VIDEO_DIR).mkdir(parents=True, exist_ok=True)
+        Path(Config.CACHE_DIR).mkdir(parents=True, exist_ok=True)
         Path('logs').mkdir(exist_ok=True)
 
 class DevelopmentConfig(Config):
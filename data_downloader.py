@@ -73,11 +73,35 @@ hd_epic_samples = [
 import json
 import os
 import glob
-import csv
 import zipfile
 import shutil
-from typing import Set, List
-from huggingface_hub import hf_hub_download
+import time
+import uuid
+import queue
+import signal
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Set, List, Optional
+from huggingface_hub import hf_hub_download, hf_hub_url, get_hf_file_metadata
+from models.video_faststart_manager import video_faststart_manager
+from models.download_status_manager import get_download_status_manager, STATUS_OK, STATUS_FAILED
+
+HF_REPO_ID = "GuangsTrip/spatialpredictsource"
+
+# 并行批量下载：总并发数（1为逐个下载）与各数据源的并发上限
+# EgoExo4D/HD-EPIC是大压缩包且需要解压，YouTube/ActivityNet是单个MP4
+DOWNLOAD_BATCH_WORKERS = int(os.environ.get('DOWNLOAD_BATCH_WORKERS', 4))
+DOWNLOAD_SOURCE_LIMITS = {
+    "egoexo4d": int(os.environ.get('DOWNLOAD_LIMIT_EGOEXO4D', 2)),
+    "hd-epic": int(os.environ.get('DOWNLOAD_LIMIT_HD_EPIC', 2)),
+    "youtube": int(os.environ.get('DOWNLOAD_LIMIT_YOUTUBE', 4)),
+    "activitynet": int(os.environ.get('DOWNLOAD_LIMIT_ACTIVITYNET', 4)),
+}
+# 汇总进度的刷新间隔（秒）
+DOWNLOAD_PROGRESS_INTERVAL = float(os.environ.get('DOWNLOAD_PROGRESS_INTERVAL', 10))
+
+# download_single_video 最近一次失败的原因（video_name -> 错误信息），写入下载状态的last_error
+_download_errors = {}
 
 
 def scan_qa_files(qa_dir: str) -> list:
@@ -176,37 +200,80 @@ def get_video_type(video_name: str) -> str:
         return "activitynet"
 
 
-def download_single_video(video_name: str, cache_dir: str) -> bool:
-    """下载单个视频文件到本地缓存目录"""
+def get_source_file_path(video_name: str) -> tuple[str, str]:
+    """返回视频在HuggingFace仓库中的路径与文件扩展名"""
+    video_type = get_video_type(video_name)
+    if video_type in ["youtube", "activitynet"]:
+        # YouTube/ActivityNet视频是MP4文件
+        return f"videos/{video_type}/{video_name}.mp4", ".mp4"
+    # EgoExo4D和HD-EPIC是ZIP文件
+    return f"videos/{video_type}/{video_name}.zip", ".zip"
+
+
+def get_remote_file_sizes(video_list: List[str], workers: int = 8) -> Dict[str, int]:
+    """并行查询各视频在HuggingFace上的文件大小（只请求元数据），查询失败的记为0"""
+    def query(video_name):
+        try:
+            file_path, _ = get_source_file_path(video_name)
+            url = hf_hub_url(HF_REPO_ID, file_path, repo_type="dataset")
+            return video_name, get_hf_file_metadata(url).size or 0
+        except Exception as e:
+            print(f"警告: 获取 {video_name} 文件大小失败: {e}")
+            return video_name, 0
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(executor.map(query, video_list))
+
+
+def format_size(size_bytes: float) -> str:
+    """格式化字节数"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_bytes < 1024:
+            return f"{size_bytes:.1f}{unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f}TB"
+
+
+def _dir_size(path: str) -> int:
+    """目录下所有文件的总字节数（包括下载中的临时文件）"""
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.path.getsize(os.path.join(dir_path, file_name))
+            except OSError:
+                pass
+    return total
+
+
+def download_single_video(video_name: str, cache_dir: str, work_root: Optional[str] = None,
+                          faststart: bool = True) -> bool:
+    """
+    下载单个视频文件到本地缓存目录
+    
+    指定work_root时先下载、解压并校验到 work_root/<video_name>，成功后再整体移动到缓存目录；
+    失败时只清理自己的临时目录，不会碰到缓存目录中的同名视频
+    
+    faststart为False时不做faststart封装，由调用方处理（并行下载时只在主进程写封装记录）
+    """
     target_dir = os.path.join(cache_dir, video_name)
+    work_dir = os.path.join(work_root, video_name) if work_root else target_dir
     
     try:
         # 判断视频类型
         video_type = get_video_type(video_name)
         
         # 设置HuggingFace仓库和路径
-        repo_id = "GuangsTrip/spatialpredictsource"
-        
-        if video_type == "youtube":
-            # YouTube视频是MP4文件
-            file_path = f"videos/youtube/{video_name}.mp4"
-            file_extension = ".mp4"
-        elif video_type == "activitynet":
-            # ActivityNet视频是MP4文件
-            file_path = f"videos/activitynet/{video_name}.mp4"
-            file_extension = ".mp4"
-        else:
-            # EgoExo4D和HD-EPIC是ZIP文件
-            file_path = f"videos/{video_type}/{video_name}.zip"
-            file_extension = ".zip"
+        repo_id = HF_REPO_ID
+        file_path, file_extension = get_source_file_path(video_name)
         
         print(f"正在下载 {video_name} ({video_type})...")
         
         # 创建目标目录
-        os.makedirs(target_dir, exist_ok=True)
+        os.makedirs(work_dir, exist_ok=True)
         
         # 下载文件到临时目录
-        temp_download_dir = os.path.join(target_dir, ".temp_download")
+        temp_download_dir = os.path.join(work_dir, ".temp_download")
         os.makedirs(temp_download_dir, exist_ok=True)
         
         downloaded_file = hf_hub_download(
@@ -220,10 +287,10 @@ def download_single_video(video_name: str, cache_dir: str) -> bool:
             # 如果是ZIP文件，解压到目标目录
             print(f"正在解压 {video_name}...")
             with zipfile.ZipFile(downloaded_file, 'r') as zip_ref:
-                zip_ref.extractall(target_dir)
+                zip_ref.extractall(work_dir)
         else:
             # 如果是MP4文件，移动到目标目录
-            target_file = os.path.join(target_dir, f"{video_name}.mp4")
+            target_file = os.path.join(work_dir, f"{video_name}.mp4")
             
             # 确保目标文件不存在，避免冲突
             if os.path.exists(target_file):
@@ -247,23 +314,35 @@ def download_single_video(video_name: str, cache_dir: str) -> bool:
             shutil.rmtree(temp_download_dir)
         
         # 清理可能存在的其他缓存文件
-        _cleanup_cache_files(target_dir)
+        _cleanup_cache_files(work_dir)
         
         # 验证下载结果
-        if not _verify_download_success(target_dir, video_name, file_extension):
+        if not _verify_download_success(work_dir, video_name, file_extension):
             raise Exception("下载验证失败，文件不完整")
         
+        if work_dir != target_dir:
+            # 校验通过后整体移动到缓存目录（同一文件系统内为原子重命名）
+            os.makedirs(cache_dir, exist_ok=True)
+            if os.path.exists(target_dir):
+                shutil.rmtree(target_dir)
+            os.replace(work_dir, target_dir)
+        
+        if faststart:
+            # moov在文件末尾的MP4重新封装为faststart，浏览器无需下载整个文件即可开始播放
+            video_faststart_manager.process_paths(video_faststart_manager.collect_video_files(target_dir))
+        
         print(f"✓ {video_name} 下载完成")
         return True
         
     except Exception as e:
         print(f"✗ {video_name} 下载失败: {str(e)}")
+        _download_errors[video_name] = str(e)[:500]
         
         # 清理失败的目录
-        if os.path.exists(target_dir):
+        if os.path.exists(work_dir):
             try:
-                shutil.rmtree(target_dir)
-                print(f"已清理失败的目录: {target_dir}")
+                shutil.rmtree(work_dir)
+                print(f"已清理失败的目录: {work_dir}")
             except Exception as cleanup_error:
                 print(f"警告: 清理目录失败: {cleanup_error}")
         
@@ -349,35 +428,12 @@ def download_missing_videos(video_names: List[str]) -> None:
 
 
 def save_results_to_csv(results: dict, video_names: list, output_file: str) -> None:
-    """将检查结果保存到CSV文件，保留之前的异常状态"""
-    # 读取之前的CSV文件以保留异常状态
-    previous_status = {}
-    if os.path.exists(output_file):
-        try:
-            with open(output_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    video_name = row['video_name']
-                    status = row.get('status', '')
-                    # 保留异常状态
-                    if status == '下载异常':
-                        previous_status[video_name] = status
-        except Exception as e:
-            print(f"读取之前的CSV文件时出错: {e}")
-    
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['video_name', 'status', 'pick_now'])
-        for video_name in video_names:  # 按照原始顺序输出
-            exists = results[video_name]
-            if exists:
-                status = '✓'
-            elif video_name in previous_status:
-                # 保留之前的异常状态
-                status = previous_status[video_name]
-            else:
-                status = ''
-            writer.writerow([video_name, status, ''])
+    """将检查结果写入下载状态存储并导出CSV，保留之前的异常状态"""
+    manager = get_download_status_manager(output_file)
+    # 先导入CSV中用户的编辑，再写入扫描结果（会清除pick_now）
+    manager.import_csv(output_file)
+    manager.sync_scan_results(results, video_names)
+    manager.export_csv(output_file)
 
 
 def show_statistics(video_names: list, cache_dir: str, output_csv: str):
@@ -407,84 +463,51 @@ def show_statistics(video_names: list, cache_dir: str, output_csv: str):
 
 
 def read_selected_videos_from_csv(csv_file: str) -> List[str]:
-    """从CSV文件中读取用户选中的视频列表"""
-    selected_videos = []
-    try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # 检查pick_now列是否标记为选中（x, 1, true等）
-                pick_value = row.get('pick_now', '').strip().lower()
-                if pick_value in ['x', '1', 'true', 'yes', '✓']:
-                    selected_videos.append(row['video_name'])
-    except FileNotFoundError:
+    """从CSV文件中读取用户选中的视频列表（pick_now列导入下载状态存储）"""
+    if not os.path.exists(csv_file):
         print(f"错误: 找不到CSV文件 {csv_file}")
         print("请先运行统计功能生成CSV文件")
-    except Exception as e:
-        print(f"读取CSV文件时出错: {str(e)}")
-    
-    return selected_videos
+        return []
+    manager = get_download_status_manager(csv_file)
+    manager.import_csv(csv_file)
+    return manager.get_picked()
 
 
-def update_single_video_status(video_name: str, status: str, csv_file: str) -> None:
-    """更新单个视频的状态到CSV文件"""
-    if not os.path.exists(csv_file):
-        return
+def update_single_video_status(video_name: str, status: str, csv_file: str, bytes_downloaded: int = None,
+                               duration: float = None, error: str = None, attempt: bool = True) -> None:
+    """
+    更新单个视频的下载状态（只写存储中的一行，CSV视图在批次结束后导出）
     
+    attempt为False表示没有实际下载（本地已存在），不计入尝试次数
+    """
     try:
-        # 读取现有CSV数据
-        rows = []
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row['video_name'] == video_name:
-                    row['status'] = status
-                rows.append(row)
-        
-        # 写回CSV文件
-        with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-            if rows:
-                fieldnames = ['video_name', 'status', 'pick_now']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(rows)
-        
+        get_download_status_manager(csv_file).set_status(
+            video_name, status, bytes_downloaded=bytes_downloaded, duration=duration,
+            error=error, attempt=attempt
+        )
     except Exception as e:
         print(f"警告: 更新视频 {video_name} 状态时出错: {e}")
 
 
+def export_download_status(csv_file: str) -> None:
+    """把下载状态导出为CSV视图"""
+    get_download_status_manager(csv_file).export_csv(csv_file)
+
+
 def update_csv_after_download(video_list: List[str], success_list: List[str], failed_list: List[str], csv_file: str) -> None:
-    """下载完成后更新CSV文件状态"""
+    """下载完成后更新状态并导出CSV文件"""
     if not os.path.exists(csv_file):
         print(f"警告: CSV文件 {csv_file} 不存在，无法更新状态")
         return
     
     try:
-        # 读取现有CSV数据
-        rows = []
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                video_name = row['video_name']
-                
-                # 更新状态
-                if video_name in success_list:
-                    row['status'] = '✓'
-                elif video_name in failed_list:
-                    row['status'] = '下载异常'
-                
-                # 清除pick_now标记（无论是否在下载列表中）
-                row['pick_now'] = ''
-                
-                rows.append(row)
-        
-        # 写回CSV文件
-        with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-            if rows:
-                fieldnames = ['video_name', 'status', 'pick_now']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(rows)
+        manager = get_download_status_manager(csv_file)
+        statuses = {video_name: STATUS_OK for video_name in success_list}
+        statuses.update({video_name: STATUS_FAILED for video_name in failed_list})
+        manager.set_statuses(statuses)
+        # 清除pick_now标记（无论是否在下载列表中）
+        manager.clear_picks()
+        manager.export_csv(csv_file)
         
         print(f"CSV文件状态已更新: 成功 {len(success_list)} 个, 失败 {len(failed_list)} 个")
         
@@ -493,27 +516,32 @@ def update_csv_after_download(video_list: List[str], success_list: List[str], fa
 
 
 def get_failed_videos_from_csv(csv_file: str) -> List[str]:
-    """从CSV文件中获取状态为"下载异常"的视频列表"""
-    failed_videos = []
-    try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('status', '').strip() == '下载异常':
-                    failed_videos.append(row['video_name'])
-    except FileNotFoundError:
+    """获取状态为"下载异常"的视频列表"""
+    manager = get_download_status_manager(csv_file)
+    if manager.is_empty() and not os.path.exists(csv_file):
         print(f"错误: 找不到CSV文件 {csv_file}")
-    except Exception as e:
-        print(f"读取CSV文件时出错: {str(e)}")
-    
-    return failed_videos
+        return []
+    return manager.get_by_status(STATUS_FAILED)
     
-def download_videos_batch(video_list: List[str], cache_dir: str, description: str) -> tuple[List[str], List[str]]:
-    """批量下载视频，返回成功和失败的视频列表"""
+def download_videos_batch(video_list: List[str], cache_dir: str, description: str,
+                          workers: int = None) -> tuple[List[str], List[str]]:
+    """批量下载视频，返回成功和失败的视频列表（workers > 1 时并行下载）"""
     if not video_list:
         print(f"没有需要下载的{description}")
         return [], []
     
+    workers = DOWNLOAD_BATCH_WORKERS if workers is None else workers
+    try:
+        if workers > 1 and len(video_list) > 1:
+            return download_videos_parallel(video_list, cache_dir, description, workers)
+        return download_videos_sequential(video_list, cache_dir, description)
+    finally:
+        # 状态在下载过程中逐条写入存储，批次结束后一次性导出CSV视图
+        export_download_status("./video_download_status.csv")
+
+
+def download_videos_sequential(video_list: List[str], cache_dir: str, description: str) -> tuple[List[str], List[str]]:
+    """逐个下载视频，返回成功和失败的视频列表"""
     print(f"\n开始下载{description} (共{len(video_list)}个)...")
     print("="*50)
     
@@ -556,8 +584,8 @@ def download_videos_batch(video_list: List[str], cache_dir: str, description: st
                         print(f"跳过 {video_name} (已存在)")
                         # 已存在且完整的视频标记为成功状态
                         success_list.append(video_name)
-                        # 立即更新CSV状态
-                        update_single_video_status(video_name, '✓', csv_file)
+                        # 立即更新下载状态
+                        update_single_video_status(video_name, STATUS_OK, csv_file, attempt=False)
                         continue
                     else:
                         print(f"重新下载 {video_name} (文件不完整)")
@@ -568,15 +596,20 @@ def download_videos_batch(video_list: List[str], cache_dir: str, description: st
                             pass
                 
                 # 下载视频
+                download_started = time.time()
                 if download_single_video(video_name, cache_dir):
                     success_list.append(video_name)
-                    # 立即更新CSV状态为成功
-                    update_single_video_status(video_name, '✓', csv_file)
+                    # 立即更新下载状态为成功
+                    update_single_video_status(video_name, STATUS_OK, csv_file,
+                                               bytes_downloaded=_dir_size(os.path.join(cache_dir, video_name)),
+                                               duration=time.time() - download_started)
                     print(f"✓ {video_name} 已更新状态")
                 else:
                     failed_list.append(video_name)
-                    # 立即更新CSV状态为异常
-                    update_single_video_status(video_name, '下载异常', csv_file)
+                    # 立即更新下载状态为异常
+                    update_single_video_status(video_name, STATUS_FAILED, csv_file,
+                                               duration=time.time() - download_started,
+                                               error=_download_errors.pop(video_name, None))
                     
             except KeyboardInterrupt:
                 # 处理Ctrl+C中断
@@ -585,7 +618,7 @@ def download_videos_batch(video_list: List[str], cache_dir: str, description: st
                 
                 # 将当前正在下载的视频标记为异常
                 failed_list.append(video_name)
-                update_single_video_status(video_name, '下载异常', csv_file)
+                update_single_video_status(video_name, STATUS_FAILED, csv_file, error="用户中断")
                 
                 # 清理可能的不完整文件
                 video_folder = os.path.join(cache_dir, video_name)
@@ -603,7 +636,7 @@ def download_videos_batch(video_list: List[str], cache_dir: str, description: st
                 # 处理其他异常
                 print(f"下载 {video_name} 时发生异常: {e}")
                 failed_list.append(video_name)
-                update_single_video_status(video_name, '下载异常', csv_file)
+                update_single_video_status(video_name, STATUS_FAILED, csv_file, error=str(e)[:500])
         
     except KeyboardInterrupt:
         print(f"\n\n下载被用户中断")
@@ -624,6 +657,175 @@ def download_videos_batch(video_list: List[str], cache_dir: str, description: st
     return success_list, failed_list
 
 
+def _ignore_sigint():
+    """下载进程忽略SIGINT，Ctrl+C只由主进程处理，再统一终止下载进程"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _download_worker(video_name: str, cache_dir: str, work_root: str) -> tuple:
+    """在下载进程中执行，返回 (video_name, 是否成功, 错误信息)；faststart封装由主进程完成"""
+    success = download_single_video(video_name, cache_dir, work_root, faststart=False)
+    return video_name, success, _download_errors.pop(video_name, None)
+
+
+def download_videos_parallel(video_list: List[str], cache_dir: str, description: str,
+                             workers: int = DOWNLOAD_BATCH_WORKERS,
+                             source_limits: Dict[str, int] = None) -> tuple[List[str], List[str]]:
+    """
+    并行批量下载视频，返回成功和失败的视频列表
+    
+    - 总并发数为workers，每种数据源（get_video_type）的并发数不超过source_limits
+    - 按文件大小从大到小调度，避免最大的文件最后才开始拖长总耗时
+    - 每个视频在独立的下载进程中下载到本次运行的临时目录，校验通过后才移动到缓存目录
+    - 主进程负责调度、更新下载状态与显示汇总进度/吞吐量；Ctrl+C时终止所有下载进程
+      （hf_hub_download无法在线程中中断），删除本次运行的临时目录，进行中的视频标记为下载异常
+    - 下载完成的视频由主进程的单个线程做faststart封装：下载进程各有一份封装记录，
+      并发写同一个记录文件会互相覆盖
+    """
+    source_limits = {**DOWNLOAD_SOURCE_LIMITS, **(source_limits or {})}
+    csv_file = "./video_download_status.csv"
+    
+    print(f"\n开始并行下载{description} (共{len(video_list)}个, 并发{workers})...")
+    print("="*50)
+    
+    success_list = []
+    failed_list = []
+    
+    # 已存在且完整的视频直接标记为成功，不完整的删除后重新下载
+    existing = check_local_videos(video_list, cache_dir)
+    pending = []
+    for video_name in video_list:
+        if existing[video_name]:
+            print(f"跳过 {video_name} (已存在)")
+            success_list.append(video_name)
+            update_single_video_status(video_name, STATUS_OK, csv_file, attempt=False)
+            continue
+        video_folder = os.path.join(cache_dir, video_name)
+        if os.path.exists(video_folder):
+            print(f"重新下载 {video_name} (文件不完整)")
+            shutil.rmtree(video_folder, ignore_errors=True)
+        pending.append(video_name)
+    
+    if not pending:
+        return success_list, failed_list
+    
+    print(f"正在查询 {len(pending)} 个视频的文件大小...")
+    sizes = get_remote_file_sizes(pending)
+    pending.sort(key=lambda name: sizes.get(name, 0), reverse=True)
+    total_bytes = sum(sizes.values())
+    
+    # 本次运行独占的临时目录：与缓存目录同级（同一文件系统，完成后可原子移动），
+    # 不放在缓存目录内，避免被视频目录扫描当作视频源
+    cache_parent, cache_name = os.path.split(os.path.abspath(cache_dir))
+    work_root = os.path.join(cache_parent, f".{cache_name}_downloading", uuid.uuid4().hex[:12])
+    os.makedirs(work_root, exist_ok=True)
+    
+    results = queue.Queue()
+    running = {}  # video_name -> 开始时间
+    running_by_type = {}
+    done_bytes = 0
+    started = time.time()
+    last_report = started
+    pool = multiprocessing.Pool(processes=workers, initializer=_ignore_sigint)
+    faststart_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='faststart')
+    
+    def schedule():
+        # 按大小顺序取第一个所属数据源还有空闲并发的视频
+        while len(running) < workers:
+            for video_name in pending:
+                video_type = get_video_type(video_name)
+                if running_by_type.get(video_type, 0) < max(1, source_limits.get(video_type, workers)):
+                    break
+            else:
+                return
+            pending.remove(video_name)
+            running[video_name] = time.time()
+            running_by_type[video_type] = running_by_type.get(video_type, 0) + 1
+            pool.apply_async(
+                _download_worker, (video_name, cache_dir, work_root),
+                callback=results.put,
+                error_callback=lambda e, name=video_name: results.put((name, False, str(e)[:500]))
+            )
+    
+    def report():
+        # 已完成的按文件大小计，进行中的按临时目录中已写入的字节数计
+        in_flight_bytes = sum(_dir_size(os.path.join(work_root, name)) for name in running)
+        transferred = done_bytes + in_flight_bytes
+        elapsed = max(time.time() - started, 1e-6)
+        rate = transferred / elapsed
+        eta = f"{(total_bytes - transferred) / rate / 60:.1f}分钟" if rate > 0 and total_bytes > transferred else "-"
+        finished = len(success_list) + len(failed_list)
+        print(f"[进度] {finished}/{len(video_list)} 完成, {len(running)} 个下载中, {len(pending)} 个排队 | "
+              f"{format_size(transferred)}/{format_size(total_bytes)} | {format_size(rate)}/s | 预计剩余 {eta}")
+    
+    try:
+        schedule()
+        while running:
+            try:
+                video_name, success, error = results.get(timeout=1)
+            except queue.Empty:
+                if time.time() - last_report >= DOWNLOAD_PROGRESS_INTERVAL:
+                    report()
+                    last_report = time.time()
+                continue
+            
+            duration = time.time() - running.pop(video_name)
+            video_type = get_video_type(video_name)
+            running_by_type[video_type] -= 1
+            if success:
+                success_list.append(video_name)
+                done_bytes += sizes.get(video_name, 0)
+                update_single_video_status(video_name, STATUS_OK, csv_file,
+                                           bytes_downloaded=sizes.get(video_name) or None, duration=duration)
+                faststart_executor.submit(
+                    video_faststart_manager.process_paths,
+                    video_faststart_manager.collect_video_files(os.path.join(cache_dir, video_name))
+                )
+            else:
+                failed_list.append(video_name)
+                update_single_video_status(video_name, STATUS_FAILED, csv_file, duration=duration, error=error)
+            report()
+            last_report = time.time()
+            schedule()
+        
+        # 等待剩余的faststart封装完成
+        faststart_executor.shutdown(wait=True)
+    
+    except KeyboardInterrupt:
+        print(f"\n\n用户中断下载！停止调度剩余的 {len(pending)} 个视频，正在终止 {len(running)} 个下载进程...")
+        for video_name in list(running):
+            print(f"正在处理中断的视频: {video_name}")
+            failed_list.append(video_name)
+            update_single_video_status(video_name, STATUS_FAILED, csv_file, error="用户中断")
+        print(f"已处理: 成功 {len(success_list)} 个, 失败 {len(failed_list)} 个")
+        return success_list, failed_list
+    
+    finally:
+        # 终止并等待下载进程全部退出后再删除临时目录，之后不会有进程再写入本次运行的任何目录
+        # （正常结束时所有任务都已返回，这里只是回收空闲进程）
+        pool.terminate()
+        pool.join()
+        faststart_executor.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(work_root, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(work_root))
+        except OSError:
+            pass  # 其他运行仍在使用
+    
+    elapsed = time.time() - started
+    print("\n" + "="*50)
+    print(f"{description}下载完成，耗时 {elapsed / 60:.1f} 分钟，平均 {format_size(done_bytes / max(elapsed, 1e-6))}/s")
+    print(f"成功: {len(success_list)}个")
+    print(f"失败: {len(failed_list)}个")
+    
+    if failed_list:
+        print("\n失败的视频:")
+        for video in failed_list:
+            print(f"  - {video}")
+    
+    return success_list, failed_list
+
+
 def download_failed_videos(cache_dir: str, csv_file: str):
     """重新下载之前失败的视频"""
     # 读取失败的视频列表
@@ -652,27 +854,14 @@ def download_failed_videos(cache_dir: str, csv_file: str):
 
 
 def clear_pick_now_marks(csv_file: str) -> None:
-    """清除CSV文件中所有的pick_now标记"""
+    """清除所有的pick_now标记并导出CSV文件"""
     if not os.path.exists(csv_file):
         return
     
     try:
-        # 读取现有CSV数据
-        rows = []
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                row['pick_now'] = ''  # 清除pick_now标记
-                rows.append(row)
-        
-        # 写回CSV文件
-        with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-            if rows:
-                fieldnames = ['video_name', 'status', 'pick_now']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(rows)
-        
+        manager = get_download_status_manager(csv_file)
+        manager.clear_picks()
+        manager.export_csv(csv_file)
     except Exception as e:
         print(f"警告: 清除pick_now标记时出错: {e}")
 
@@ -738,6 +927,19 @@ def download_all_missing_videos(missing_videos: List[str], cache_dir: str, csv_f
     print(f"\n下载完成: 成功 {len(success_list)} 个, 失败 {len(failed_list)} 个")
 
 
+def remux_existing_videos(cache_dir: str) -> None:
+    """把缓存目录中已下载的非faststart MP4重新封装（已处理过且未变化的文件跳过）"""
+    video_files = video_faststart_manager.collect_video_files(cache_dir)
+    print(f"\n开始检查 {len(video_files)} 个视频文件的faststart布局...")
+    counts = video_faststart_manager.process_paths(video_files)
+    print("="*50)
+    print(f"原本即为faststart: {counts.get('faststart', 0)}")
+    print(f"已重新封装: {counts.get('remuxed', 0)}")
+    print(f"封装失败: {counts.get('failed', 0)}")
+    if counts.get('unavailable'):
+        print(f"需要封装但未安装ffmpeg: {counts['unavailable']}")
+
+
 def main():
     """主函数"""
     # 配置路径
@@ -754,9 +956,10 @@ def main():
         print("="*50)
         print("1. 统计本地视频信息")
         print("2. 下载视频")
+        print("3. 整理视频为快速启动(faststart)布局")
         print("0. 退出")
         
-        choice = input("请输入选择 (0/1/2): ").strip()
+        choice = input("请输入选择 (0/1/2/3): ").strip()
         
         if choice == "0":
             print("退出程序")
@@ -789,6 +992,8 @@ def main():
                     download_failed_videos(cache_dir, output_csv)
                 else:
                     print("无效选择，请重新输入")
+        elif choice == "3":
+            remux_existing_videos(cache_dir)
         else:
             print("无效选择，请重新输入")
 
@@ -7,6 +7,8 @@
 
 import json
 import os
+import threading
+import time
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from .video_path_manager import video_path_manager
@@ -14,32 +16,153 @@ from .video_path_manager import video_path_manager
 class CandidateQAManager:
     """候选QA数据管理器，用于处理test_qacandidate_v1.json文件"""
     
-    def __init__(self, input_file_path: str = 'test_qacandidate_v1.json'):
+    def __init__(self, input_file_path: str = 'test_qacandidate_v1.json', journal_enabled: bool = None):
         self.input_file_path = input_file_path
         # 始终保存到选择的文件，不再区分输入和输出
         self.output_file_path = input_file_path
-        self.qa_data = self.load_qa_data()
         self.auto_save_enabled = True
+        
+        # 编辑日志（journal）：每次修改追加一行JSON到旁路日志，只在压缩时重写完整快照
+        if journal_enabled is None:
+            journal_enabled = os.environ.get('CANDIDATE_QA_JOURNAL', 'true').lower() == 'true'
+        self.journal_enabled = journal_enabled
+        self.journal_file_path = f"{self.output_file_path}.journal"
+        # 压缩阈值：日志条数、日志字节数、距上次压缩的秒数，任一达到即重写快照
+        self.compact_max_entries = int(os.environ.get('CANDIDATE_QA_COMPACT_ENTRIES', 1000))
+        self.compact_max_bytes = int(os.environ.get('CANDIDATE_QA_COMPACT_BYTES', 4 * 1024 * 1024))
+        self.compact_max_age = float(os.environ.get('CANDIDATE_QA_COMPACT_AGE', 600))
+        self._journal_entries = 0
+        self._journal_bytes = 0
+        self._last_compact_time = time.time()
+        self._unjournaled_changes = False
+        self._lock = threading.RLock()
+        
+        self._needs_compaction = False
+        self.qa_data = self.load_qa_data()
+        if self._needs_compaction:
+            self.save_qa_data()
     
     def _get_output_file_path(self, input_file_path: str) -> str:
         """保持与输入文件相同路径（统一单文件工作流）"""
         return input_file_path
     
     def load_qa_data(self) -> Dict:
-        """从输入文件加载QA数据"""
+        """从输入文件加载QA数据（快照 + 编辑日志重放）"""
         try:
+            data = {}
             if os.path.exists(self.input_file_path):
                 with open(self.input_file_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                 print(f"成功加载候选QA数据: {len(data)} 个segments")
                 print(f"输入文件: {self.input_file_path}")
                 print(f"输出文件: {self.output_file_path}")
-                return data
-            return {}
+            
+            # 上次压缩中途崩溃：日志已改名但快照未替换（.tmp仍在），需要先重放改名后的日志
+            compacting_path = f"{self.journal_file_path}.compacting"
+            tmp_path = f"{self.output_file_path}.tmp"
+            if os.path.exists(compacting_path):
+                if os.path.exists(tmp_path):
+                    self._replay_journal(data, compacting_path)
+                    os.remove(tmp_path)
+                else:
+                    # 快照已替换，改名后的日志已包含在快照中
+                    os.remove(compacting_path)
+                self._needs_compaction = True
+            
+            if os.path.exists(self.journal_file_path):
+                self._journal_entries = self._replay_journal(data, self.journal_file_path)
+                self._journal_bytes = os.path.getsize(self.journal_file_path)
+            return data
         except Exception as e:
             print(f"加载QA数据失败: {e}")
             return {}
     
+    def _replay_journal(self, data: Dict, journal_path: str) -> int:
+        """把编辑日志逐条应用到data上，返回成功应用的条数"""
+        applied = 0
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能只写了一半，之后的内容不可信
+                    print(f"编辑日志第 {line_no} 行不完整，停止重放: {journal_path}")
+                    break
+                try:
+                    self._apply_entry(data, entry)
+                    applied += 1
+                except Exception as e:
+                    print(f"编辑日志第 {line_no} 行重放失败: {e}")
+        print(f"已重放编辑日志: {journal_path} ({applied} 条)")
+        return applied
+    
+    def _apply_entry(self, data: Dict, entry: Dict):
+        """应用一条编辑记录（实时修改与日志重放共用，保证两者结果一致）"""
+        op = entry['op']
+        segment = data[entry['segment_id']]
+        
+        if op == 'segment_status':
+            segment['state'] = entry['state']
+            segment['last_modify'] = entry['last_modify']
+            return
+        
+        if op == 'update_qa':
+            qas = segment.get('qas', [])
+            qas[entry['qa_index']].update(entry['fields'])
+        elif op == 'add_qa':
+            if 'qas' not in segment:
+                segment['qas'] = []
+            segment['qas'].append(dict(entry['qa']))
+            segment['total_qas'] = len(segment['qas'])
+        elif op == 'delete_qa':
+            qas = segment.get('qas', [])
+            del qas[entry['qa_index']]
+            # 重新编号剩余的QA
+            for i, qa in enumerate(qas):
+                qa['qa_id'] = f"{entry['segment_id']}_qa_{i}"
+            segment['total_qas'] = len(qas)
+        else:
+            raise ValueError(f"未知的编辑操作: {op}")
+        
+        segment['sync_time'] = entry['sync_time']
+    
+    def _record(self, entry: Dict) -> bool:
+        """持久化一条已应用的编辑：追加到日志，必要时压缩为完整快照"""
+        if not self.auto_save_enabled:
+            # 自动保存关闭期间的修改不进日志，重新启用时整体写一次快照
+            self._unjournaled_changes = True
+            return True
+        
+        if not self.journal_enabled:
+            return self.save_qa_data()
+        
+        try:
+            line = json.dumps(entry, ensure_ascii=False) + '\n'
+            with open(self.journal_file_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_entries += 1
+            self._journal_bytes += len(line.encode('utf-8'))
+        except Exception as e:
+            print(f"写入编辑日志失败，改为保存完整快照: {e}")
+            return self.save_qa_data()
+        
+        if self._should_compact():
+            return self.save_qa_data()
+        return True
+    
+    def _should_compact(self) -> bool:
+        """日志是否达到压缩阈值"""
+        if self._journal_entries == 0:
+            return False
+        return (self._journal_entries >= self.compact_max_entries
+                or self._journal_bytes >= self.compact_max_bytes
+                or time.time() - self._last_compact_time >= self.compact_max_age)
+    
     def get_current_file(self) -> str:
         """获取当前输入文件路径"""
         return self.input_file_path
@@ -51,38 +174,69 @@ class CandidateQAManager:
     def update_segment_status(self, segment_id: str, new_status: str) -> bool:
         """更新segment状态"""
         try:
-            if segment_id not in self.qa_data:
-                return False
-            
-            self.qa_data[segment_id]['state'] = new_status
-            self.qa_data[segment_id]['last_modify'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            return self.save_qa_data()
+            with self._lock:
+                if segment_id not in self.qa_data:
+                    return False
+                
+                entry = {
+                    'op': 'segment_status',
+                    'segment_id': segment_id,
+                    'state': new_status,
+                    'last_modify': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
+                self._apply_entry(self.qa_data, entry)
+                return self._record(entry)
         except Exception as e:
             print(f"更新segment状态失败: {e}")
             return False
     
     def save_qa_data(self) -> bool:
-        """保存QA数据到输出文件"""
-        try:
-            # 如有目录部分则确保存在；若无目录则直接写到当前工作目录
-            dir_path = os.path.dirname(self.output_file_path)
-            if dir_path:
-                os.makedirs(dir_path, exist_ok=True)
-            
-            with open(self.output_file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.qa_data, f, ensure_ascii=False, indent=2)
-            print(f"QA数据已保存到: {self.output_file_path}")
-            return True
-        except Exception as e:
-            print(f"保存QA数据失败: {e}")
-            return False
+        """保存完整快照到输出文件，并清空编辑日志（压缩）"""
+        with self._lock:
+            try:
+                # 如有目录部分则确保存在；若无目录则直接写到当前工作目录
+                dir_path = os.path.dirname(self.output_file_path)
+                if dir_path:
+                    os.makedirs(dir_path, exist_ok=True)
+                
+                tmp_path = f"{self.output_file_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.qa_data, f, ensure_ascii=False, indent=2)
+                
+                # 先把日志改名再替换快照，崩溃后可根据.tmp是否还在判断快照是否已替换
+                compacting_path = f"{self.journal_file_path}.compacting"
+                if os.path.exists(self.journal_file_path):
+                    os.replace(self.journal_file_path, compacting_path)
+                os.replace(tmp_path, self.output_file_path)
+                if os.path.exists(compacting_path):
+                    os.remove(compacting_path)
+                
+                self._journal_entries = 0
+                self._journal_bytes = 0
+                self._last_compact_time = time.time()
+                self._unjournaled_changes = False
+                print(f"QA数据已保存到: {self.output_file_path}")
+                return True
+            except Exception as e:
+                print(f"保存QA数据失败: {e}")
+                return False
     
     def auto_save(self):
         """自动保存（如果启用）"""
         if self.auto_save_enabled:
             self.save_qa_data()
     
+    def get_journal_status(self) -> Dict:
+        """获取编辑日志状态"""
+        with self._lock:
+            return {
+                'journal_enabled': self.journal_enabled,
+                'journal_file': self.journal_file_path,
+                'journal_entries': self._journal_entries,
+                'journal_bytes': self._journal_bytes,
+                'seconds_since_compaction': round(time.time() - self._last_compact_time, 1)
+            }
+    
     def get_all_segments(self) -> List[Dict]:
         """获取所有segment信息"""
         segments = []
@@ -134,24 +288,33 @@ class CandidateQAManager:
             segment_id = parts[0]
             qa_index = int(parts[1])
             
-            if segment_id not in self.qa_data:
-                return False
-            
-            qas = self.qa_data[segment_id].get('qas', [])
-            if qa_index >= len(qas):
-                return False
-            
-            # 更新QA数据（过滤掉不应该保存的字段）
-            excluded_fields = {'video_path'}  # 不应该保存到JSON文件中的字段
-            for key, value in updated_data.items():
-                if key not in excluded_fields:
-                    qas[qa_index][key] = value
-            
-            # 更新sync_time
-            self.qa_data[segment_id]['sync_time'] = datetime.now().isoformat() + 'Z'
-            
-            # 自动保存
-            self.auto_save()
+            with self._lock:
+                if segment_id not in self.qa_data:
+                    return False
+                
+                qas = self.qa_data[segment_id].get('qas', [])
+                if qa_index >= len(qas):
+                    return False
+                
+                # 只记录实际变化的字段（过滤掉不应该保存的字段）
+                excluded_fields = {'video_path'}  # 不应该保存到JSON文件中的字段
+                current_qa = qas[qa_index]
+                fields = {
+                    key: value for key, value in updated_data.items()
+                    if key not in excluded_fields and (key not in current_qa or current_qa[key] != value)
+                }
+                
+                entry = {
+                    'op': 'update_qa',
+                    'segment_id': segment_id,
+                    'qa_index': qa_index,
+                    'fields': fields,
+                    'sync_time': datetime.now().isoformat() + 'Z'
+                }
+                self._apply_entry(self.qa_data, entry)
+                
+                # 自动保存（追加编辑日志）
+                self._record(entry)
             
             return True
         except Exception as e:
@@ -161,32 +324,30 @@ class CandidateQAManager:
     def add_qa(self, segment_id: str, qa_data: Dict) -> bool:
         """添加新的QA并自动保存"""
         try:
-            if segment_id not in self.qa_data:
-                return False
-            
-            if 'qas' not in self.qa_data[segment_id]:
-                self.qa_data[segment_id]['qas'] = []
-            
-            # 生成qa_id
-            qa_count = len(self.qa_data[segment_id]['qas'])
-            qa_data['qa_id'] = f"{segment_id}_qa_{qa_count}"
-            qa_data['segment_id'] = segment_id
-            
-            # 过滤掉不应该保存的字段
-            excluded_fields = {'video_path'}  # 不应该保存到JSON文件中的字段
-            filtered_qa_data = {k: v for k, v in qa_data.items() if k not in excluded_fields}
-            
-            # 添加QA
-            self.qa_data[segment_id]['qas'].append(filtered_qa_data)
-            
-            # 更新total_qas
-            self.qa_data[segment_id]['total_qas'] = len(self.qa_data[segment_id]['qas'])
-            
-            # 更新sync_time
-            self.qa_data[segment_id]['sync_time'] = datetime.now().isoformat() + 'Z'
-            
-            # 自动保存
-            self.auto_save()
+            with self._lock:
+                if segment_id not in self.qa_data:
+                    return False
+                
+                # 生成qa_id
+                qa_count = len(self.qa_data[segment_id].get('qas', []))
+                qa_data['qa_id'] = f"{segment_id}_qa_{qa_count}"
+                qa_data['segment_id'] = segment_id
+                
+                # 过滤掉不应该保存的字段
+                excluded_fields = {'video_path'}  # 不应该保存到JSON文件中的字段
+                filtered_qa_data = {k: v for k, v in qa_data.items() if k not in excluded_fields}
+                
+                # 添加QA（同时更新total_qas和sync_time）
+                entry = {
+                    'op': 'add_qa',
+                    'segment_id': segment_id,
+                    'qa': filtered_qa_data,
+                    'sync_time': datetime.now().isoformat() + 'Z'
+                }
+                self._apply_entry(self.qa_data, entry)
+                
+                # 自动保存（追加编辑日志）
+                self._record(entry)
             
             return True
         except Exception as e:
@@ -204,28 +365,25 @@ class CandidateQAManager:
             segment_id = parts[0]
             qa_index = int(parts[1])
             
-            if segment_id not in self.qa_data:
-                return False
-            
-            qas = self.qa_data[segment_id].get('qas', [])
-            if qa_index >= len(qas):
-                return False
-            
-            # 删除QA
-            del qas[qa_index]
-            
-            # 重新编号剩余的QA
-            for i, qa in enumerate(qas):
-                qa['qa_id'] = f"{segment_id}_qa_{i}"
-            
-            # 更新total_qas
-            self.qa_data[segment_id]['total_qas'] = len(qas)
-            
-            # 更新sync_time
-            self.qa_data[segment_id]['sync_time'] = datetime.now().isoformat() + 'Z'
-            
-            # 自动保存
-            self.auto_save()
+            with self._lock:
+                if segment_id not in self.qa_data:
+                    return False
+                
+                qas = self.qa_data[segment_id].get('qas', [])
+                if qa_index >= len(qas):
+                    return False
+                
+                # 删除QA（同时重新编号剩余QA、更新total_qas和sync_time）
+                entry = {
+                    'op': 'delete_qa',
+                    'segment_id': segment_id,
+                    'qa_index': qa_index,
+                    'sync_time': datetime.now().isoformat() + 'Z'
+                }
+                self._apply_entry(self.qa_data, entry)
+                
+                # 自动保存（追加编辑日志）
+                self._record(entry)
             
             return True
         except Exception as e:
@@ -287,9 +445,13 @@ class CandidateQAManager:
         """启用或禁用自动保存"""
         self.auto_save_enabled = enabled
         print(f"自动保存已{'启用' if enabled else '禁用'}")
+        
+        # 禁用期间的修改没有写入日志，重新启用时保存一次完整快照
+        if enabled and self._unjournaled_changes:
+            self.save_qa_data()
     
     def export_final_results(self) -> bool:
-        """导出最终结果（强制保存）"""
+        """导出最终结果（强制保存完整快照并压缩编辑日志）"""
         return self.save_qa_data()
 
 # 全局候选QA管理器实例
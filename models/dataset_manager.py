@@ -3,6 +3,11 @@ import os
 from typing import List, Dict, Optional
 from datetime import datetime
 
+# 片段状态 -> 统计字段
+SEGMENT_STATUS_KEYS = {'选用': 'selected', '待抉择': 'pending', '弃用': 'rejected'}
+# 统计时忽略的测试数据集
+STATISTICS_IGNORED_DATASET = 'test_dataset'
+
 class DatasetManager:
     """数据集管理器，负责处理数据集、样本和片段"""
     
@@ -10,7 +15,146 @@ class DatasetManager:
         self.data_dir = data_dir
         self.datasets = {}
         self.segments = {}
+        # 索引：sample_id -> (dataset_id, sample)，segment_id -> (dataset_id, 下标)，sample_id -> [segment]
+        self.sample_index = {}
+        self.segment_index = {}
+        self.sample_segments = {}
+        self._duplicate_segment_ids = set()
         self._load_datasets()
+        self._build_indexes()
+        # 增量统计计数器：加载时全量计算一次，之后随每次修改增量更新
+        self._sample_stats = {}
+        self._segment_stats = {}
+        self._segment_totals = {}
+        self._recompute_statistics()
+    
+    def _build_indexes(self):
+        """建立样本和片段索引（重复id以第一次出现的为准，与原先的遍历顺序一致）"""
+        self.sample_index = {}
+        for dataset_id, dataset in self.datasets.items():
+            for sample in dataset.get('samples', []):
+                sample_id = sample.get('id')
+                if sample_id not in self.sample_index:
+                    self.sample_index[sample_id] = (dataset_id, sample)
+        self._build_segment_indexes()
+    
+    def _build_segment_indexes(self):
+        """建立片段位置索引和样本->片段索引"""
+        self.segment_index = {}
+        self.sample_segments = {}
+        self._duplicate_segment_ids = set()
+        for dataset_id, dataset_segments in self.segments.items():
+            for i, segment in enumerate(dataset_segments.get('segments', [])):
+                self._index_segment(dataset_id, i, segment)
+    
+    def _index_segment(self, dataset_id: str, position: int, segment: Dict):
+        """登记一个片段"""
+        segment_id = segment.get('id')
+        if segment_id in self.segment_index:
+            self._duplicate_segment_ids.add(segment_id)
+        else:
+            self.segment_index[segment_id] = (dataset_id, position)
+        self.sample_segments.setdefault(segment.get('sample_id'), []).append(segment)
+    
+    @staticmethod
+    def _empty_length_status() -> Dict:
+        """按长度和状态统计片段的空计数表"""
+        return {
+            'short': {'selected': 0, 'pending': 0, 'rejected': 0},      # ≤5秒
+            'medium': {'selected': 0, 'pending': 0, 'rejected': 0},     # (5-13秒]
+            'long': {'selected': 0, 'pending': 0, 'rejected': 0},       # (13-30秒]
+            'extraLong': {'selected': 0, 'pending': 0, 'rejected': 0},  # >30秒
+            'all': {'selected': 0, 'pending': 0, 'rejected': 0}         # 所有长度
+        }
+    
+    def _recompute_statistics(self):
+        """全量重新计算统计计数器（仅在加载时调用）"""
+        self._sample_stats = {}
+        self._segment_stats = {None: self._empty_length_status()}
+        self._segment_totals = {None: {'selected': 0, 'pending': 0, 'rejected': 0}}
+        
+        for dataset_id, dataset in self.datasets.items():
+            if dataset_id == STATISTICS_IGNORED_DATASET:
+                continue
+            self._sample_stats[dataset_id] = {}
+            for sample in dataset.get('samples', []):
+                self._apply_sample_stats(dataset_id, sample, 1)
+        
+        for dataset_id, dataset_segments in self.segments.items():
+            for segment in dataset_segments.get('segments', []):
+                self._apply_segment_stats(dataset_id, segment, 1)
+    
+    def _apply_sample_stats(self, dataset_id: str, sample: Dict, delta: int):
+        """把一个样本的审阅/异常状态计入(delta=1)或移出(delta=-1)统计"""
+        if dataset_id == STATISTICS_IGNORED_DATASET:
+            return
+        counters = self._sample_stats.setdefault(dataset_id, {}).setdefault(
+            sample.get('assigned_to'), {'reviewed': 0, 'unreviewed': 0, 'exception': 0}
+        )
+        review_status = sample.get('review_status')
+        if review_status == '已审阅':
+            counters['reviewed'] += delta
+        elif review_status == '未审阅':
+            counters['unreviewed'] += delta
+        if sample.get('exception_status', {}).get('is_exception', False):
+            counters['exception'] += delta
+    
+    def _segment_annotator(self, segment: Dict) -> Optional[str]:
+        """片段所属样本的标注者（样本不存在或属于测试数据集时返回None）"""
+        dataset_id, sample = self._find_sample(segment.get('sample_id'))
+        if sample is None or dataset_id == STATISTICS_IGNORED_DATASET:
+            return None
+        return sample.get('assigned_to')
+    
+    def _apply_segment_stats(self, dataset_id: str, segment: Dict, delta: int):
+        """把一个片段的状态×时长计入(delta=1)或移出(delta=-1)统计"""
+        if dataset_id == STATISTICS_IGNORED_DATASET:
+            return
+        # 与原有统计口径一致：按长度统计时没有status字段的片段计为待抉择，
+        # segments下的选用/待抉择/弃用总数只统计明确设置了状态的片段
+        status_key = SEGMENT_STATUS_KEYS.get(segment.get('status', '待抉择'))
+        total_key = SEGMENT_STATUS_KEYS.get(segment.get('status'))
+        if status_key is None and total_key is None:
+            return
+        
+        try:
+            duration = segment.get('end_time', 0) - segment.get('start_time', 0)
+        except TypeError:
+            duration = 0
+        if duration <= 5:
+            bucket = 'short'
+        elif duration <= 13:
+            bucket = 'medium'
+        elif duration <= 30:
+            bucket = 'long'
+        else:
+            bucket = 'extraLong'
+        
+        # None键为所有标注者的汇总，另外按片段所属标注者分别计数
+        keys = [None]
+        annotator = self._segment_annotator(segment)
+        if annotator is not None:
+            keys.append(annotator)
+        for key in keys:
+            if status_key is not None:
+                length_status = self._segment_stats.setdefault(key, self._empty_length_status())
+                length_status['all'][status_key] += delta
+                length_status[bucket][status_key] += delta
+            if total_key is not None:
+                totals = self._segment_totals.setdefault(key, {'selected': 0, 'pending': 0, 'rejected': 0})
+                totals[total_key] += delta
+    
+    def _find_sample(self, sample_id: str):
+        """根据sample_id返回(dataset_id, sample)，找不到返回(None, None)"""
+        return self.sample_index.get(sample_id, (None, None))
+    
+    def _find_segment(self, segment_id: str):
+        """根据segment_id返回(dataset_id, 下标, segment)，找不到返回(None, None, None)"""
+        location = self.segment_index.get(segment_id)
+        if location is None:
+            return None, None, None
+        dataset_id, position = location
+        return dataset_id, position, self.segments[dataset_id]['segments'][position]
     
     def _load_datasets(self):
         """加载所有数据集"""
@@ -290,13 +434,7 @@ class DatasetManager:
     
     def get_segments_for_sample(self, sample_id: str) -> List[Dict]:
         """获取指定样本的片段列表"""
-        result = []
-        for dataset_segments in self.segments.values():
-            sample_segments = [
-                s for s in dataset_segments.get('segments', [])
-                if s.get('sample_id') == sample_id
-            ]
-            result.extend(sample_segments)
+        result = list(self.sample_segments.get(sample_id, []))
         
         # 按状态排序
         status_order = {'待抉择': 0, '选用': 1, '弃用': 2}
@@ -312,11 +450,7 @@ class DatasetManager:
                 return False
             
             # 找到对应的数据集
-            dataset_id = None
-            for ds_id, dataset in self.datasets.items():
-                if any(s.get('id') == sample_id for s in dataset.get('samples', [])):
-                    dataset_id = ds_id
-                    break
+            dataset_id, _ = self._find_sample(sample_id)
             
             if not dataset_id:
                 return False
@@ -330,6 +464,8 @@ class DatasetManager:
             
             # 添加新片段
             self.segments[dataset_id]['segments'].append(segment_data)
+            self._index_segment(dataset_id, len(self.segments[dataset_id]['segments']) - 1, segment_data)
+            self._apply_segment_stats(dataset_id, segment_data, 1)
             
             # 保存到文件
             filepath = os.path.join(self.data_dir, f"{dataset_id}_segments.json")
@@ -344,27 +480,32 @@ class DatasetManager:
     def update_segment(self, segment_id: str, update_data: Dict) -> bool:
         """更新片段信息（状态、时间、注释等）"""
         try:
-            for dataset_id, dataset_segments in self.segments.items():
-                for segment in dataset_segments.get('segments', []):
-                    if segment.get('id') == segment_id:
-                        # 更新状态
-                        if 'status' in update_data:
-                            segment['status'] = update_data['status']
-                        # 更新时间
-                        if 'start_time' in update_data:
-                            segment['start_time'] = update_data['start_time']
-                        if 'end_time' in update_data:
-                            segment['end_time'] = update_data['end_time']
-                        # 更新注释
-                        if 'comment' in update_data:
-                            segment['comment'] = update_data['comment']
-                        
-                        # 保存到文件
-                        filepath = os.path.join(self.data_dir, f"{dataset_id}_segments.json")
-                        with open(filepath, 'w', encoding='utf-8') as f:
-                            json.dump(dataset_segments, f, ensure_ascii=False, indent=2)
-                        return True
-            return False
+            dataset_id, _, segment = self._find_segment(segment_id)
+            if segment is None:
+                return False
+            
+            # 状态和时间会影响统计，先移出旧的计数，更新后再计入
+            self._apply_segment_stats(dataset_id, segment, -1)
+            
+            # 更新状态
+            if 'status' in update_data:
+                segment['status'] = update_data['status']
+            # 更新时间
+            if 'start_time' in update_data:
+                segment['start_time'] = update_data['start_time']
+            if 'end_time' in update_data:
+                segment['end_time'] = update_data['end_time']
+            # 更新注释
+            if 'comment' in update_data:
+                segment['comment'] = update_data['comment']
+            
+            self._apply_segment_stats(dataset_id, segment, 1)
+            
+            # 保存到文件
+            filepath = os.path.join(self.data_dir, f"{dataset_id}_segments.json")
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(self.segments[dataset_id], f, ensure_ascii=False, indent=2)
+            return True
         except Exception as e:
             print(f"Error updating segment: {e}")
             return False
@@ -381,10 +522,15 @@ class DatasetManager:
             
             dataset_segments = self.segments[dataset_id]
             # 过滤掉弃用的片段
-            dataset_segments['segments'] = [
-                s for s in dataset_segments.get('segments', [])
-                if s.get('status') != '弃用'
-            ]
+            kept_segments = []
+            for segment in dataset_segments.get('segments', []):
+                if segment.get('status') != '弃用':
+                    kept_segments.append(segment)
+                else:
+                    self._apply_segment_stats(dataset_id, segment, -1)
+            dataset_segments['segments'] = kept_segments
+            # 批量删除后片段位置整体变化，重建片段索引
+            self._build_segment_indexes()
             
             # 保存到文件
             filepath = os.path.join(self.data_dir, f"{dataset_id}_segments.json")
@@ -399,18 +545,36 @@ class DatasetManager:
     def delete_segment(self, segment_id: str) -> bool:
         """删除指定片段"""
         try:
-            for dataset_id, dataset_segments in self.segments.items():
-                for i, segment in enumerate(dataset_segments.get('segments', [])):
-                    if segment.get('id') == segment_id:
-                        # 删除片段
-                        dataset_segments['segments'].pop(i)
-                        
-                        # 保存到文件
-                        filepath = os.path.join(self.data_dir, f"{dataset_id}_segments.json")
-                        with open(filepath, 'w', encoding='utf-8') as f:
-                            json.dump(dataset_segments, f, ensure_ascii=False, indent=2)
-                        return True
-            return False
+            dataset_id, position, segment = self._find_segment(segment_id)
+            if segment is None:
+                return False
+            
+            # 删除片段
+            dataset_segments = self.segments[dataset_id]
+            segments = dataset_segments['segments']
+            segments.pop(position)
+            self._apply_segment_stats(dataset_id, segment, -1)
+            
+            # 维护索引：移除该片段，其后片段的下标前移一位
+            if segment_id in self._duplicate_segment_ids:
+                # 存在同id片段时，直接重建让下一个同id片段可被访问
+                self._build_segment_indexes()
+            else:
+                del self.segment_index[segment_id]
+                for j in range(position, len(segments)):
+                    later_id = segments[j].get('id')
+                    if self.segment_index.get(later_id) == (dataset_id, j + 1):
+                        self.segment_index[later_id] = (dataset_id, j)
+                sample_id = segment.get('sample_id')
+                self.sample_segments[sample_id] = [
+                    s for s in self.sample_segments.get(sample_id, []) if s is not segment
+                ]
+            
+            # 保存到文件
+            filepath = os.path.join(self.data_dir, f"{dataset_id}_segments.json")
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(dataset_segments, f, ensure_ascii=False, indent=2)
+            return True
         except Exception as e:
             print(f"Error deleting segment: {e}")
             return False
@@ -418,18 +582,20 @@ class DatasetManager:
     def mark_sample_reviewed(self, sample_id: str) -> bool:
         """标记样本为已审阅"""
         try:
-            for dataset_id, dataset in self.datasets.items():
-                for sample in dataset.get('samples', []):
-                    if sample.get('id') == sample_id:
-                        # 更新审阅状态
-                        sample['review_status'] = '已审阅'
-                        
-                        # 保存到文件
-                        filepath = os.path.join(self.data_dir, f"{dataset_id}.json")
-                        with open(filepath, 'w', encoding='utf-8') as f:
-                            json.dump(dataset, f, ensure_ascii=False, indent=2)
-                        return True
-            return False
+            dataset_id, sample = self._find_sample(sample_id)
+            if sample is None:
+                return False
+            
+            # 更新审阅状态
+            self._apply_sample_stats(dataset_id, sample, -1)
+            sample['review_status'] = '已审阅'
+            self._apply_sample_stats(dataset_id, sample, 1)
+            
+            # 保存到文件
+            filepath = os.path.join(self.data_dir, f"{dataset_id}.json")
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(self.datasets[dataset_id], f, ensure_ascii=False, indent=2)
+            return True
         except Exception as e:
             print(f"Error marking sample as reviewed: {e}")
             return False
@@ -437,18 +603,20 @@ class DatasetManager:
     def mark_sample_unreviewed(self, sample_id: str) -> bool:
         """标记样本为未审阅"""
         try:
-            for dataset_id, dataset in self.datasets.items():
-                for sample in dataset.get('samples', []):
-                    if sample.get('id') == sample_id:
-                        # 更新审阅状态
-                        sample['review_status'] = '未审阅'
-                        
-                        # 保存到文件
-                        filepath = os.path.join(self.data_dir, f"{dataset_id}.json")
-                        with open(filepath, 'w', encoding='utf-8') as f:
-                            json.dump(dataset, f, ensure_ascii=False, indent=2)
-                        return True
-            return False
+            dataset_id, sample = self._find_sample(sample_id)
+            if sample is None:
+                return False
+            
+            # 更新审阅状态
+            self._apply_sample_stats(dataset_id, sample, -1)
+            sample['review_status'] = '未审阅'
+            self._apply_sample_stats(dataset_id, sample, 1)
+            
+            # 保存到文件
+            filepath = os.path.join(self.data_dir, f"{dataset_id}.json")
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(self.datasets[dataset_id], f, ensure_ascii=False, indent=2)
+            return True
         except Exception as e:
             print(f"Error marking sample as unreviewed: {e}")
             return False
@@ -461,27 +629,29 @@ class DatasetManager:
     def set_sample_exception_status(self, sample_id: str, is_exception: bool, reason: str = "") -> bool:
         """设置样本的异常状态（独立于审阅状态）"""
         try:
-            for dataset_id, dataset in self.datasets.items():
-                for sample in dataset.get('samples', []):
-                    if sample.get('id') == sample_id:
-                        # 设置异常状态（独立于审阅状态）
-                        if is_exception:
-                            sample['exception_status'] = {
-                                'is_exception': True,
-                                'reason': reason,
-                                'timestamp': datetime.now().isoformat()
-                            }
-                        else:
-                            # 清除异常状态
-                            if 'exception_status' in sample:
-                                del sample['exception_status']
-                        
-                        # 保存到文件
-                        filepath = os.path.join(self.data_dir, f"{dataset_id}.json")
-                        with open(filepath, 'w', encoding='utf-8') as f:
-                            json.dump(dataset, f, ensure_ascii=False, indent=2)
-                        return True
-            return False
+            dataset_id, sample = self._find_sample(sample_id)
+            if sample is None:
+                return False
+            
+            # 设置异常状态（独立于审阅状态）
+            self._apply_sample_stats(dataset_id, sample, -1)
+            if is_exception:
+                sample['exception_status'] = {
+                    'is_exception': True,
+                    'reason': reason,
+                    'timestamp': datetime.now().isoformat()
+                }
+            else:
+                # 清除异常状态
+                if 'exception_status' in sample:
+                    del sample['exception_status']
+            self._apply_sample_stats(dataset_id, sample, 1)
+            
+            # 保存到文件
+            filepath = os.path.join(self.data_dir, f"{dataset_id}.json")
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(self.datasets[dataset_id], f, ensure_ascii=False, indent=2)
+            return True
         except Exception as e:
             print(f"Error setting sample exception status: {e}")
             return False
@@ -489,17 +659,16 @@ class DatasetManager:
     def get_sample_exception_status(self, sample_id: str) -> Optional[Dict]:
         """获取样本的异常状态"""
         try:
-            for dataset_id, dataset in self.datasets.items():
-                for sample in dataset.get('samples', []):
-                    if sample.get('id') == sample_id:
-                        return sample.get('exception_status')
-            return None
+            _, sample = self._find_sample(sample_id)
+            if sample is None:
+                return None
+            return sample.get('exception_status')
         except Exception as e:
             print(f"Error getting sample exception status: {e}")
             return None
     
     def get_statistics(self, annotator: str = 'all') -> Dict:
-        """获取标注统计信息"""
+        """获取标注统计信息（读取增量维护的计数器）"""
         try:
             statistics = {
                 'datasets': {},
@@ -507,126 +676,37 @@ class DatasetManager:
                 'totalSelected': 0
             }
             
-            # 统计数据集级别的信息
-            for dataset_id, dataset in self.datasets.items():
-                # 忽略test_dataset
-                if dataset_id == 'test_dataset':
-                    continue
-                    
-                samples = dataset.get('samples', [])
-                
-                # 过滤指定标注者的样本
-                if annotator and annotator != 'all':
-                    samples = [s for s in samples if s.get('assigned_to') == annotator]
-                
-                # 统计审阅状态
-                reviewed = len([s for s in samples if s.get('review_status') == '已审阅'])
-                unreviewed = len([s for s in samples if s.get('review_status') == '未审阅'])
-                
-                # 统计异常状态
-                exception = len([s for s in samples if s.get('exception_status', {}).get('is_exception', False)])
-                
-                statistics['datasets'][dataset_id] = {
-                    'reviewed': reviewed,
-                    'unreviewed': unreviewed,
-                    'exception': exception
-                }
-            
-            # 统计片段级别的信息
-            all_segments = []
-            for dataset_id, dataset_segments in self.segments.items():
-                # 忽略test_dataset的片段
-                if dataset_id == 'test_dataset':
-                    continue
-                    
-                segments = dataset_segments.get('segments', [])
-                
-                # 过滤指定标注者的片段（通过sample_id关联）
-                if annotator and annotator != 'all':
-                    filtered_segments = []
-                    for segment in segments:
-                        sample_id = segment.get('sample_id')
-                        # 查找对应的样本
-                        for dataset in self.datasets.values():
-                            # 忽略test_dataset
-                            if dataset.get('id') == 'test_dataset':
-                                continue
-                            for sample in dataset.get('samples', []):
-                                if sample.get('id') == sample_id and sample.get('assigned_to') == annotator:
-                                    filtered_segments.append(segment)
-                                    break
-                    segments = filtered_segments
-                
-                all_segments.extend(segments)
-            
-            # 统计片段状态
-            selected = len([s for s in all_segments if s.get('status') == '选用'])
-            pending = len([s for s in all_segments if s.get('status') == '待抉择'])
-            rejected = len([s for s in all_segments if s.get('status') == '弃用'])
+            filter_annotator = bool(annotator and annotator != 'all')
             
-            statistics['segments'] = {
-                'selected': selected,
-                'pending': pending,
-                'rejected': rejected
-            }
+            # 统计数据集级别的信息
+            for dataset_id, per_annotator in self._sample_stats.items():
+                if filter_annotator:
+                    counters = per_annotator.get(annotator, {})
+                    statistics['datasets'][dataset_id] = {
+                        'reviewed': counters.get('reviewed', 0),
+                        'unreviewed': counters.get('unreviewed', 0),
+                        'exception': counters.get('exception', 0)
+                    }
+                else:
+                    statistics['datasets'][dataset_id] = {
+                        key: sum(c[key] for c in per_annotator.values())
+                        for key in ('reviewed', 'unreviewed', 'exception')
+                    }
             
-            # 按长度和状态统计片段
+            # 统计片段级别的信息（按长度和状态）
+            source = self._segment_stats.get(annotator if filter_annotator else None)
             length_status_stats = {
-                'short': {'selected': 0, 'pending': 0, 'rejected': 0},      # ≤5秒
-                'medium': {'selected': 0, 'pending': 0, 'rejected': 0},     # (5-13秒]
-                'long': {'selected': 0, 'pending': 0, 'rejected': 0},       # (13-30秒]
-                'extraLong': {'selected': 0, 'pending': 0, 'rejected': 0},  # >30秒
-                'all': {'selected': 0, 'pending': 0, 'rejected': 0}         # 所有长度
+                bucket: dict(counts)
+                for bucket, counts in (source or self._empty_length_status()).items()
             }
             
-            for segment in all_segments:
-                start_time = segment.get('start_time', 0)
-                end_time = segment.get('end_time', 0)
-                duration = end_time - start_time
-                status = segment.get('status', '待抉择')
-                
-                # 更新所有长度的统计
-                if status == '选用':
-                    length_status_stats['all']['selected'] += 1
-                elif status == '待抉择':
-                    length_status_stats['all']['pending'] += 1
-                elif status == '弃用':
-                    length_status_stats['all']['rejected'] += 1
-                
-                # 按长度分类统计
-                if duration <= 5:
-                    if status == '选用':
-                        length_status_stats['short']['selected'] += 1
-                    elif status == '待抉择':
-                        length_status_stats['short']['pending'] += 1
-                    elif status == '弃用':
-                        length_status_stats['short']['rejected'] += 1
-                elif duration <= 13:
-                    if status == '选用':
-                        length_status_stats['medium']['selected'] += 1
-                    elif status == '待抉择':
-                        length_status_stats['medium']['pending'] += 1
-                    elif status == '弃用':
-                        length_status_stats['medium']['rejected'] += 1
-                elif duration <= 30:
-                    if status == '选用':
-                        length_status_stats['long']['selected'] += 1
-                    elif status == '待抉择':
-                        length_status_stats['long']['pending'] += 1
-                    elif status == '弃用':
-                        length_status_stats['long']['rejected'] += 1
-                else:
-                    if status == '选用':
-                        length_status_stats['extraLong']['selected'] += 1
-                    elif status == '待抉择':
-                        length_status_stats['extraLong']['pending'] += 1
-                    elif status == '弃用':
-                        length_status_stats['extraLong']['rejected'] += 1
-            
-            # 更新统计信息
-            statistics['segments'].update({
+            totals = self._segment_totals.get(annotator if filter_annotator else None, {})
+            statistics['segments'] = {
+                'selected': totals.get('selected', 0),
+                'pending': totals.get('pending', 0),
+                'rejected': totals.get('rejected', 0),
                 'lengthStatus': length_status_stats
-            })
+            }
             
             # 总选用片段数
             statistics['totalSelected'] = length_status_stats['all']['selected']
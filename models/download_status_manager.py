@@ -0,0 +1,223 @@
+"""
+视频下载状态存储
+下载状态保存在SQLite中（按video_name一行：status、pick_now、尝试次数、字节数、耗时、最后错误），
+每次更新只写一行；video_download_status.csv 只作为导入/导出视图，
+用户在CSV的pick_now列中标记要下载的视频，下载前导入，批次结束后一次性导出
+"""
+
+import os
+import csv
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+# 与CSV视图保持一致的状态值
+STATUS_OK = '✓'
+STATUS_FAILED = '下载异常'
+
+# pick_now列中表示选中的值
+PICK_VALUES = ('x', '1', 'true', 'yes', '✓')
+
+CSV_FIELDNAMES = ['video_name', 'status', 'pick_now']
+
+
+class DownloadStatusManager:
+    """下载状态存储（SQLite，每次更新为单行事务）"""
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._initialized = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    db_dir = os.path.dirname(self.db_path)
+                    if db_dir:
+                        os.makedirs(db_dir, exist_ok=True)
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS download_status (
+                            video_name TEXT PRIMARY KEY,
+                            position INTEGER,
+                            status TEXT NOT NULL DEFAULT '',
+                            pick_now TEXT NOT NULL DEFAULT '',
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            bytes INTEGER,
+                            duration REAL,
+                            last_error TEXT,
+                            updated_at REAL
+                        )
+                    ''')
+                    conn.commit()
+                    self._initialized = True
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        """打开连接执行一个事务，正常结束提交、异常回滚，最后关闭连接"""
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def is_empty(self) -> bool:
+        with self._transaction() as conn:
+            return conn.execute('SELECT COUNT(*) FROM download_status').fetchone()[0] == 0
+    
+    def import_csv(self, csv_file: str) -> int:
+        """
+        从CSV视图导入：已有记录只更新pick_now（用户的编辑），新视频按CSV的状态插入
+        
+        Returns:
+            int: 导入的行数，CSV不存在返回0
+        """
+        if not os.path.exists(csv_file):
+            return 0
+        try:
+            with open(csv_file, 'r', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        except Exception as e:
+            print(f"读取CSV文件时出错: {str(e)}")
+            return 0
+        
+        now = time.time()
+        with self._lock, self._transaction() as conn:
+            for position, row in enumerate(rows):
+                conn.execute('''
+                    INSERT INTO download_status (video_name, position, status, pick_now, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(video_name) DO UPDATE SET pick_now = excluded.pick_now
+                ''', (row['video_name'], position, (row.get('status') or '').strip(),
+                      (row.get('pick_now') or '').strip(), now))
+        return len(rows)
+    
+    def export_csv(self, csv_file: str) -> bool:
+        """按扫描顺序原子导出CSV视图"""
+        try:
+            with self._transaction() as conn:
+                rows = conn.execute('''
+                    SELECT video_name, status, pick_now FROM download_status
+                    ORDER BY position IS NULL, position, video_name
+                ''').fetchall()
+            tmp_path = f"{csv_file}.tmp"
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(CSV_FIELDNAMES)
+                for row in rows:
+                    writer.writerow([row['video_name'], row['status'], row['pick_now']])
+            os.replace(tmp_path, csv_file)
+            return True
+        except Exception as e:
+            print(f"导出CSV文件时出错: {e}")
+            return False
+    
+    def sync_scan_results(self, results: Dict[str, bool], video_names: List[str]):
+        """
+        写入本地扫描结果：存在的标记为成功，不存在的清空状态（保留下载异常），
+        同时按video_names记录顺序并清除pick_now
+        """
+        now = time.time()
+        with self._lock, self._transaction() as conn:
+            for position, video_name in enumerate(video_names):
+                status = STATUS_OK if results[video_name] else ''
+                conn.execute('''
+                    INSERT INTO download_status (video_name, position, status, pick_now, updated_at)
+                    VALUES (?, ?, ?, '', ?)
+                    ON CONFLICT(video_name) DO UPDATE SET
+                        position = excluded.position,
+                        pick_now = '',
+                        status = CASE
+                            WHEN excluded.status = '' AND download_status.status = ? THEN download_status.status
+                            ELSE excluded.status END,
+                        updated_at = excluded.updated_at
+                ''', (video_name, position, status, now, STATUS_FAILED))
+    
+    def set_status(self, video_name: str, status: str, bytes_downloaded: Optional[int] = None,
+                   duration: Optional[float] = None, error: Optional[str] = None, attempt: bool = True):
+        """
+        更新单个视频的下载结果（单行事务）
+        
+        attempt为False表示没有实际下载（例如本地已存在），不计入尝试次数
+        """
+        with self._lock, self._transaction() as conn:
+            conn.execute('''
+                INSERT INTO download_status (video_name, status, attempts, bytes, duration, last_error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_name) DO UPDATE SET
+                    status = excluded.status,
+                    attempts = download_status.attempts + excluded.attempts,
+                    bytes = COALESCE(excluded.bytes, download_status.bytes),
+                    duration = COALESCE(excluded.duration, download_status.duration),
+                    last_error = CASE WHEN excluded.status = ? THEN excluded.last_error
+                                      ELSE download_status.last_error END,
+                    updated_at = excluded.updated_at
+            ''', (video_name, status, 1 if attempt else 0, bytes_downloaded, duration,
+                  error, time.time(), STATUS_FAILED))
+    
+    def set_statuses(self, statuses: Dict[str, str]):
+        """批量更新状态（单个事务）"""
+        now = time.time()
+        with self._lock, self._transaction() as conn:
+            conn.executemany('''
+                INSERT INTO download_status (video_name, status, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(video_name) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at
+            ''', [(video_name, status, now) for video_name, status in statuses.items()])
+    
+    def clear_picks(self, video_names: Iterable[str] = None):
+        """清除所有（或指定视频）的pick_now标记"""
+        with self._lock, self._transaction() as conn:
+            if video_names is None:
+                conn.execute("UPDATE download_status SET pick_now = ''")
+            else:
+                conn.executemany("UPDATE download_status SET pick_now = '' WHERE video_name = ?",
+                                 [(video_name,) for video_name in video_names])
+    
+    def get_picked(self) -> List[str]:
+        """pick_now标记为选中的视频（按扫描顺序）"""
+        with self._transaction() as conn:
+            rows = conn.execute('''
+                SELECT video_name, pick_now FROM download_status
+                ORDER BY position IS NULL, position, video_name
+            ''').fetchall()
+        return [row['video_name'] for row in rows if row['pick_now'].strip().lower() in PICK_VALUES]
+    
+    def get_by_status(self, status: str) -> List[str]:
+        with self._transaction() as conn:
+            rows = conn.execute('''
+                SELECT video_name FROM download_status WHERE status = ?
+                ORDER BY position IS NULL, position, video_name
+            ''', (status,)).fetchall()
+        return [row['video_name'] for row in rows]
+    
+    def get_record(self, video_name: str) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute('SELECT * FROM download_status WHERE video_name = ?', (video_name,)).fetchone()
+        return dict(row) if row else None
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_download_status_manager(csv_file: str) -> DownloadStatusManager:
+    """
+    返回CSV视图对应的状态存储（数据库与CSV同目录同名，扩展名为.db）；
+    数据库为空时从已有CSV导入，兼容之前只有CSV的状态
+    """
+    db_path = os.path.abspath(os.path.splitext(csv_file)[0] + '.db')
+    with _managers_lock:
+        manager = _managers.get(db_path)
+        if manager is None:
+            manager = DownloadStatusManager(db_path)
+            if manager.is_empty():
+                manager.import_csv(csv_file)
+            _managers[db_path] = manager
+    return manager
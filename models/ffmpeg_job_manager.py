@@ -0,0 +1,137 @@
+"""
+ffmpeg派生文件管理器的公共部分
+缩略图、代理、拼接预览、截图、faststart、片段等管理器共用的ffmpeg配置、可用性检测、统计计数，
+以及两种后台任务：按key排队的单文件任务（jobs）和遍历一批文件的批量任务（job_status）
+"""
+
+import os
+import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# ffmpeg/ffprobe可执行文件
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+FFPROBE_BIN = os.environ.get('FFPROBE_BIN', 'ffprobe')
+
+
+class FFmpegJobManager:
+    """ffmpeg派生文件管理器基类"""
+    
+    # 找不到ffmpeg时警告中的功能名称
+    feature_name = 'ffmpeg处理'
+    # stats中的计数项
+    stat_keys = ('generated', 'failed')
+    # 批量任务除done外的计数项及其在完成日志中的名称
+    job_counters = ()
+    
+    def __init__(self, workers: int = 0, thread_name_prefix: str = None):
+        self.ffmpeg_available = shutil.which(FFMPEG_BIN) is not None
+        self._lock = threading.RLock()
+        # workers为0时不创建线程池（只使用批量任务或同步调用）
+        self.workers = max(1, workers) if workers else 0
+        self._executor = (ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=thread_name_prefix)
+                          if self.workers else None)
+        self.jobs = {}  # key -> 'pending' | 'running' | 'failed'
+        # _run_submitted_job依赖generated/failed，无论子类如何定义stat_keys都保留这两项
+        self.stats = dict.fromkeys(tuple(self.stat_keys) + ('generated', 'failed'), 0)
+        self.job_status = self._new_job_status()
+        self._job_thread = None
+        
+        if not self.ffmpeg_available:
+            print(f"警告: 找不到 {FFMPEG_BIN}，{self.feature_name}不可用")
+    
+    def _submit_job(self, key: str, func: Callable[..., bool], *args) -> str:
+        """
+        把单文件任务提交到线程池（同一key排队或运行中时不重复提交）
+        
+        func返回True表示成功；成功后从jobs中移除，失败保留为'failed'，避免每次请求都重试
+        
+        Returns:
+            str: 任务当前状态
+        """
+        with self._lock:
+            state = self.jobs.get(key)
+            if state in ('pending', 'running'):
+                return state
+            self.jobs[key] = 'pending'
+        self._executor.submit(self._run_submitted_job, key, func, args)
+        return 'pending'
+    
+    def _run_submitted_job(self, key: str, func: Callable[..., bool], args: tuple):
+        with self._lock:
+            self.jobs[key] = 'running'
+        try:
+            success = func(*args)
+        except Exception as e:
+            print(f"{self.feature_name}失败 {key}: {e}")
+            success = False
+        with self._lock:
+            if success:
+                self.jobs.pop(key, None)
+                self.stats['generated'] += 1
+            else:
+                self.jobs[key] = 'failed'
+                self.stats['failed'] += 1
+    
+    def _clear_failed_jobs(self):
+        """清除失败记录，下次请求或批量提交时重试"""
+        with self._lock:
+            self.jobs = {key: state for key, state in self.jobs.items() if state != 'failed'}
+    
+    def _job_counts(self) -> Dict[str, int]:
+        with self._lock:
+            states = list(self.jobs.values())
+        return {state: states.count(state) for state in ('pending', 'running', 'failed')}
+    
+    def _new_job_status(self, total: int = 0, running: bool = False) -> Dict:
+        return {'running': running, 'total': total, 'done': 0,
+                **{key: 0 for key, _ in self.job_counters},
+                'started_at': time.time() if running else None, 'finished_at': None}
+    
+    def _start_job_thread(self, total: int, target: Callable, args: tuple = (),
+                          name: str = None) -> bool:
+        """
+        在后台线程中运行批量任务，同一时刻只允许一个
+        
+        Returns:
+            bool: 是否启动了新任务（已有任务运行时返回False）
+        """
+        with self._lock:
+            if self.job_status['running']:
+                return False
+            self.job_status = self._new_job_status(total, running=True)
+        self._job_thread = threading.Thread(target=self._run_job_thread, args=(target, args),
+                                            name=name, daemon=True)
+        self._job_thread.start()
+        return True
+    
+    def _run_job_thread(self, target: Callable, args: tuple):
+        try:
+            target(*args)
+        except Exception as e:
+            print(f"{self.feature_name}批量任务失败: {e}")
+        finally:
+            with self._lock:
+                self.job_status['running'] = False
+                self.job_status['finished_at'] = time.time()
+                summary = '，'.join(f"{label} {self.job_status[key]}" for key, label in self.job_counters)
+            print(f"{self.feature_name}批量任务完成: {summary}")
+    
+    def _count_job(self, counter: Optional[str] = None):
+        """批量任务完成一项；counter为要额外累加的计数项"""
+        with self._lock:
+            if not self.job_status['running']:
+                return
+            self.job_status['done'] += 1
+            if counter in self.job_status:
+                self.job_status[counter] += 1
+    
+    def get_status(self) -> Dict:
+        """返回ffmpeg可用性与统计计数（子类追加各自的字段）"""
+        with self._lock:
+            status = {'ffmpeg_available': self.ffmpeg_available, **self.stats}
+            if self.job_counters:
+                status['job'] = dict(self.job_status)
+            return status
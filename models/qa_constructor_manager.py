@@ -8,6 +8,8 @@
 import json
 import os
 import uuid
+import atexit
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from collections import defaultdict
@@ -16,11 +18,39 @@ from .video_path_manager import video_path_manager
 class QAConstructorManager:
     """人工构造QA数据管理器 - 按video_name分组"""
     
-    def __init__(self, input_file_path: str = 'data/qa_constructor.json'):
+    def __init__(self, input_file_path: str = 'data/qa_constructor.json',
+                 write_behind: bool = None, flush_interval: float = None):
         self.input_file_path = input_file_path
         self.output_file_path = input_file_path
         self.qa_data = self.load_qa_data()  # 改为字典格式 {video_name: [qa_list]}
         self.auto_save_enabled = True
+        
+        # 延迟写入（write-behind）：修改只标记脏数据，由后台线程按间隔合并写盘
+        if write_behind is None:
+            write_behind = os.environ.get('CONSTRUCTOR_WRITE_BEHIND', 'true').lower() == 'true'
+        if flush_interval is None:
+            flush_interval = float(os.environ.get('CONSTRUCTOR_FLUSH_INTERVAL', 2.0))
+        self.write_behind_enabled = write_behind
+        self.flush_interval = flush_interval
+        
+        # version: 内存中数据的版本号；persisted_version: 已写入磁盘的版本号
+        self.version = 0
+        self.persisted_version = 0
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._dirty_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._flusher_thread = None
+        atexit.register(self.close)
+        
+        # qa_id -> (video_name, 在该video列表中的下标)，加载时建立，增删改时增量维护
+        self.qa_index: Dict[str, tuple] = {}
+        self.duplicate_qa_ids: List[str] = []
+        self._rebuild_qa_index()
+        
+        # video_name -> 已分配的最大QA编号，用于O(1)生成新的qa_id
+        self.qa_sequences: Dict[str, int] = {}
+        self._rebuild_qa_sequences()
     
     def load_qa_data(self) -> Dict[str, List[Dict]]:
         """从文件加载QA数据（按video_name分组的字典格式）"""
@@ -44,28 +74,172 @@ class QAConstructorManager:
             return {}
     
     def save_qa_data(self) -> bool:
-        """保存QA数据到文件（字典格式）"""
-        try:
-            # 确保目录存在
-            dir_path = os.path.dirname(self.output_file_path)
-            if dir_path:
-                os.makedirs(dir_path, exist_ok=True)
-            
-            print(f"\n[save_qa_data] 准备保存到: {self.output_file_path}")
-            print(f"[save_qa_data] 视频数量: {len(self.qa_data)}")
-            total_qas = sum(len(qas) for qas in self.qa_data.values())
-            print(f"[save_qa_data] QA总数: {total_qas}")
-            
-            with open(self.output_file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.qa_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"[save_qa_data] ✓ 保存成功!")
+        """保存QA数据到文件（字典格式），同步写盘并更新persisted_version"""
+        # 同一时间只允许一个写盘操作，避免后台线程与手动保存交错写文件
+        with self._save_lock:
+            try:
+                # 确保目录存在
+                dir_path = os.path.dirname(self.output_file_path)
+                if dir_path:
+                    os.makedirs(dir_path, exist_ok=True)
+                
+                # 锁内只复制列表和每个QA字典（update_qa原地修改字段、整体替换值），
+                # 得到与version一致的快照；耗时的序列化放在锁外，不阻塞并发的增删改
+                with self._lock:
+                    snapshot_version = self.version
+                    snapshot = {video_name: [dict(qa) for qa in qas] for video_name, qas in self.qa_data.items()}
+                    self._dirty_event.clear()
+                total_qas = sum(len(qas) for qas in snapshot.values())
+                content = json.dumps(snapshot, ensure_ascii=False, indent=2)
+                
+                print(f"\n[save_qa_data] 准备保存到: {self.output_file_path}")
+                print(f"[save_qa_data] 视频数量: {len(snapshot)}, QA总数: {total_qas}, 版本: {snapshot_version}")
+                
+                # 先写临时文件再替换，避免写到一半时崩溃导致文件损坏
+                tmp_path = f"{self.output_file_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.replace(tmp_path, self.output_file_path)
+                
+                with self._lock:
+                    self.persisted_version = max(self.persisted_version, snapshot_version)
+                
+                print(f"[save_qa_data] ✓ 保存成功! (persisted_version={snapshot_version})")
+                return True
+            except Exception as e:
+                print(f"[save_qa_data] ✗ 保存失败: {e}")
+                import traceback
+                traceback.print_exc()
+                # 保存失败时保留脏标记，等待下一次刷新重试
+                if self.write_behind_enabled:
+                    self._dirty_event.set()
+                return False
+    
+    def _mark_dirty(self) -> bool:
+        """记录一次修改：同步模式下立即保存，延迟写入模式下交给后台线程合并写盘"""
+        with self._lock:
+            self.version += 1
+        
+        if not self.auto_save_enabled:
             return True
-        except Exception as e:
-            print(f"[save_qa_data] ✗ 保存失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+        
+        if not self.write_behind_enabled:
+            return self.save_qa_data()
+        
+        self._ensure_flusher()
+        self._dirty_event.set()
+        return True
+    
+    def _ensure_flusher(self):
+        """按需启动后台刷新线程"""
+        if self._flusher_thread is not None and self._flusher_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._flusher_thread = threading.Thread(
+            target=self._flush_loop, name='qa-constructor-flusher', daemon=True
+        )
+        self._flusher_thread.start()
+    
+    def _flush_loop(self):
+        """后台线程：等待脏标记，间隔内的多次修改合并为一次写盘"""
+        while not self._stop_event.is_set():
+            self._dirty_event.wait()
+            if self._stop_event.is_set():
+                break
+            # 等待一个刷新间隔，让突发的连续修改合并
+            self._stop_event.wait(self.flush_interval)
+            if self.is_dirty():
+                self.save_qa_data()
+    
+    def flush(self) -> bool:
+        """立即写入所有未持久化的修改"""
+        if not self.is_dirty():
+            return True
+        return self.save_qa_data()
+    
+    def close(self):
+        """停止后台线程并写入剩余修改（进程退出或切换文件时调用）"""
+        self._stop_event.set()
+        self._dirty_event.set()
+        if self._flusher_thread is not None and self._flusher_thread.is_alive():
+            self._flusher_thread.join(timeout=max(self.flush_interval, 1.0) + 5)
+        self._flusher_thread = None
+        self._dirty_event.clear()
+        if self.auto_save_enabled:
+            self.flush()
+    
+    def is_dirty(self) -> bool:
+        """是否存在尚未写入磁盘的修改"""
+        with self._lock:
+            return self.version > self.persisted_version
+    
+    def get_save_status(self) -> Dict:
+        """获取持久化状态：内存版本号与已写盘版本号"""
+        with self._lock:
+            return {
+                'version': self.version,
+                'persisted_version': self.persisted_version,
+                'dirty': self.version > self.persisted_version,
+                'write_behind': self.write_behind_enabled,
+                'flush_interval': self.flush_interval
+            }
+    
+    def _rebuild_qa_index(self):
+        """重建qa_id定位索引，并检测重复的qa_id（重复时以第一次出现的为准）"""
+        with self._lock:
+            self.qa_index = {}
+            self.duplicate_qa_ids = []
+            for video_name in self.qa_data:
+                self._index_video(video_name)
+            if self.duplicate_qa_ids:
+                print(f"警告: 发现重复的qa_id（仅第一次出现的可被访问）: {', '.join(self.duplicate_qa_ids[:10])}")
+    
+    def _index_video(self, video_name: str):
+        """重新登记某个video下所有QA的位置（列表顺序变化后调用）"""
+        qas = self.qa_data.get(video_name, [])
+        # 先移除该video的旧登记，再按当前顺序重新登记
+        for qa in qas:
+            location = self.qa_index.get(qa.get('qa_id'))
+            if location is not None and location[0] == video_name:
+                del self.qa_index[qa.get('qa_id')]
+        
+        for i, qa in enumerate(qas):
+            qa_id = qa.get('qa_id')
+            if qa_id is None:
+                continue
+            if qa_id in self.qa_index:
+                # 同一个qa_id已在其他位置登记过
+                if qa_id not in self.duplicate_qa_ids:
+                    self.duplicate_qa_ids.append(qa_id)
+                continue
+            self.qa_index[qa_id] = (video_name, i)
+    
+    def _rebuild_qa_sequences(self):
+        """从现有qa_id（格式: video_name_qa_N）中提取每个video的最大编号"""
+        with self._lock:
+            self.qa_sequences = {}
+            for video_name, qas in self.qa_data.items():
+                max_qa_num = -1
+                for qa in qas:
+                    qa_id = qa.get('qa_id', '')
+                    if '_qa_' in qa_id:
+                        try:
+                            max_qa_num = max(max_qa_num, int(qa_id.split('_qa_')[-1]))
+                        except ValueError:
+                            pass
+                self.qa_sequences[video_name] = max_qa_num
+    
+    def _allocate_qa_id(self, video_name: str) -> str:
+        """为video分配下一个qa_id（编号只增不减，删除后也不会复用）"""
+        with self._lock:
+            next_num = self.qa_sequences.get(video_name, -1) + 1
+            new_qa_id = f"{video_name}_qa_{next_num}"
+            # 防御：跳过已被占用的id（例如其他video中手工写入的同名id）
+            while new_qa_id in self.qa_index:
+                next_num += 1
+                new_qa_id = f"{video_name}_qa_{next_num}"
+            self.qa_sequences[video_name] = next_num
+            return new_qa_id
     
     def get_current_file(self) -> str:
         """获取当前文件路径"""
@@ -86,96 +260,81 @@ class QAConstructorManager:
     
     def get_video_qas(self, video_name: str) -> List[Dict]:
         """获取指定video的所有QA"""
-        qas = self.qa_data.get(video_name, [])
-        # 按qa_id排序
-        qas.sort(key=lambda x: x.get('qa_id', ''))
-        return qas
+        with self._lock:
+            qas = self.qa_data.get(video_name, [])
+            # 按qa_id排序（顺序变化后重新登记该video的位置）
+            qas.sort(key=lambda x: x.get('qa_id', ''))
+            self._index_video(video_name)
+            return qas
     
     def get_qa_by_id(self, qa_id: str) -> Optional[Dict]:
         """根据qa_id获取QA"""
-        for video_name, qas in self.qa_data.items():
-            for qa in qas:
-                if qa.get('qa_id') == qa_id:
-                    return qa
-        return None
+        location = self._locate_qa(qa_id)
+        if not location:
+            return None
+        video_name, i = location
+        return self.qa_data[video_name][i]
     
     def create_qa(self, video_name: str, qa_data: Dict) -> bool:
         """在指定video中创建新的QA"""
         try:
             print(f"\n[create_qa] 准备在video [{video_name}] 中创建新QA")
             
-            # 确保video_name存在于qa_data中
-            if video_name not in self.qa_data:
-                print(f"[create_qa] 创建新video key: {video_name}")
-                self.qa_data[video_name] = []
+            with self._lock:
+                # 确保video_name存在于qa_data中
+                if video_name not in self.qa_data:
+                    print(f"[create_qa] 创建新video key: {video_name}")
+                    self.qa_data[video_name] = []
             
-            # 获取该video的现有QA，确定新QA的编号
-            existing_qas = self.qa_data[video_name]
-            print(f"[create_qa] 当前QA数量: {len(existing_qas)}")
+                # 获取该video的现有QA，确定新QA的编号
+                existing_qas = self.qa_data[video_name]
+                print(f"[create_qa] 当前QA数量: {len(existing_qas)}")
             
-            # 提取最大的qa编号
-            max_qa_num = -1
-            for qa in existing_qas:
-                qa_id = qa.get('qa_id', '')
-                # 格式: video_name_qa_N
-                if '_qa_' in qa_id:
-                    try:
-                        num = int(qa_id.split('_qa_')[-1])
-                        max_qa_num = max(max_qa_num, num)
-                    except ValueError:
-                        pass
+                # 生成新的qa_id
+                new_qa_id = self._allocate_qa_id(video_name)
+                print(f"[create_qa] 新QA ID: {new_qa_id}")
             
-            # 生成新的qa_id
-            new_qa_num = max_qa_num + 1
-            new_qa_id = f"{video_name}_qa_{new_qa_num}"
-            print(f"[create_qa] 新QA ID: {new_qa_id}")
+                # 获取默认信息（从第一个QA）
+                default_info = {}
+                if existing_qas:
+                    first_qa = existing_qas[0]
+                    default_info = {
+                        'start_time': first_qa.get('start_time', '00:00.00'),
+                        'end_time': first_qa.get('end_time', '00:00.00')
+                    }
             
-            # 获取默认信息（从第一个QA）
-            default_info = {}
-            if existing_qas:
-                first_qa = existing_qas[0]
-                default_info = {
-                    'start_time': first_qa.get('start_time', '00:00.00'),
-                    'end_time': first_qa.get('end_time', '00:00.00')
+                # 构建新QA（只使用"主视角"和"提问视角"，不再使用"视角"）
+                new_qa = {
+                    'qa_id': new_qa_id,
+                    'video_name': video_name,
+                    '主视角': qa_data.get('主视角', []),
+                    '提问视角': qa_data.get('提问视角', []),
+                    '提问视角_time': qa_data.get('提问视角_time', None),
+                    'question': qa_data.get('question', ''),
+                    'options': qa_data.get('options', []),
+                    'ground_truth': qa_data.get('ground_truth', ''),
+                    'question_type': qa_data.get('question_type', ''),
+                    'temporal_direction': qa_data.get('temporal_direction', ''),
+                    'start_time': qa_data.get('start_time', default_info.get('start_time', '00:00.00')),
+                    'end_time': qa_data.get('end_time', default_info.get('end_time', '00:00.00')),
+                    'cut_point': qa_data.get('cut_point', ''),
+                    'usable': qa_data.get('usable', False),  # 默认无效，需要标注完成后改为有效
+                    'useless_reason': qa_data.get('useless_reason', ''),  # 默认为空
+                    'version': 'v2'  # 新增QA默认为v2
                 }
             
-            # 构建新QA（只使用"主视角"和"提问视角"，不再使用"视角"）
-            new_qa = {
-                'qa_id': new_qa_id,
-                'video_name': video_name,
-                '主视角': qa_data.get('主视角', []),
-                '提问视角': qa_data.get('提问视角', []),
-                '提问视角_time': qa_data.get('提问视角_time', None),
-                'question': qa_data.get('question', ''),
-                'options': qa_data.get('options', []),
-                'ground_truth': qa_data.get('ground_truth', ''),
-                'question_type': qa_data.get('question_type', ''),
-                'temporal_direction': qa_data.get('temporal_direction', ''),
-                'start_time': qa_data.get('start_time', default_info.get('start_time', '00:00.00')),
-                'end_time': qa_data.get('end_time', default_info.get('end_time', '00:00.00')),
-                'cut_point': qa_data.get('cut_point', ''),
-                'usable': qa_data.get('usable', False),  # 默认无效，需要标注完成后改为有效
-                'useless_reason': qa_data.get('useless_reason', ''),  # 默认为空
-                'version': 'v2'  # 新增QA默认为v2
-            }
-            
-            print(f"[create_qa] 新QA数据: {new_qa}")
+                print(f"[create_qa] 新QA数据: {new_qa}")
             
-            # 添加到对应video的列表
-            self.qa_data[video_name].append(new_qa)
-            print(f"[create_qa] 已添加到内存，当前数量: {len(self.qa_data[video_name])}")
+                # 添加到对应video的列表
+                self.qa_data[video_name].append(new_qa)
+                self.qa_index[new_qa_id] = (video_name, len(self.qa_data[video_name]) - 1)
+                print(f"[create_qa] 已添加到内存，当前数量: {len(self.qa_data[video_name])}")
             
-            # 自动保存
-            if self.auto_save_enabled:
-                print(f"[create_qa] 开始自动保存...")
-                save_success = self.save_qa_data()
-                if save_success:
-                    print(f"[create_qa] ✓ 成功创建并保存QA: {new_qa_id}")
-                else:
-                    print(f"[create_qa] ✗ QA已创建但保存失败: {new_qa_id}")
-                    return False
-            else:
-                print(f"[create_qa] 自动保存已禁用")
+            # 自动保存（延迟写入模式下仅标记为脏数据）
+            if not self._mark_dirty():
+                print(f"[create_qa] ✗ QA已创建但保存失败: {new_qa_id}")
+                return False
+            print(f"[create_qa] ✓ 成功创建QA: {new_qa_id} (version={self.version})")
             
             return True
             
@@ -185,36 +344,39 @@ class QAConstructorManager:
             traceback.print_exc()
             return False
     
+    def _locate_qa(self, qa_id: str) -> Optional[tuple]:
+        """查找qa_id所在的(video_name, index)，找不到返回None"""
+        return self.qa_index.get(qa_id)
+    
     def update_qa(self, qa_id: str, updated_data: Dict) -> bool:
         """更新QA信息（不包括video_name、qa_id等）"""
         try:
             print(f"\n[update_qa] 尝试更新QA: {qa_id}")
             print(f"[update_qa] 更新数据: {updated_data}")
             
-            for video_name, qas in self.qa_data.items():
-                for i, qa in enumerate(qas):
-                    if qa.get('qa_id') == qa_id:
-                        print(f"[update_qa] 找到QA在video: {video_name}, index: {i}")
-                        
-                        # 不允许修改的字段
-                        excluded_fields = {'video_name', 'qa_id', 'version'}
-                        
-                        # 更新允许修改的字段
-                        for key, value in updated_data.items():
-                            if key not in excluded_fields:
-                                old_value = self.qa_data[video_name][i].get(key, 'N/A')
-                                self.qa_data[video_name][i][key] = value
-                                print(f"[update_qa] 更新字段 {key}: {old_value} → {value}")
-                        
-                        # 自动保存
-                        if self.auto_save_enabled:
-                            save_success = self.save_qa_data()
-                            print(f"[update_qa] 自动保存: {'成功' if save_success else '失败'}")
-                        
-                        return True
+            with self._lock:
+                location = self._locate_qa(qa_id)
+                if not location:
+                    print(f"[update_qa] 错误: 未找到QA: {qa_id}")
+                    return False
+                
+                video_name, i = location
+                print(f"[update_qa] 找到QA在video: {video_name}, index: {i}")
+                
+                # 不允许修改的字段
+                excluded_fields = {'video_name', 'qa_id', 'version'}
+                
+                # 更新允许修改的字段
+                for key, value in updated_data.items():
+                    if key not in excluded_fields:
+                        old_value = self.qa_data[video_name][i].get(key, 'N/A')
+                        self.qa_data[video_name][i][key] = value
+                        print(f"[update_qa] 更新字段 {key}: {old_value} → {value}")
             
-            print(f"[update_qa] 错误: 未找到QA: {qa_id}")
-            return False
+            # 自动保存（延迟写入模式下仅标记为脏数据）
+            save_success = self._mark_dirty()
+            print(f"[update_qa] 自动保存: {'成功' if save_success else '失败'} (version={self.version})")
+            return True
         except Exception as e:
             print(f"[update_qa] 异常: {e}")
             import traceback
@@ -224,23 +386,36 @@ class QAConstructorManager:
     def delete_qa(self, qa_id: str) -> bool:
         """删除指定QA"""
         try:
-            for video_name, qas in self.qa_data.items():
-                for i, qa in enumerate(qas):
-                    if qa.get('qa_id') == qa_id:
-                        del self.qa_data[video_name][i]
-                        
-                        # 如果该video下没有QA了，可以选择保留空列表或删除该key
-                        # 这里选择保留空列表
-                        
-                        # 自动保存
-                        if self.auto_save_enabled:
-                            self.save_qa_data()
-                        
-                        print(f"成功删除QA: {qa_id}")
-                        return True
+            with self._lock:
+                location = self._locate_qa(qa_id)
+                if not location:
+                    print(f"未找到QA: {qa_id}")
+                    return False
+                
+                video_name, i = location
+                qas = self.qa_data[video_name]
+                del qas[i]
+                del self.qa_index[qa_id]
+                
+                # 其后的QA下标整体前移一位
+                for j in range(i, len(qas)):
+                    later_id = qas[j].get('qa_id')
+                    if self.qa_index.get(later_id) == (video_name, j + 1):
+                        self.qa_index[later_id] = (video_name, j)
+                
+                # 删除的是重复id的第一次出现时，让剩余的同名QA重新可被访问
+                if qa_id in self.duplicate_qa_ids:
+                    self.duplicate_qa_ids.remove(qa_id)
+                    self._rebuild_qa_index()
+                
+                # 如果该video下没有QA了，可以选择保留空列表或删除该key
+                # 这里选择保留空列表
             
-            print(f"未找到QA: {qa_id}")
-            return False
+            # 自动保存
+            self._mark_dirty()
+            
+            print(f"成功删除QA: {qa_id}")
+            return True
         except Exception as e:
             print(f"删除QA失败: {e}")
             return False
@@ -248,57 +423,34 @@ class QAConstructorManager:
     def duplicate_qa(self, qa_id: str) -> bool:
         """复制指定QA，创建新ID和v2版本"""
         try:
-            # 找到要复制的QA
-            original_qa = None
-            video_name = None
-            
-            for vn, qas in self.qa_data.items():
-                for qa in qas:
-                    if qa.get('qa_id') == qa_id:
-                        original_qa = qa
-                        video_name = vn
-                        break
-                if original_qa:
-                    break
-            
-            if not original_qa or not video_name:
-                print(f"未找到要复制的QA: {qa_id}")
-                return False
-            
-            # 生成新的QA ID
-            existing_qas = self.qa_data[video_name]
-            max_index = 0
-            for qa in existing_qas:
-                qa_id_parts = qa.get('qa_id', '').split('_qa_')
-                if len(qa_id_parts) == 2:
-                    try:
-                        index = int(qa_id_parts[1])
-                        max_index = max(max_index, index)
-                    except ValueError:
-                        pass
-            
-            new_qa_id = f"{video_name}_qa_{max_index + 1}"
-            
-            # 创建副本，修改ID和版本
-            duplicated_qa = original_qa.copy()
-            duplicated_qa['qa_id'] = new_qa_id
-            duplicated_qa['version'] = 'v2'
-            
-            # 添加到对应video的列表
-            self.qa_data[video_name].append(duplicated_qa)
+            with self._lock:
+                # 找到要复制的QA
+                location = self._locate_qa(qa_id)
+                if not location:
+                    print(f"未找到要复制的QA: {qa_id}")
+                    return False
+                
+                video_name, i = location
+                original_qa = self.qa_data[video_name][i]
+                
+                # 生成新的QA ID（与create_qa使用同一个分配器）
+                new_qa_id = self._allocate_qa_id(video_name)
+                
+                # 创建副本，修改ID和版本
+                duplicated_qa = original_qa.copy()
+                duplicated_qa['qa_id'] = new_qa_id
+                duplicated_qa['version'] = 'v2'
+                
+                # 添加到对应video的列表
+                self.qa_data[video_name].append(duplicated_qa)
+                self.qa_index[new_qa_id] = (video_name, len(self.qa_data[video_name]) - 1)
             
             print(f"成功复制QA: {qa_id} → {new_qa_id}")
             
-            # 自动保存
-            if self.auto_save_enabled:
-                save_success = self.save_qa_data()
-                if save_success:
-                    print(f"✓ 复制并保存成功: {new_qa_id}")
-                else:
-                    print(f"✗ QA已复制但保存失败: {new_qa_id}")
-                    return False
-            else:
-                print(f"自动保存已禁用")
+            # 自动保存（延迟写入模式下仅标记为脏数据）
+            if not self._mark_dirty():
+                print(f"✗ QA已复制但保存失败: {new_qa_id}")
+                return False
             
             return True
             
@@ -361,6 +513,11 @@ class QAConstructorManager:
         """启用或禁用自动保存"""
         self.auto_save_enabled = enabled
         print(f"自动保存已{'启用' if enabled else '禁用'}")
+        
+        # 重新启用时，把禁用期间积累的修改交给后台线程写盘
+        if enabled and self.write_behind_enabled and self.is_dirty():
+            self._ensure_flusher()
+            self._dirty_event.set()
 
 # 全局实例
 qa_constructor_manager = QAConstructorManager()
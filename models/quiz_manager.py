@@ -7,10 +7,14 @@
 
 import json
 import os
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from .video_path_manager import video_path_manager
 
+# 答题过程中会修改的标注字段，存放在旁路答案文件中，题库文件保持只读
+ANSWER_FIELDS = ('human_answer', 'usable', 'useless_reason', 'difficulty')
+
 class QuizManager:
     """答题模式QA数据管理器"""
     
@@ -19,6 +23,18 @@ class QuizManager:
         self.output_file_path = input_file_path
         self.qa_list = self.load_qa_data()
         self.auto_save_enabled = True
+        
+        # qa_id -> 在qa_list中的下标，加载时建立，修改时维护
+        self.qa_id_index: Dict[str, int] = {}
+        self.duplicate_qa_ids: List[str] = []
+        self._rebuild_index()
+        
+        # 答案存储：{qa_id: {字段: 值}}，由追加写的 <文件名>.answers.jsonl 重建，读取时覆盖到题目上
+        self.answers_file_path = f"{self.input_file_path}.answers.jsonl"
+        self._lock = threading.RLock()
+        self._answer_log_entries = 0
+        self._answers_pending = False
+        self.answers = self.load_answers()
     
     def load_qa_data(self) -> List[Dict]:
         """从文件加载QA数据（数组格式）"""
@@ -56,66 +72,224 @@ class QuizManager:
             print(f"保存QA数据失败: {e}")
             return False
     
+    def _rebuild_index(self):
+        """重建qa_id索引，并检测重复的qa_id（重复时以第一次出现的为准）"""
+        index = {}
+        duplicates = []
+        for i, qa in enumerate(self.qa_list):
+            qa_id = qa.get('qa_id')
+            if qa_id is None:
+                continue
+            if qa_id in index:
+                duplicates.append(qa_id)
+                continue
+            index[qa_id] = i
+        
+        self.qa_id_index = index
+        self.duplicate_qa_ids = duplicates
+        if duplicates:
+            shown = ', '.join(duplicates[:10])
+            more = f" 等{len(duplicates)}个" if len(duplicates) > 10 else ''
+            print(f"警告: 发现重复的qa_id（仅第一次出现的可被访问）: {shown}{more}")
+    
+    def load_answers(self) -> Dict[str, Dict]:
+        """从答案日志重建答案存储（同一qa_id后写入的字段覆盖先写入的）"""
+        answers = {}
+        if not os.path.exists(self.answers_file_path):
+            return answers
+        try:
+            with open(self.answers_file_path, 'r', encoding='utf-8') as f:
+                for line_no, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时最后一行可能只写了一半
+                        print(f"答案日志第 {line_no} 行不完整，已忽略")
+                        continue
+                    if not isinstance(entry, dict) or 'qa_id' not in entry \
+                            or not isinstance(entry.get('fields', {}), dict):
+                        # 跳过格式不对的行，不能中断加载：之后的压缩会按内存中的答案重写日志
+                        print(f"答案日志第 {line_no} 行格式错误，已忽略")
+                        continue
+                    answers.setdefault(entry['qa_id'], {}).update(entry.get('fields', {}))
+                    self._answer_log_entries += 1
+            print(f"成功加载答案记录: {len(answers)} 个QA ({self._answer_log_entries} 条日志)")
+        except Exception as e:
+            print(f"加载答案记录失败: {e}")
+        return answers
+    
+    def _append_answer(self, qa_id: str, fields: Dict) -> bool:
+        """追加一条答案记录（写入量与题库大小无关）"""
+        if not self.auto_save_enabled:
+            # 自动保存关闭期间只保留在内存，重新启用时整体重写答案日志
+            self._answers_pending = True
+            return True
+        try:
+            entry = {
+                'qa_id': qa_id,
+                'fields': fields,
+                'time': datetime.now().isoformat()
+            }
+            with open(self.answers_file_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._answer_log_entries += 1
+            
+            # 日志中被覆盖的旧记录过多时，压缩为每个qa_id一行
+            if self._answer_log_entries > max(1000, 4 * len(self.answers)):
+                return self.compact_answers()
+            return True
+        except Exception as e:
+            print(f"保存答案失败: {e}")
+            return False
+    
+    def compact_answers(self) -> bool:
+        """把答案日志重写为每个qa_id一行"""
+        with self._lock:
+            try:
+                tmp_path = f"{self.answers_file_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for qa_id, fields in self.answers.items():
+                        f.write(json.dumps({'qa_id': qa_id, 'fields': fields}, ensure_ascii=False) + '\n')
+                os.replace(tmp_path, self.answers_file_path)
+                self._answer_log_entries = len(self.answers)
+                self._answers_pending = False
+                print(f"答案日志已压缩: {self.answers_file_path} ({len(self.answers)} 条)")
+                return True
+            except Exception as e:
+                print(f"压缩答案日志失败: {e}")
+                return False
+    
+    def _merge_answers(self, qa: Dict) -> Dict:
+        """返回合并了答案存储的QA副本"""
+        merged = qa.copy()
+        answer = self.answers.get(qa.get('qa_id'))
+        if answer:
+            merged.update(answer)
+        return merged
+    
+    def export_merged(self, output_path: str = None) -> Optional[str]:
+        """
+        导出合并了答案的完整题库文件
+        
+        Args:
+            output_path: 输出路径，默认为 <原文件名>_answered.json；
+                         指定为原文件路径时写回题库并清空答案日志
+        
+        Returns:
+            str: 实际写入的文件路径，失败返回None
+        """
+        if not output_path:
+            root, ext = os.path.splitext(self.input_file_path)
+            output_path = f"{root}_answered{ext or '.json'}"
+        
+        with self._lock:
+            try:
+                merged_list = [self._merge_answers(qa) for qa in self.qa_list]
+                dir_path = os.path.dirname(output_path)
+                if dir_path:
+                    os.makedirs(dir_path, exist_ok=True)
+                
+                tmp_path = f"{output_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(merged_list, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, output_path)
+                
+                # 写回题库本身时，答案已固化到题库中，清空答案存储
+                if os.path.abspath(output_path) == os.path.abspath(self.input_file_path):
+                    self.qa_list = merged_list
+                    self._rebuild_index()
+                    self.answers = {}
+                    if os.path.exists(self.answers_file_path):
+                        os.remove(self.answers_file_path)
+                    self._answer_log_entries = 0
+                    self._answers_pending = False
+                
+                print(f"合并结果已导出到: {output_path}")
+                return output_path
+            except Exception as e:
+                print(f"导出合并结果失败: {e}")
+                return None
+    
     def get_current_file(self) -> str:
         """获取当前文件路径"""
         return self.input_file_path
     
     def get_all_qas(self) -> List[Dict]:
         """获取所有QA数据"""
-        # 为每个QA添加视频路径信息
-        enhanced_qas = []
+        # 为每个QA添加视频路径信息（一次批量解析）
+        pairs = []
         for qa in self.qa_list:
-            enhanced_qa = qa.copy()
-            
-            # 添加视频路径
-            video_name = qa.get('video_name', '')
             perspectives = qa.get('视角', [])
-            perspective = perspectives[0] if perspectives else None
-            
-            enhanced_qa['video_path'] = video_path_manager.get_web_video_path(video_name, perspective)
+            pairs.append((qa.get('video_name', ''), perspectives[0] if perspectives else None))
+        resolved = video_path_manager.resolve_many(pairs)
+        
+        enhanced_qas = []
+        for qa, resolution in zip(self.qa_list, resolved):
+            enhanced_qa = self._merge_answers(qa)
+            enhanced_qa['video_path'] = resolution['video_path']
             enhanced_qas.append(enhanced_qa)
         
         return enhanced_qas
     
     def get_qa_by_id(self, qa_id: str) -> Optional[Dict]:
-        """根据qa_id获取QA"""
-        for qa in self.qa_list:
-            if qa.get('qa_id') == qa_id:
-                return qa
-        return None
+        """根据qa_id获取QA（已合并答案）"""
+        index = self.qa_id_index.get(qa_id)
+        if index is None:
+            return None
+        return self._merge_answers(self.qa_list[index])
     
     def get_qa_by_index(self, index: int) -> Optional[Dict]:
-        """根据索引获取QA"""
+        """根据索引获取QA（已合并答案）"""
         if 0 <= index < len(self.qa_list):
-            return self.qa_list[index]
+            return self._merge_answers(self.qa_list[index])
         return None
     
     def get_qa_index(self, qa_id: str) -> int:
         """获取QA的索引位置"""
-        for i, qa in enumerate(self.qa_list):
-            if qa.get('qa_id') == qa_id:
-                return i
-        return -1
+        return self.qa_id_index.get(qa_id, -1)
     
     def update_qa(self, qa_id: str, updated_data: Dict) -> bool:
-        """更新QA信息"""
+        """更新QA信息（标注字段写入答案存储，其余字段写回题库）"""
         try:
-            for i, qa in enumerate(self.qa_list):
-                if qa.get('qa_id') == qa_id:
-                    # 过滤掉不应该保存的字段
-                    excluded_fields = {'video_path'}
-                    for key, value in updated_data.items():
-                        if key not in excluded_fields:
-                            self.qa_list[i][key] = value
-                    
-                    # 自动保存
-                    if self.auto_save_enabled:
-                        self.save_qa_data()
-                    
-                    return True
-            
-            print(f"未找到QA: {qa_id}")
-            return False
+            with self._lock:
+                i = self.qa_id_index.get(qa_id)
+                if i is None:
+                    print(f"未找到QA: {qa_id}")
+                    return False
+                
+                # 过滤掉不应该保存的字段
+                excluded_fields = {'video_path'}
+                answer_fields = {}
+                bank_changed = False
+                for key, value in updated_data.items():
+                    if key in excluded_fields:
+                        continue
+                    if key in ANSWER_FIELDS:
+                        answer_fields[key] = value
+                    else:
+                        self.qa_list[i][key] = value
+                        bank_changed = True
+                
+                # qa_id本身被修改时同步维护索引
+                new_qa_id = self.qa_list[i].get('qa_id')
+                if new_qa_id != qa_id:
+                    self._rebuild_index()
+                
+                success = True
+                if answer_fields:
+                    self.answers.setdefault(new_qa_id, {}).update(answer_fields)
+                    success = self._append_answer(new_qa_id, answer_fields)
+                
+                # 只有修改题目本身时才需要重写题库
+                if bank_changed and self.auto_save_enabled:
+                    success = self.save_qa_data() and success
+                
+                return success
         except Exception as e:
             print(f"更新QA失败: {e}")
             return False
@@ -171,9 +345,10 @@ class QuizManager:
     
     def get_statistics(self) -> Dict:
         """获取统计信息"""
-        total = len(self.qa_list)
-        answered = sum(1 for qa in self.qa_list if qa.get('human_answer') is not None)
-        usable = sum(1 for qa in self.qa_list if qa.get('usable', True))
+        merged_list = [self._merge_answers(qa) for qa in self.qa_list]
+        total = len(merged_list)
+        answered = sum(1 for qa in merged_list if qa.get('human_answer') is not None)
+        usable = sum(1 for qa in merged_list if qa.get('usable', True))
         
         return {
             'total': total,
@@ -187,6 +362,10 @@ class QuizManager:
         """启用或禁用自动保存"""
         self.auto_save_enabled = enabled
         print(f"自动保存已{'启用' if enabled else '禁用'}")
+        
+        # 禁用期间的答案没有写入日志，重新启用时整体重写一次
+        if enabled and self._answers_pending:
+            self.compact_answers()
 
 # 全局实例
 quiz_manager = QuizManager()
@@ -0,0 +1,288 @@
+"""
+视频片段管理器
+按需用ffmpeg从视角文件中截取 [start, end] 片段（默认流复制、从start之前最近的关键帧开始，可选精确裁剪重编码），
+在后台线程池中截取，结果存放在磁盘上按总大小限制的LRU缓存中；同一片段的并发请求只触发一次ffmpeg。
+片段实际起点（关键帧时间）记录在同名 .json 中，调用方据此换算原视频时间
+"""
+
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+from .ffmpeg_job_manager import FFmpegJobManager, FFMPEG_BIN
+from .video_path_manager import video_path_manager, CACHE_DIR
+from .video_metadata_manager import video_metadata_manager
+
+# 片段缓存总大小上限（字节），超出后淘汰最久未使用的片段
+CLIP_CACHE_MAX_BYTES = int(os.environ.get('CLIP_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+CLIP_FFMPEG_TIMEOUT = int(os.environ.get('CLIP_FFMPEG_TIMEOUT', 300))
+# 同时运行的截取ffmpeg进程数
+CLIP_WORKERS = int(os.environ.get('CLIP_WORKERS', 2))
+# 请求流复制片段时最多等待的秒数，超时先返回pending（精确裁剪不等待）
+CLIP_REQUEST_WAIT = float(os.environ.get('CLIP_REQUEST_WAIT', 2.0))
+
+# 片段文件名：sha1前缀 + .mp4，路由只接受这种格式，避免路径穿越
+CLIP_NAME_PATTERN = re.compile(r'^[0-9a-f]{24}\.mp4$')
+
+
+def time_to_seconds(value: Union[str, int, float, None]) -> Optional[float]:
+    """把 'mm:ss.xx' / 'hh:mm:ss' / 秒数 转换为秒，无法解析时返回None"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        seconds = 0.0
+        for part in str(value).strip().split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        return None
+
+
+class VideoClipManager(FFmpegJobManager):
+    """视频片段管理器（磁盘LRU缓存）"""
+    
+    feature_name = '视频片段'
+    stat_keys = ('hits', 'misses', 'coalesced', 'generated', 'evicted', 'failed')
+    
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        super().__init__(CLIP_WORKERS, 'video-clip')
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'clips')
+        self.max_bytes = max_bytes if max_bytes is not None else CLIP_CACHE_MAX_BYTES
+        self._entries = OrderedDict()  # clip_name -> 文件大小，按最近使用排序（末尾最新）
+        self._total_bytes = 0
+        self._starts = {}  # clip_name -> 片段在原视频中的实际起点（秒）
+        self._inflight = {}  # clip_name -> threading.Event
+        self._failed = set()  # 截取失败的片段，源文件不变时不再重试
+        self._load_existing()
+    
+    def _load_existing(self):
+        """启动时登记已有片段，按文件访问时间恢复LRU顺序"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        clips = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            if CLIP_NAME_PATTERN.match(entry.name):
+                clip_start = self._read_sidecar(entry.name)
+                if clip_start is None:
+                    # 没有起点记录的片段无法换算时间，删除后按需重新截取
+                    self._remove_files(entry.name)
+                    continue
+                stat = entry.stat()
+                clips.append((max(stat.st_atime, stat.st_mtime), entry.name, stat.st_size, clip_start))
+            elif entry.name.endswith('.tmp.mp4') or (
+                    entry.name.endswith('.json')
+                    and not os.path.exists(os.path.join(self.cache_dir, entry.name[:-len('.json')] + '.mp4'))):
+                # 上次中断留下的半成品或孤立的起点记录
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        for _, name, size, clip_start in sorted(clips):
+            self._entries[name] = size
+            self._starts[name] = clip_start
+            self._total_bytes += size
+        self._evict()
+    
+    def _sidecar_path(self, clip_name: str) -> str:
+        return os.path.join(self.cache_dir, clip_name[:-len('.mp4')] + '.json')
+    
+    def _read_sidecar(self, clip_name: str) -> Optional[float]:
+        try:
+            with open(self._sidecar_path(clip_name), 'r', encoding='utf-8') as f:
+                return float(json.load(f)['clip_start'])
+        except Exception:
+            return None
+    
+    def _remove_files(self, clip_name: str):
+        for path in (os.path.join(self.cache_dir, clip_name), self._sidecar_path(clip_name)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"删除缓存片段失败 {os.path.basename(path)}: {e}")
+    
+    def _clip_name(self, source_path: str, source_stat, start: float, end: float, exact: bool) -> str:
+        # 源文件大小与mtime参与计算，源文件被替换（如重新下载）后自然失效
+        key = f"{os.path.abspath(source_path)}|{source_stat.st_size}|{source_stat.st_mtime}|{start:.3f}|{end:.3f}|{int(exact)}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24] + '.mp4'
+    
+    def request_clip(self, video_name: str, perspective: str, start: float, end: float,
+                     exact: bool = False, wait: float = 0) -> Optional[Dict]:
+        """
+        请求片段：已缓存直接返回，否则提交后台截取并最多等待wait秒
+        
+        Args:
+            video_name: 视频名称
+            perspective: 视角文件名
+            start: 开始时间（秒）
+            end: 结束时间（秒）
+            exact: 精确裁剪（重编码）；默认流复制，从start之前最近的关键帧开始
+            wait: 最多等待截取完成的秒数，0为不等待
+        
+        Returns:
+            Dict: {'status': 'ready', 'clip_name', 'clip_start'}（clip_start为片段实际起点）
+                  或 {'status': 'pending'}；不可用或截取失败返回None
+        """
+        if not self.ffmpeg_available or end <= start or start < 0:
+            return None
+        source_path = video_path_manager.get_media_file(video_name, perspective)
+        if not source_path:
+            return None
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return None
+        clip_name = self._clip_name(source_path, source_stat, start, end, exact)
+        
+        with self._lock:
+            if clip_name in self._entries:
+                self._touch(clip_name)
+                self.stats['hits'] += 1
+                return self._ready(clip_name)
+            if clip_name in self._failed:
+                return None
+            event = self._inflight.get(clip_name)
+            if event is None:
+                event = threading.Event()
+                self._inflight[clip_name] = event
+                self.stats['misses'] += 1
+                self._executor.submit(self._run_cut, source_path, clip_name, start, end, exact, event)
+            else:
+                self.stats['coalesced'] += 1
+        
+        if wait > 0:
+            event.wait(wait)
+        with self._lock:
+            if clip_name in self._entries:
+                return self._ready(clip_name)
+            if clip_name in self._failed:
+                return None
+        return {'status': 'pending'}
+    
+    def _ready(self, clip_name: str) -> Dict:
+        return {'status': 'ready', 'clip_name': clip_name, 'clip_start': self._starts[clip_name]}
+    
+    def _run_cut(self, source_path: str, clip_name: str, start: float, end: float, exact: bool,
+                 event: threading.Event):
+        """后台线程：截取片段并唤醒等待者"""
+        try:
+            if not self._cut(source_path, clip_name, start, end, exact):
+                with self._lock:
+                    self._failed.add(clip_name)
+        finally:
+            with self._lock:
+                self._inflight.pop(clip_name, None)
+            event.set()
+    
+    def _cut(self, source_path: str, clip_name: str, start: float, end: float, exact: bool) -> bool:
+        """运行ffmpeg截取片段，成功后登记到缓存"""
+        clip_path = os.path.join(self.cache_dir, clip_name)
+        tmp_path = clip_path[:-len('.mp4')] + '.tmp.mp4'
+        
+        clip_start = start
+        if not exact:
+            # 流复制只能从关键帧开始：先找到start之前最近的关键帧，从它开始截取并如实报告起点
+            keyframe = video_metadata_manager.find_keyframe_before(source_path, start)
+            if keyframe is None:
+                print(f"找不到 {source_path} 在 {start:.3f}s 之前的关键帧，改为重编码精确裁剪")
+                exact = True
+            else:
+                clip_start = keyframe
+        # 向上取整到毫秒，保证输入seek落在该关键帧而不是更早的一个
+        seek = f'{math.ceil(clip_start * 1000) / 1000:.3f}' if not exact else f'{start:.3f}'
+        cmd = [FFMPEG_BIN, '-v', 'error', '-y', '-ss', seek, '-i', source_path,
+               '-t', f'{end - clip_start:.3f}']
+        if exact:
+            cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-c:a', 'aac']
+        else:
+            cmd += ['-c', 'copy', '-avoid_negative_ts', 'make_zero']
+        cmd += ['-movflags', '+faststart', tmp_path]
+        
+        try:
+            started = time.time()
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=CLIP_FFMPEG_TIMEOUT)
+            if result.returncode != 0 or not os.path.exists(tmp_path):
+                print(f"截取片段失败 {source_path} [{start}-{end}]: {result.stderr.strip()}")
+                self.stats['failed'] += 1
+                return False
+            sidecar_path = self._sidecar_path(clip_name)
+            with open(f"{sidecar_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump({'clip_start': clip_start, 'start': start, 'end': end, 'exact': exact}, f)
+            os.replace(f"{sidecar_path}.tmp", sidecar_path)
+            os.replace(tmp_path, clip_path)
+            size = os.path.getsize(clip_path)
+            with self._lock:
+                self._entries[clip_name] = size
+                self._starts[clip_name] = clip_start
+                self._total_bytes += size
+                self.stats['generated'] += 1
+                self._evict()
+            print(f"已截取片段 {clip_name} ({end - clip_start:.1f}s，耗时 {time.time() - started:.1f}s)")
+            return True
+        except subprocess.TimeoutExpired:
+            print(f"截取片段超时: {source_path} [{start}-{end}]")
+            self.stats['failed'] += 1
+            return False
+        except Exception as e:
+            print(f"截取片段失败: {e}")
+            self.stats['failed'] += 1
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    def _touch(self, clip_name: str):
+        """标记片段为最近使用（同时更新文件时间，重启后保持LRU顺序）"""
+        self._entries.move_to_end(clip_name)
+        try:
+            os.utime(os.path.join(self.cache_dir, clip_name))
+        except OSError:
+            pass
+    
+    def _evict(self):
+        """淘汰最久未使用的片段直到总大小不超过上限（至少保留最新的一个）"""
+        with self._lock:
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                clip_name, size = self._entries.popitem(last=False)
+                self._starts.pop(clip_name, None)
+                self._total_bytes -= size
+                self.stats['evicted'] += 1
+                self._remove_files(clip_name)
+    
+    def get_clip_path(self, clip_name: str) -> Optional[str]:
+        """返回缓存片段的文件路径（用于 /clips 路由），不在缓存中返回None"""
+        if not CLIP_NAME_PATTERN.match(clip_name):
+            return None
+        with self._lock:
+            if clip_name not in self._entries:
+                return None
+            self._touch(clip_name)
+        return os.path.join(self.cache_dir, clip_name)
+    
+    def get_status(self) -> Dict:
+        """返回缓存占用与命中统计"""
+        with self._lock:
+            return {
+                **super().get_status(),
+                'clip_count': len(self._entries),
+                'pending': len(self._inflight),
+                'total_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+# 全局视频片段管理器实例
+video_clip_manager = VideoClipManager()
@@ -0,0 +1,253 @@
+"""
+视频下载任务管理器
+/api/video/download 提交的下载作为任务放入进程内线程池执行，请求立即返回job_id；
+支持查询状态/结果、取消，同一样本的并发下载请求合并为同一个任务；
+下载进度（字节数、速率、ETA、阶段）通过Server-Sent Events推送
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+# 同时执行的下载任务数
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 2))
+# 内存中保留的已结束任务数，超出后丢弃最早结束的
+DOWNLOAD_JOB_HISTORY = int(os.environ.get('DOWNLOAD_JOB_HISTORY', 200))
+# SSE推送的最小间隔（秒）与无变化时的心跳间隔
+DOWNLOAD_EVENT_INTERVAL = float(os.environ.get('DOWNLOAD_EVENT_INTERVAL', 0.5))
+DOWNLOAD_EVENT_KEEPALIVE = float(os.environ.get('DOWNLOAD_EVENT_KEEPALIVE', 15))
+
+ACTIVE_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+
+class VideoDownloadJobManager:
+    """下载任务队列"""
+    
+    def __init__(self, download_manager, workers: int = None):
+        self.download_manager = download_manager
+        self.workers = max(1, workers or DOWNLOAD_WORKERS)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='video-download')
+        self._lock = threading.RLock()
+        # 任务有变化时通知SSE订阅者；_seq单调递增，订阅者据此判断哪些任务需要推送
+        self._changed = threading.Condition(self._lock)
+        self._seq = 0
+        self.jobs = OrderedDict()  # job_id -> job，按提交顺序
+        self._active_keys = {}  # 样本key -> 进行中的job_id，用于合并重复请求
+        self._cancel_events = {}  # job_id -> threading.Event
+        self._done_events = {}  # job_id -> threading.Event
+    
+    def _job_key(self, dataset_name: str, sample_name: str, video_type: str) -> str:
+        # single_video与multiple_videos都是下载同一个HuggingFace压缩包
+        source = 'youtube' if video_type == 'youtube' else 'huggingface'
+        return f"{dataset_name}/{sample_name}/{source}"
+    
+    def submit(self, dataset_name: str, sample_name: str, video_type: str,
+               video_info: Dict = None) -> Dict:
+        """
+        提交下载任务；同一样本已有排队中/下载中的任务时直接返回该任务
+        
+        Returns:
+            Dict: 任务信息（deduplicated表示是否合并到已有任务）
+        """
+        key = self._job_key(dataset_name, sample_name, video_type)
+        with self._lock:
+            active_id = self._active_keys.get(key)
+            if active_id:
+                return {**self._public(self.jobs[active_id]), 'deduplicated': True}
+            
+            job_id = uuid.uuid4().hex[:16]
+            job = {
+                'job_id': job_id,
+                'key': key,
+                'dataset': dataset_name,
+                'sample': sample_name,
+                'type': video_type,
+                'video_info': video_info or {},
+                'status': 'queued',
+                'progress': {'phase': 'queued'},
+                'result': None,
+                'error': None,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                '_seq': 0
+            }
+            self.jobs[job_id] = job
+            self._touch(job)
+            self._active_keys[key] = job_id
+            self._cancel_events[job_id] = threading.Event()
+            self._done_events[job_id] = threading.Event()
+        self._executor.submit(self._run_job, job_id)
+        return {**self._public(job), 'deduplicated': False}
+    
+    def _run_job(self, job_id: str):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job['status'] != 'queued':
+                return
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            job['progress'] = {'phase': 'download'}
+            self._touch(job)
+            cancel_event = self._cancel_events[job_id]
+        
+        def progress_callback(progress):
+            self._update_progress(job_id, progress)
+        
+        try:
+            if job['type'] == 'youtube':
+                result = self.download_manager.download_youtube_video(
+                    job['video_info'].get('youtube_url'), job['dataset'], job['sample'],
+                    f"{job['sample']}_youtube.mp4", cancel_event=cancel_event,
+                    progress_callback=progress_callback
+                )
+            else:
+                result = self.download_manager.download_huggingface_video(
+                    job['dataset'], job['sample'], cancel_event=cancel_event,
+                    progress_callback=progress_callback
+                )
+            if result.get('cancelled'):
+                status = 'cancelled'
+            else:
+                status = 'succeeded' if result.get('success') else 'failed'
+            self._finish(job_id, status, result=result, error=None if status != 'failed' else result.get('message'))
+        except Exception as e:
+            print(f"下载任务失败 {job_id}: {e}")
+            self._finish(job_id, 'failed', error=str(e))
+    
+    def _touch(self, job: Dict):
+        """标记任务有变化并唤醒SSE订阅者（调用方需持有锁）"""
+        self._seq += 1
+        job['_seq'] = self._seq
+        self._changed.notify_all()
+    
+    def _update_progress(self, job_id: str, progress: Dict):
+        """合并下载器报告的进度（阶段切换时清除上一阶段的字节数等字段）"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job['status'] != 'running':
+                return
+            if progress.get('phase') != job['progress'].get('phase'):
+                job['progress'] = {k: v for k, v in job['progress'].items() if k == 'cancel_requested'}
+            job['progress'].update({k: v for k, v in progress.items() if v is not None})
+            self._touch(job)
+    
+    def _finish(self, job_id: str, status: str, result: Dict = None, error: str = None):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            job['status'] = status
+            job['result'] = result
+            job['error'] = error
+            job['finished_at'] = time.time()
+            job['progress'] = {**job['progress'], 'phase': status}
+            self._touch(job)
+            if self._active_keys.get(job['key']) == job_id:
+                del self._active_keys[job['key']]
+            self._cancel_events.pop(job_id, None)
+            done_event = self._done_events.pop(job_id, None)
+            self._prune()
+        if done_event:
+            done_event.set()
+    
+    def _prune(self):
+        """只保留最近 DOWNLOAD_JOB_HISTORY 个已结束的任务"""
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in FINISHED_STATUSES]
+        for job_id in finished[:max(0, len(finished) - DOWNLOAD_JOB_HISTORY)]:
+            del self.jobs[job_id]
+    
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """
+        取消任务：排队中的直接取消，下载中的通知下载器终止（YouTube立即终止yt-dlp，HuggingFace在解压前生效）
+        
+        Returns:
+            Dict: 任务信息，任务不存在返回None
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            if job['status'] == 'queued':
+                self._finish(job_id, 'cancelled')
+            elif job['status'] == 'running':
+                self._cancel_events[job_id].set()
+                job['progress'] = {**job['progress'], 'cancel_requested': True}
+                self._touch(job)
+            return self._public(job)
+    
+    def wait(self, job_id: str, timeout: float = None) -> Optional[Dict]:
+        """等待任务结束并返回任务信息"""
+        with self._lock:
+            done_event = self._done_events.get(job_id)
+        if done_event:
+            done_event.wait(timeout)
+        return self.get_job(job_id)
+    
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return self._public(job) if job else None
+    
+    def list_jobs(self, active_only: bool = False) -> List[Dict]:
+        with self._lock:
+            return [self._public(job) for job in self.jobs.values()
+                    if not active_only or job['status'] in ACTIVE_STATUSES]
+    
+    def iter_events(self, job_id: str = None) -> Iterator[str]:
+        """
+        生成SSE事件流：先推送当前状态，之后任务有变化时推送（progress / done事件，data为任务JSON），
+        无变化时定期发送心跳注释；指定job_id时只推送该任务，任务结束后结束事件流
+        
+        Yields:
+            str: SSE格式的事件文本
+        """
+        last_seq = -1
+        while True:
+            with self._lock:
+                if job_id and job_id not in self.jobs:
+                    yield self._format_event('error', {'job_id': job_id, 'error': '任务不存在'})
+                    return
+                if self._seq == last_seq:
+                    self._changed.wait(DOWNLOAD_EVENT_KEEPALIVE)
+                seq = self._seq
+                if job_id:
+                    jobs = [self.jobs[job_id]] if job_id in self.jobs else []
+                else:
+                    jobs = list(self.jobs.values())
+                changed = [self._public(job) for job in jobs if job['_seq'] > last_seq]
+            
+            if seq == last_seq:
+                yield ': keep-alive\n\n'
+                continue
+            last_seq = seq
+            for job in changed:
+                event = 'done' if job['status'] in FINISHED_STATUSES else 'progress'
+                yield self._format_event(event, job)
+                if job_id and event == 'done':
+                    return
+            # 限制推送频率，yt-dlp每秒可能输出多行进度
+            time.sleep(DOWNLOAD_EVENT_INTERVAL)
+    
+    def _format_event(self, event: str, data: Dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    def _public(self, job: Dict) -> Dict:
+        """返回任务副本（不包含内部字段）"""
+        public = {k: v for k, v in job.items() if k not in ('key', 'video_info', '_seq')}
+        public['progress'] = dict(job['progress'])
+        return public
+    
+    def get_status(self) -> Dict:
+        """返回各状态的任务数量"""
+        with self._lock:
+            counts = {status: 0 for status in ACTIVE_STATUSES + FINISHED_STATUSES}
+            for job in self.jobs.values():
+                counts[job['status']] += 1
+            return {'workers': self.workers, **counts}
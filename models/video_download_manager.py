@@ -1,9 +1,16 @@
 import os
+import sys
 import zipfile
 import requests
+import time
 import shutil
-from typing import Dict, List, Optional, Tuple
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
 import logging
+from .video_faststart_manager import video_faststart_manager
+from .video_metadata_manager import video_metadata_manager
 
 # 可选依赖
 try:
@@ -14,7 +21,7 @@ except ImportError:
     print("警告: yt-dlp 不可用，YouTube下载功能将受限")
 
 try:
-    from huggingface_hub import hf_hub_download
+    from huggingface_hub import hf_hub_url, get_hf_file_metadata
     HF_HUB_AVAILABLE = True
 except ImportError:
     HF_HUB_AVAILABLE = False
@@ -24,6 +31,24 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# yt-dlp 进度输出格式（每行一条，由 _youtube_progress_hook 解析）
+YT_DLP_PROGRESS_PREFIX = 'YTDLP_PROGRESS'
+YT_DLP_PROGRESS_TEMPLATE = (f"download:{YT_DLP_PROGRESS_PREFIX} %(progress.status)s %(progress.downloaded_bytes)s "
+                            "%(progress.total_bytes)s %(progress.total_bytes_estimate)s %(progress.speed)s %(progress.eta)s")
+
+# 在子进程中执行hf_hub_download（hf_hub_download无法在线程中中断，取消时直接终止子进程），
+# 参数依次为 repo_id、filename、local_dir，最后一行输出下载后的文件路径
+HF_DOWNLOAD_SCRIPT = (
+    "import sys\n"
+    "from huggingface_hub import hf_hub_download\n"
+    "print(hf_hub_download(repo_id=sys.argv[1], repo_type='dataset', filename=sys.argv[2],\n"
+    "                      local_dir=sys.argv[3], local_dir_use_symlinks=False))\n"
+)
+
+class DownloadCancelled(Exception):
+    """下载任务被取消"""
+    pass
+
 class VideoDownloadManager:
     """视频下载管理器，处理YouTube和HuggingFace视频下载"""
     
@@ -78,8 +103,14 @@ class VideoDownloadManager:
             }
     
     def download_youtube_video(self, youtube_url: str, dataset_name: str, sample_name: str, 
-                              video_filename: str) -> Dict[str, str]:
-        """从YouTube下载视频"""
+                              video_filename: str, cancel_event: threading.Event = None,
+                              progress_callback: Callable[[Dict], None] = None) -> Dict[str, str]:
+        """
+        从YouTube下载视频
+        
+        cancel_event被设置时终止yt-dlp进程；progress_callback接收下载进度
+        {phase, downloaded_bytes, total_bytes, percent, rate, eta}
+        """
         if not YT_DLP_AVAILABLE:
             return {
                 "success": False,
@@ -106,6 +137,7 @@ class VideoDownloadManager:
                 '--retries', '3',  # 重试3次
                 '--fragment-retries', '3',  # 片段重试3次
                 '--extractor-retries', '3',  # 提取器重试3次
+                '--newline', '--progress-template', YT_DLP_PROGRESS_TEMPLATE,
                 youtube_url
             ]
             
@@ -125,7 +157,7 @@ class VideoDownloadManager:
                 
                 # 使用与FrameQuiz完全相同的subprocess调用方式
                 process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-                stdout, stderr = process.communicate()
+                stdout, stderr = self._communicate(process, cancel_event, progress_callback)
                 
                 if process.returncode != 0:
                     error_msg = stderr.decode() if stderr else "Unknown error"
@@ -137,12 +169,13 @@ class VideoDownloadManager:
                         '-f', 'best[ext=mp4]/best',  # 更兼容的格式选择
                         '-o', target_path,
                         '--merge-output-format', 'mp4',
+                        '--newline', '--progress-template', YT_DLP_PROGRESS_TEMPLATE,
                         youtube_url
                     ]
                     
                     logger.info("尝试兼容策略下载...")
                     fallback_process = subprocess.Popen(fallback_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-                    fallback_stdout, fallback_stderr = fallback_process.communicate()
+                    fallback_stdout, fallback_stderr = self._communicate(fallback_process, cancel_event, progress_callback)
                     
                     if fallback_process.returncode != 0:
                         fallback_error = fallback_stderr.decode() if fallback_stderr else "Unknown error"
@@ -155,6 +188,8 @@ class VideoDownloadManager:
                 
                 logger.info("YouTube视频下载完成")
                 
+            except DownloadCancelled:
+                raise
             except Exception as e:
                 logger.error(f"YouTube视频下载失败: {str(e)}")
                 raise e
@@ -166,11 +201,21 @@ class VideoDownloadManager:
                 # 验证文件完整性
                 if file_size > 0:
                     # 尝试获取视频时长等信息来验证文件
+                    self._report_progress(progress_callback, phase='validate')
                     validation_result = self._validate_video_file(target_path)
                     
                     if validation_result["valid"]:
                         logger.info(f"YouTube视频下载成功: {target_path}, 大小: {self.format_file_size(file_size)}")
                         
+                        # moov在文件末尾时重新封装为faststart，浏览器无需下载整个文件即可开始播放
+                        self._report_progress(progress_callback, phase='faststart')
+                        faststart_status = video_faststart_manager.ensure_faststart(target_path)
+                        file_size = os.path.getsize(target_path)
+                        metadata = validation_result.get("metadata")
+                        if faststart_status == 'remuxed' and metadata:
+                            # 重新封装后文件已变化，刷新元数据缓存
+                            metadata = video_metadata_manager.get_metadata(target_path) or metadata
+                        
                         # 下载成功时清除异常状态
                         if self.dataset_manager:
                             try:
@@ -186,7 +231,9 @@ class VideoDownloadManager:
                             "path": target_path,
                             "size": self.format_file_size(file_size),
                             "duration": validation_result.get("duration", "Unknown"),
-                            "format": validation_result.get("format", "Unknown")
+                            "format": validation_result.get("format", "Unknown"),
+                            "metadata": metadata,
+                            "faststart": faststart_status
                         }
                     else:
                         # 文件存在但验证失败，尝试删除并重新下载
@@ -209,6 +256,19 @@ class VideoDownloadManager:
                     "message": "YouTube视频下载失败：文件未创建"
                 }
                 
+        except DownloadCancelled:
+            logger.info(f"YouTube视频下载已取消: {youtube_url}")
+            self.cleanup_temp_files(dataset_name, sample_name)
+            if os.path.exists(target_path):
+                try:
+                    os.remove(target_path)
+                except OSError:
+                    pass
+            return {
+                "success": False,
+                "cancelled": True,
+                "message": "下载已取消"
+            }
         except Exception as e:
             logger.error(f"YouTube视频下载失败: {str(e)}")
             # 清理可能的部分下载文件
@@ -238,70 +298,27 @@ class VideoDownloadManager:
                 "message": f"YouTube视频下载失败: {str(e)}"
             }
     
-    def _validate_video_file(self, video_path: str) -> Dict[str, str]:
-        """验证视频文件的有效性"""
-        try:
-            import subprocess
-            import json
-            
-            # 使用ffprobe检查视频文件
-            cmd = [
-                'ffprobe', 
-                '-v', 'quiet', 
-                '-print_format', 'json', 
-                '-show_format', 
-                '-show_streams', 
-                video_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                try:
-                    info = json.loads(result.stdout)
-                    
-                    # 检查是否有视频流
-                    if 'streams' in info and any(s.get('codec_type') == 'video' for s in info['streams']):
-                        format_info = info.get('format', {})
-                        duration = format_info.get('duration', 'Unknown')
-                        format_name = format_info.get('format_name', 'Unknown')
-                        
-                        return {
-                            "valid": True,
-                            "duration": duration,
-                            "format": format_name,
-                            "message": "视频文件验证成功"
-                        }
-                    else:
-                        return {
-                            "valid": False,
-                            "message": "文件不包含有效的视频流"
-                        }
-                        
-                except json.JSONDecodeError:
-                    return {
-                        "valid": False,
-                        "message": "无法解析视频文件信息"
-                    }
-            else:
-                return {
-                    "valid": False,
-                    "message": f"ffprobe检查失败: {result.stderr}"
-                }
-                
-        except subprocess.TimeoutExpired:
-            return {
-                "valid": False,
-                "message": "视频文件检查超时"
-            }
-        except FileNotFoundError:
-            # ffprobe不存在，使用基本的文件检查
+    def _validate_video_file(self, video_path: str) -> Dict:
+        """
+        验证视频文件的有效性：通过video_metadata_manager用ffprobe探测（结果同时写入元数据缓存），
+        ffprobe不可用时退回基本检查
+        """
+        if not video_metadata_manager.ffprobe_available:
             return self._basic_video_validation(video_path)
-        except Exception as e:
+            
+        metadata = video_metadata_manager.get_metadata(video_path)
+        if not metadata:
             return {
                 "valid": False,
-                "message": f"视频文件验证异常: {str(e)}"
+                "message": "ffprobe未能识别有效的视频流"
             }
+        return {
+            "valid": True,
+            "duration": metadata.get('duration') or 'Unknown',
+            "format": metadata.get('format') or 'Unknown',
+            "metadata": metadata,
+            "message": "视频文件验证成功"
+        }
     
     def _basic_video_validation(self, video_path: str) -> Dict[str, str]:
         """基本的视频文件验证（当ffprobe不可用时）"""
@@ -350,8 +367,15 @@ class VideoDownloadManager:
                 "message": f"基本验证失败: {str(e)}"
             }
     
-    def download_huggingface_video(self, dataset_name: str, sample_name: str) -> Dict[str, str]:
-        """从HuggingFace下载视频压缩包并解压"""
+    def download_huggingface_video(self, dataset_name: str, sample_name: str,
+                                   cancel_event: threading.Event = None,
+                                   progress_callback: Callable[[Dict], None] = None) -> Dict[str, str]:
+        """
+        从HuggingFace下载视频压缩包并解压
+        
+        下载在子进程中进行，cancel_event被设置时终止子进程并删除未完成的文件；
+        progress_callback接收下载/解压进度
+        """
         if not HF_HUB_AVAILABLE:
             return {
                 "success": False,
@@ -371,20 +395,26 @@ class VideoDownloadManager:
             logger.info(f"开始从HuggingFace下载: {self.hf_repo}/videos/{dataset_name}/{zip_filename}")
             
             try:
-                downloaded_path = hf_hub_download(
-                    repo_id=self.hf_repo,
-                    repo_type="dataset",  # 明确指定为数据集仓库
-                    filename=f"videos/{dataset_name}/{zip_filename}",
-                    local_dir=target_dir,
-                    local_dir_use_symlinks=False
-                )
+                total_bytes = self._get_hf_file_size(f"videos/{dataset_name}/{zip_filename}") if progress_callback else None
+                with self._track_download_bytes(target_dir, progress_callback, total_bytes):
+                    downloaded_path = self._hf_download_in_subprocess(
+                        f"videos/{dataset_name}/{zip_filename}", target_dir, cancel_event)
                 
                 # 如果下载成功，解压文件
                 if os.path.exists(downloaded_path):
                     logger.info(f"压缩包下载成功: {downloaded_path}")
                     
+                    if cancel_event is not None and cancel_event.is_set():
+                        os.remove(downloaded_path)
+                        logger.info(f"HuggingFace下载已取消，压缩包已删除: {downloaded_path}")
+                        return {
+                            "success": False,
+                            "cancelled": True,
+                            "message": "下载已取消"
+                        }
+                    
                     # 解压文件
-                    extract_result = self._extract_zip_file(downloaded_path, target_dir)
+                    extract_result = self._extract_zip_file(downloaded_path, target_dir, progress_callback)
                     
                     if extract_result["success"]:
                         # 删除压缩包
@@ -394,6 +424,10 @@ class VideoDownloadManager:
                         # 清理多余的目录结构
                         self._cleanup_extraction_dirs(target_dir)
                         
+                        # 解压出的MP4如果moov在文件末尾，重新封装为faststart
+                        self._report_progress(progress_callback, phase='faststart')
+                        video_faststart_manager.process_paths(video_faststart_manager.collect_video_files(target_dir))
+                        
                         return {
                             "success": True,
                             "message": "视频下载并解压成功",
@@ -408,6 +442,17 @@ class VideoDownloadManager:
                         "message": "压缩包下载失败：文件未创建"
                     }
                     
+            except DownloadCancelled:
+                # 删除已下载的部分（huggingface_hub把未完成的文件写在local_dir/.cache下）
+                shutil.rmtree(os.path.join(target_dir, '.cache'), ignore_errors=True)
+                if os.path.exists(zip_path):
+                    os.remove(zip_path)
+                logger.info(f"HuggingFace下载已取消: {zip_filename}")
+                return {
+                    "success": False,
+                    "cancelled": True,
+                    "message": "下载已取消"
+                }
             except Exception as e:
                 logger.error(f"HuggingFace下载失败: {str(e)}")
                 return {
@@ -422,14 +467,39 @@ class VideoDownloadManager:
                 "message": f"视频下载过程失败: {str(e)}"
             }
     
-    def _extract_zip_file(self, zip_path: str, extract_dir: str) -> Dict[str, str]:
-        """解压ZIP文件"""
+    def _hf_download_in_subprocess(self, filename: str, local_dir: str,
+                                   cancel_event: threading.Event = None) -> str:
+        """
+        在子进程中下载HuggingFace文件，返回下载后的路径
+        
+        cancel_event被设置时终止子进程并抛出DownloadCancelled，多GB的压缩包不必等传输结束
+        """
+        process = subprocess.Popen(
+            [sys.executable, '-c', HF_DOWNLOAD_SCRIPT, self.hf_repo, filename, local_dir],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout, stderr = self._communicate(process, cancel_event)
+        if process.returncode != 0:
+            lines = stderr.decode(errors='replace').strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"下载进程退出码 {process.returncode}")
+        lines = stdout.decode(errors='replace').strip().splitlines()
+        if not lines:
+            raise RuntimeError("下载进程没有返回文件路径")
+        return lines[-1]
+    
+    def _extract_zip_file(self, zip_path: str, extract_dir: str,
+                          progress_callback: Callable[[Dict], None] = None) -> Dict[str, str]:
+        """解压ZIP文件（按解压后字节数报告进度）"""
         try:
             extracted_files = []
             
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
                 # 获取压缩包中的文件列表
                 file_list = zip_ref.namelist()
+                total_bytes = sum(info.file_size for info in zip_ref.infolist())
+                extracted_bytes = 0
+                started = time.time()
+                self._report_progress(progress_callback, phase='extract', downloaded_bytes=0, total_bytes=total_bytes)
                 
                 # 解压所有文件，只保留文件名，不保持目录结构
                 for file_name in file_list:
@@ -442,6 +512,9 @@ class VideoDownloadManager:
                     
                     # 解压到目标目录，使用基础文件名
                     zip_ref.extract(file_name, extract_dir)
+                    extracted_bytes += zip_ref.getinfo(file_name).file_size
+                    self._report_progress(progress_callback, phase='extract', downloaded_bytes=extracted_bytes,
+                                          total_bytes=total_bytes, elapsed=time.time() - started)
                     
                     # 如果解压后的文件不在目标目录根目录，需要移动
                     extracted_file_path = os.path.join(extract_dir, file_name)
@@ -514,21 +587,174 @@ class VideoDownloadManager:
         except Exception as e:
             logger.warning(f"清理多余目录时出错: {str(e)}")
     
+    def _communicate(self, process, cancel_event: threading.Event = None,
+                     progress_callback: Callable[[Dict], None] = None) -> Tuple[bytes, bytes]:
+        """
+        等待子进程结束并读取输出；cancel_event被设置时终止进程并抛出DownloadCancelled
+        
+        有progress_callback时逐行读取stdout，把yt-dlp进度行交给 _youtube_progress_hook
+        """
+        if progress_callback is None:
+            while True:
+                try:
+                    return process.communicate(timeout=0.5)
+                except subprocess.TimeoutExpired:
+                    if cancel_event is not None and cancel_event.is_set():
+                        process.kill()
+                        process.communicate()
+                        raise DownloadCancelled()
+        
+        stdout_lines, stderr_chunks = [], []
+        
+        def read_stdout():
+            last_percent = -10
+            for raw_line in iter(process.stdout.readline, b''):
+                d = self._parse_yt_dlp_progress(raw_line.decode(errors='replace'))
+                if d is None:
+                    stdout_lines.append(raw_line)
+                    continue
+                d['_last_percent'] = last_percent
+                self._youtube_progress_hook(d, progress_callback)
+                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if total_bytes:
+                    last_percent = d['downloaded_bytes'] / total_bytes * 100
+        
+        readers = [
+            threading.Thread(target=read_stdout, daemon=True),
+            threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        ]
+        for reader in readers:
+            reader.start()
+        while True:
+            try:
+                process.wait(timeout=0.5)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_event is not None and cancel_event.is_set():
+                    process.kill()
+                    process.wait()
+                    for reader in readers:
+                        reader.join()
+                    raise DownloadCancelled()
+        for reader in readers:
+            reader.join()
+        return b''.join(stdout_lines), b''.join(stderr_chunks)
+    
     def _is_video_file(self, filename: str) -> bool:
         """判断是否为视频文件"""
         video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm']
         return any(filename.lower().endswith(ext) for ext in video_extensions)
     
-    def _youtube_progress_hook(self, d):
-        """YouTube下载进度回调"""
+    def _youtube_progress_hook(self, d, progress_callback: Callable[[Dict], None] = None):
+        """YouTube下载进度回调（d与yt-dlp progress_hooks的参数格式相同）"""
         if d['status'] == 'downloading':
-            if 'total_bytes' in d and d['total_bytes']:
-                percent = (d['downloaded_bytes'] / d['total_bytes']) * 100
-                logger.info(f"YouTube下载进度: {percent:.1f}%")
+            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total_bytes:
+                percent = (d['downloaded_bytes'] / total_bytes) * 100
+                # 每10%记录一次日志，避免逐行刷屏
+                if int(percent // 10) != int(d.get('_last_percent', -10) // 10):
+                    logger.info(f"YouTube下载进度: {percent:.1f}%")
             elif 'downloaded_bytes' in d:
-                logger.info(f"YouTube已下载: {self.format_file_size(d['downloaded_bytes'])}")
+                logger.debug(f"YouTube已下载: {self.format_file_size(d['downloaded_bytes'])}")
+            self._report_progress(progress_callback, phase='download',
+                                  downloaded_bytes=d.get('downloaded_bytes'), total_bytes=total_bytes,
+                                  rate=d.get('speed'), eta=d.get('eta'))
         elif d['status'] == 'finished':
             logger.info("YouTube下载完成，正在处理...")
+            self._report_progress(progress_callback, phase='merge')
+    
+    def _parse_yt_dlp_progress(self, line: str) -> Optional[Dict]:
+        """解析 YT_DLP_PROGRESS_TEMPLATE 输出的一行，缺失的字段yt-dlp输出为NA"""
+        parts = line.strip().split()
+        if len(parts) != 7 or parts[0] != YT_DLP_PROGRESS_PREFIX:
+            return None
+        
+        def number(value):
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        
+        d = {'status': parts[1]}
+        for key, value in zip(('downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'speed', 'eta'), parts[2:]):
+            d[key] = number(value)
+        if d['downloaded_bytes'] is None:
+            return None
+        return d
+    
+    def _report_progress(self, progress_callback: Callable[[Dict], None], phase: str,
+                         downloaded_bytes: float = None, total_bytes: float = None,
+                         rate: float = None, eta: float = None, elapsed: float = None):
+        """整理进度字段后交给回调；rate/eta缺失时按elapsed估算"""
+        if progress_callback is None:
+            return
+        progress = {'phase': phase, 'downloaded_bytes': downloaded_bytes, 'total_bytes': total_bytes,
+                    'percent': None, 'rate': rate, 'eta': eta}
+        if downloaded_bytes is not None and total_bytes:
+            progress['percent'] = round(min(100.0, downloaded_bytes / total_bytes * 100), 1)
+        if rate is None and elapsed and downloaded_bytes is not None:
+            progress['rate'] = downloaded_bytes / elapsed if elapsed > 0 else None
+        if eta is None and progress['rate'] and total_bytes and downloaded_bytes is not None:
+            progress['eta'] = max(0.0, (total_bytes - downloaded_bytes) / progress['rate'])
+        try:
+            progress_callback(progress)
+        except Exception as e:
+            logger.warning(f"进度回调失败: {e}")
+    
+    def _get_hf_file_size(self, filename: str) -> Optional[int]:
+        """查询HuggingFace上文件的大小（用于计算进度与ETA），失败返回None"""
+        try:
+            return get_hf_file_metadata(hf_hub_url(self.hf_repo, filename, repo_type="dataset")).size
+        except Exception as e:
+            logger.debug(f"获取文件大小失败 {filename}: {e}")
+            return None
+    
+    @contextmanager
+    def _track_download_bytes(self, target_dir: str, progress_callback: Callable[[Dict], None] = None,
+                              total_bytes: int = None, interval: float = 0.5):
+        """
+        统计下载目录中新增的字节数（包括huggingface_hub写入的.incomplete临时文件），
+        在下载期间定期报告进度；hf_hub_download本身不提供进度回调
+        """
+        if progress_callback is None:
+            yield
+            return
+        
+        def dir_size():
+            total = 0
+            for dir_path, _, file_names in os.walk(target_dir):
+                for file_name in file_names:
+                    try:
+                        total += os.path.getsize(os.path.join(dir_path, file_name))
+                    except OSError:
+                        pass
+            return total
+        
+        baseline = dir_size()
+        started = time.time()
+        stop_event = threading.Event()
+        
+        def monitor():
+            last_bytes, last_time = 0, started
+            while not stop_event.wait(interval):
+                now = time.time()
+                downloaded = max(0, dir_size() - baseline)
+                rate = (downloaded - last_bytes) / (now - last_time) if now > last_time else None
+                last_bytes, last_time = downloaded, now
+                eta = (total_bytes - downloaded) / rate if total_bytes and rate else None
+                self._report_progress(progress_callback, phase='download', downloaded_bytes=downloaded,
+                                      total_bytes=total_bytes, rate=rate, eta=eta)
+        
+        thread = threading.Thread(target=monitor, name='download-progress', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop_event.set()
+            thread.join()
+            downloaded = max(0, dir_size() - baseline)
+            self._report_progress(progress_callback, phase='download', downloaded_bytes=downloaded,
+                                  total_bytes=total_bytes or downloaded, elapsed=time.time() - started)
     
     def format_file_size(self, size_bytes: int) -> str:
         """格式化文件大小"""
@@ -0,0 +1,284 @@
+"""
+MP4快速启动（faststart）管理器
+检测moov atom位于文件末尾的MP4，用ffmpeg流复制重新封装为faststart布局并原子替换原文件，
+浏览器无需先下载大部分文件即可显示第一帧；检测/封装结果按 (路径, 大小, mtime) 记录，不会重复处理
+"""
+
+import os
+import json
+import time
+import struct
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .ffmpeg_job_manager import FFmpegJobManager, FFMPEG_BIN
+from .video_path_manager import video_path_manager, CACHE_DIR
+
+# 批量处理的并发数（流复制主要消耗磁盘IO）
+FASTSTART_WORKERS = int(os.environ.get('FASTSTART_WORKERS', 2))
+FASTSTART_FFMPEG_TIMEOUT = int(os.environ.get('FASTSTART_FFMPEG_TIMEOUT', 3600))
+
+# 基于ISO BMFF的容器，可以调整moov位置
+FASTSTART_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+
+
+def inspect_mp4_layout(path: str) -> Optional[str]:
+    """
+    读取顶层box头判断moov位置（只seek，不读取媒体数据）
+    
+    Returns:
+        str: 'faststart'（moov在mdat之前）或 'moov_at_end'；不是MP4或结构损坏返回None
+    """
+    try:
+        with open(path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            offset = 0
+            seen_mdat = False
+            first = True
+            while offset + 8 <= file_size:
+                f.seek(offset)
+                size, box_type = struct.unpack('>I4s', f.read(8))
+                header_size = 8
+                if size == 1:
+                    # 64位box大小
+                    size = struct.unpack('>Q', f.read(8))[0]
+                    header_size = 16
+                elif size == 0:
+                    # 延伸到文件末尾
+                    size = file_size - offset
+                if size < header_size:
+                    return None
+                if first and box_type != b'ftyp':
+                    return None
+                first = False
+                if box_type == b'moov':
+                    return 'moov_at_end' if seen_mdat else 'faststart'
+                if box_type == b'mdat':
+                    seen_mdat = True
+                offset += size
+            return None
+    except (OSError, struct.error):
+        return None
+
+
+class VideoFaststartManager(FFmpegJobManager):
+    """MP4 faststart 检测与重新封装"""
+    
+    feature_name = 'MP4快速启动封装'
+    # 批量处理任务的计数项
+    job_counters = (('remuxed', '重新封装'), ('failed', '失败'))
+    
+    def __init__(self, record_file_path: str = None):
+        super().__init__()
+        # 与目录索引放在一起：{abs_path: {size, mtime, status, error, checked_at}}
+        # status: faststart（原本就是）/ remuxed（已重新封装）/ failed / unsupported（不是MP4）
+        self.record_file_path = record_file_path or os.path.join(CACHE_DIR, 'video_catalog', 'faststart.json')
+        self._dirty = False
+        self.records = {}
+        self.load_records()
+    
+    def load_records(self):
+        """加载处理记录"""
+        self.records = {}
+        if not os.path.exists(self.record_file_path):
+            return
+        try:
+            with open(self.record_file_path, 'r', encoding='utf-8') as f:
+                self.records = json.load(f)
+        except Exception as e:
+            print(f"加载faststart记录失败: {e}")
+            self.records = {}
+    
+    def save_records(self) -> bool:
+        """原子写入处理记录"""
+        with self._lock:
+            if not self._dirty:
+                return True
+            try:
+                os.makedirs(os.path.dirname(self.record_file_path), exist_ok=True)
+                # 临时文件名带进程号，下载脚本与应用同时写记录时不会替换成对方写了一半的文件
+                tmp_path = f"{self.record_file_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.records, f, ensure_ascii=False)
+                os.replace(tmp_path, self.record_file_path)
+                self._dirty = False
+                return True
+            except Exception as e:
+                print(f"保存faststart记录失败: {e}")
+                return False
+    
+    def _record(self, path: str, status: str, error: str = None):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            self.records[path] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'status': status,
+                'error': error,
+                'checked_at': time.time()
+            }
+            self._dirty = True
+    
+    def get_record(self, video_path: str) -> Optional[Dict]:
+        """文件未变化时返回处理记录，否则返回None"""
+        path = os.path.abspath(video_path)
+        record = self.records.get(path)
+        if not record:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if record['size'] != stat.st_size or record['mtime'] != stat.st_mtime:
+            return None
+        return record
+    
+    def ensure_faststart(self, video_path: str, retry_failed: bool = False, save: bool = True) -> str:
+        """
+        确保单个文件为faststart布局
+        
+        Returns:
+            str: 'faststart' | 'remuxed' | 'failed' | 'unsupported' | 'unavailable'（需要封装但没有ffmpeg）
+        """
+        path = os.path.abspath(video_path)
+        record = self.get_record(path)
+        if record and (record['status'] != 'failed' or not retry_failed):
+            return record['status']
+        
+        if not path.lower().endswith(FASTSTART_EXTENSIONS):
+            status = 'unsupported'
+            self._record(path, status)
+        else:
+            layout = inspect_mp4_layout(path)
+            if layout is None:
+                status = 'unsupported'
+                self._record(path, status)
+            elif layout == 'faststart':
+                status = 'faststart'
+                self._record(path, status)
+            elif not self.ffmpeg_available:
+                # 不记录，安装ffmpeg后再处理
+                return 'unavailable'
+            else:
+                status = self._remux(path)
+        if save:
+            self.save_records()
+        return status
+    
+    def _remux(self, path: str) -> str:
+        """流复制重新封装到同目录临时文件，校验后原子替换原文件"""
+        # 临时文件不使用视频扩展名，避免被目录扫描当作视角
+        tmp_path = f"{path}.faststart.tmp"
+        cmd = [
+            FFMPEG_BIN, '-v', 'error', '-y',
+            '-i', path,
+            # 保留所有轨道（字幕、数据、timecode等），只调整moov位置
+            '-map', '0', '-map_metadata', '0',
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            '-f', 'mp4',
+            tmp_path
+        ]
+        started = time.time()
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=FASTSTART_FFMPEG_TIMEOUT)
+            if result.returncode != 0 or not os.path.exists(tmp_path):
+                raise RuntimeError(result.stderr.strip() or f"ffmpeg退出码 {result.returncode}")
+            if inspect_mp4_layout(tmp_path) != 'faststart':
+                raise RuntimeError('封装结果不是faststart布局')
+            os.replace(tmp_path, path)
+            self._record(path, 'remuxed')
+            with self._lock:
+                self.stats['generated'] += 1
+            print(f"已重新封装为faststart: {path}（耗时 {time.time() - started:.1f}s）")
+            return 'remuxed'
+        except Exception as e:
+            error = '封装超时' if isinstance(e, subprocess.TimeoutExpired) else str(e)
+            print(f"faststart封装失败 {path}: {error}")
+            self._record(path, 'failed', error[:500])
+            with self._lock:
+                self.stats['failed'] += 1
+            return 'failed'
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    def collect_video_files(self, root: str) -> List[str]:
+        """递归收集目录（或单个文件）下可处理的视频文件，跳过隐藏目录"""
+        if os.path.isfile(root):
+            return [root] if root.lower().endswith(FASTSTART_EXTENSIONS) else []
+        files = []
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names[:] = [d for d in dir_names if not d.startswith('.')]
+            for file_name in file_names:
+                if not file_name.startswith('.') and file_name.lower().endswith(FASTSTART_EXTENSIONS):
+                    files.append(os.path.join(dir_path, file_name))
+        return files
+    
+    def process_paths(self, paths: List[str], workers: int = None) -> Dict[str, int]:
+        """
+        并行处理多个文件（同步执行），已记录且未变化的直接跳过
+        
+        Returns:
+            Dict: 各结果的数量
+        """
+        counts = {}
+        
+        def process_one(path):
+            status = self.ensure_faststart(path, save=False)
+            with self._lock:
+                counts[status] = counts.get(status, 0) + 1
+            self._count_job(status)
+            if status in ('remuxed', 'failed'):
+                # 封装耗时远大于写记录，每处理一个就保存，进程中断也不会重复封装
+                self.save_records()
+        
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers or FASTSTART_WORKERS)) as executor:
+                list(executor.map(process_one, paths))
+        finally:
+            self.save_records()
+        return counts
+    
+    def start_background_job(self, video_names: List[str] = None) -> bool:
+        """
+        后台处理所有（或指定）视频的视角文件
+        
+        Returns:
+            bool: 是否启动了新任务（已有任务运行时返回False）
+        """
+        if self.job_status['running']:
+            return False
+        if video_names is None:
+            if not video_path_manager.video_cache:
+                video_path_manager.scan_video_directory()
+            video_names = list(video_path_manager.video_cache.keys())
+        paths = []
+        for video_name in video_names:
+            for perspective in video_path_manager.get_available_perspectives(video_name):
+                path = video_path_manager.get_media_file(video_name, perspective)
+                if path:
+                    paths.append(path)
+        
+        if not self._start_job_thread(len(paths), self.process_paths, (paths,), name='video-faststart'):
+            return False
+        print(f"开始检查MP4快速启动布局，共 {len(paths)} 个文件")
+        return True
+    
+    def get_status(self) -> Dict:
+        """返回记录统计与批量任务状态"""
+        with self._lock:
+            counts = {}
+            for record in self.records.values():
+                counts[record['status']] = counts.get(record['status'], 0) + 1
+            return {**super().get_status(), 'records': counts}
+
+# 全局faststart管理器实例
+video_faststart_manager = VideoFaststartManager()
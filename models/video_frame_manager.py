@@ -0,0 +1,245 @@
+"""
+视频帧截图管理器
+按 (视角文件, 时间点, 格式, 宽度) 精确截取单帧图片（JPEG/WebP），按内容寻址缓存在磁盘上；
+支持遍历整个答题/构造文件，并行预先生成cut_point与提问视角_time的截图
+"""
+
+import os
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .ffmpeg_job_manager import FFmpegJobManager, FFMPEG_BIN
+from .video_path_manager import video_path_manager, CACHE_DIR
+from .video_clip_manager import time_to_seconds
+
+# 默认输出格式与宽度（像素，0表示原始分辨率），宽度上限
+FRAME_FORMAT = os.environ.get('FRAME_FORMAT', 'jpg')
+FRAME_WIDTH = int(os.environ.get('FRAME_WIDTH', 640))
+FRAME_MAX_WIDTH = int(os.environ.get('FRAME_MAX_WIDTH', 1920))
+# 批量预生成的并发数
+FRAME_WORKERS = int(os.environ.get('FRAME_WORKERS', 4))
+FRAME_FFMPEG_TIMEOUT = int(os.environ.get('FRAME_FFMPEG_TIMEOUT', 60))
+
+FRAME_FORMATS = ('jpg', 'webp')
+FRAME_MIMETYPES = {'jpg': 'image/jpeg', 'webp': 'image/webp'}
+
+
+def _as_list(value) -> List[str]:
+    """视角字段可能是列表或单个字符串"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [v for v in value if isinstance(v, str) and v]
+
+
+def collect_frame_targets(qas: Iterable[Dict]) -> List[Tuple[str, str, float]]:
+    """
+    从答题/构造数据中收集需要截图的时间点（去重）
+    
+    - cut_point：主视角（构造数据的"主视角"，答题数据的"视角"）的每个视角
+    - 提问视角_time：提问视角
+    
+    Returns:
+        List[Tuple]: [(video_name, perspective, seconds)]
+    """
+    targets = []
+    seen = set()
+    for qa in qas:
+        video_name = qa.get('video_name')
+        if not video_name:
+            continue
+        pairs = []
+        cut_point = time_to_seconds(qa.get('cut_point'))
+        if cut_point is not None:
+            for perspective in _as_list(qa.get('主视角') or qa.get('视角')):
+                pairs.append((perspective, cut_point))
+        question_time = time_to_seconds(qa.get('提问视角_time'))
+        if question_time is not None:
+            for perspective in _as_list(qa.get('提问视角')):
+                pairs.append((perspective, question_time))
+        for perspective, seconds in pairs:
+            target = (video_name, perspective, round(seconds, 3))
+            if target not in seen:
+                seen.add(target)
+                targets.append(target)
+    return targets
+
+
+class VideoFrameManager(FFmpegJobManager):
+    """单帧截图管理器（内容寻址磁盘缓存）"""
+    
+    feature_name = '视频截图'
+    stat_keys = ('hits', 'misses', 'coalesced', 'generated', 'failed')
+    # 批量预生成任务的计数项
+    job_counters = (('generated', '新生成'), ('failed', '失败'))
+    
+    def __init__(self, cache_dir: str = None):
+        super().__init__()
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'frames')
+        self._inflight = {}  # frame_name -> threading.Event
+    
+    def normalize_options(self, image_format: str = None, width=None) -> Optional[Tuple[str, int]]:
+        """校验格式与宽度，非法时返回None"""
+        image_format = (image_format or FRAME_FORMAT).lower()
+        if image_format == 'jpeg':
+            image_format = 'jpg'
+        if image_format not in FRAME_FORMATS:
+            return None
+        try:
+            width = FRAME_WIDTH if width in (None, '') else int(width)
+        except (TypeError, ValueError):
+            return None
+        if width < 0:
+            return None
+        return image_format, min(width, FRAME_MAX_WIDTH)
+    
+    def _frame_name(self, source_path: str, source_stat, seconds: float, image_format: str, width: int) -> str:
+        # 源文件大小与mtime参与计算，源文件被替换后自然失效
+        key = f"{os.path.abspath(source_path)}|{source_stat.st_size}|{source_stat.st_mtime}|{seconds:.3f}|{width}"
+        return f"{hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]}.{image_format}"
+    
+    def _locate(self, video_name: str, perspective: str, seconds: float,
+                image_format: str, width: int) -> Optional[Tuple[str, str]]:
+        """(视角, 时间点, 参数) -> (源文件路径, 截图缓存路径)"""
+        source_path = video_path_manager.get_media_file(video_name, perspective)
+        if not source_path:
+            return None
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return None
+        frame_name = self._frame_name(source_path, source_stat, seconds, image_format, width)
+        return source_path, os.path.join(self.cache_dir, frame_name)
+    
+    def get_frame(self, video_name: str, perspective: str, seconds: float,
+                  image_format: str = None, width: int = None) -> Optional[str]:
+        """
+        获取单帧截图（不存在时截取）
+        
+        Returns:
+            str: 截图文件路径，视角不存在、时间超出视频或截取失败返回None
+        """
+        options = self.normalize_options(image_format, width)
+        if not options or seconds is None or seconds < 0:
+            return None
+        image_format, width = options
+        seconds = round(seconds, 3)
+        located = self._locate(video_name, perspective, seconds, image_format, width)
+        if not located:
+            return None
+        source_path, frame_path = located
+        frame_name = os.path.basename(frame_path)
+        
+        while True:
+            if os.path.exists(frame_path):
+                with self._lock:
+                    self.stats['hits'] += 1
+                return frame_path
+            if not self.ffmpeg_available:
+                return None
+            with self._lock:
+                event = self._inflight.get(frame_name)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[frame_name] = event
+                    self.stats['misses'] += 1
+                    break
+                self.stats['coalesced'] += 1
+            # 同一截图正在生成，等待完成
+            event.wait()
+            if not os.path.exists(frame_path):
+                return None
+        
+        try:
+            return frame_path if self._extract(source_path, frame_path, seconds, image_format, width) else None
+        finally:
+            with self._lock:
+                self._inflight.pop(frame_name, None)
+            event.set()
+    
+    def _extract(self, source_path: str, frame_path: str, seconds: float, image_format: str, width: int) -> bool:
+        """运行ffmpeg截取单帧（-ss放在-i之前快速定位，再解码到精确时间点）"""
+        tmp_path = f"{frame_path[:-len(image_format) - 1]}.tmp.{image_format}"
+        cmd = [FFMPEG_BIN, '-v', 'error', '-y', '-ss', f'{seconds:.3f}', '-i', source_path,
+               '-frames:v', '1', '-an']
+        if width:
+            cmd += ['-vf', f'scale={width}:-2']
+        if image_format == 'webp':
+            cmd += ['-c:v', 'libwebp', '-quality', '80']
+        else:
+            cmd += ['-q:v', '3']
+        cmd.append(tmp_path)
+        
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=FRAME_FFMPEG_TIMEOUT)
+            if result.returncode != 0 or not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+                # 时间点超出视频长度时ffmpeg正常退出但没有输出
+                print(f"截取视频帧失败 {source_path} @{seconds}: {result.stderr.strip() or '没有输出'}")
+                with self._lock:
+                    self.stats['failed'] += 1
+                return False
+            os.replace(tmp_path, frame_path)
+            with self._lock:
+                self.stats['generated'] += 1
+            return True
+        except subprocess.TimeoutExpired:
+            print(f"截取视频帧超时: {source_path} @{seconds}")
+            with self._lock:
+                self.stats['failed'] += 1
+            return False
+        except Exception as e:
+            print(f"截取视频帧失败: {e}")
+            with self._lock:
+                self.stats['failed'] += 1
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    def start_precompute(self, qas: Iterable[Dict], image_format: str = None, width: int = None,
+                         workers: int = None) -> bool:
+        """
+        后台并行为答题/构造数据中的cut_point与提问视角_time生成截图，已缓存的直接跳过
+        
+        Returns:
+            bool: 是否启动了新任务（已有任务运行或ffmpeg不可用时返回False）
+        """
+        if not self.ffmpeg_available:
+            return False
+        options = self.normalize_options(image_format, width)
+        if not options:
+            return False
+        targets = collect_frame_targets(qas)
+        if not self._start_job_thread(len(targets), self._run_precompute,
+                                      (targets, options, max(1, workers or FRAME_WORKERS)),
+                                      name='video-frame-precompute'):
+            return False
+        print(f"开始预生成视频截图，共 {len(targets)} 个时间点")
+        return True
+    
+    def _run_precompute(self, targets: List[Tuple[str, str, float]], options: Tuple[str, int], workers: int):
+        image_format, width = options
+        
+        def extract_one(target):
+            video_name, perspective, seconds = target
+            located = self._locate(video_name, perspective, seconds, image_format, width)
+            cached = bool(located) and os.path.exists(located[1])
+            frame_path = self.get_frame(video_name, perspective, seconds, image_format, width)
+            if frame_path is None:
+                self._count_job('failed')
+            else:
+                self._count_job(None if cached else 'generated')
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(extract_one, targets))
+
+# 全局视频截图管理器实例
+video_frame_manager = VideoFrameManager()
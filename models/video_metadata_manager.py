@@ -0,0 +1,380 @@
+"""
+视频元数据管理器
+使用ffprobe探测每个视角文件的时长、帧率、分辨率、编码和关键帧间隔，
+结果按 (路径, 大小, mtime) 缓存，文件未变化时不再重复探测
+"""
+
+import os
+import json
+import time
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .ffmpeg_job_manager import FFPROBE_BIN
+from .video_path_manager import video_path_manager, CACHE_DIR
+
+# ffprobe探测参数
+FFPROBE_TIMEOUT = int(os.environ.get('FFPROBE_TIMEOUT', 60))
+# 估算关键帧间隔时只读取开头这么多秒的packet（不解码），避免长视频全文件扫描
+KEYFRAME_PROBE_SECONDS = float(os.environ.get('KEYFRAME_PROBE_SECONDS', 30))
+# 后台批量探测的并发数
+METADATA_PROBE_WORKERS = int(os.environ.get('METADATA_PROBE_WORKERS', 4))
+
+
+def _parse_rate(rate: Optional[str]) -> Optional[float]:
+    """解析ffprobe的帧率字符串，如 '30000/1001'"""
+    if not rate:
+        return None
+    try:
+        if '/' in rate:
+            num, den = rate.split('/', 1)
+            return float(num) / float(den) if float(den) else None
+        return float(rate)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _parse_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class VideoMetadataManager:
+    """视频元数据管理器（ffprobe结果缓存）"""
+    
+    def __init__(self, cache_file_path: str = None):
+        # 追加写入的缓存日志，每行一条探测结果；加载时同一路径以最后一条为准
+        self.cache_file_path = cache_file_path or os.path.join(CACHE_DIR, 'video_metadata.jsonl')
+        self.metadata = {}  # abs_path -> {size, mtime, metadata}
+        self._log_entries = 0
+        self._lock = threading.RLock()
+        self._inflight = {}  # abs_path -> threading.Event，合并同一文件的并发探测
+        self.ffprobe_available = shutil.which(FFPROBE_BIN) is not None
+        # 后台批量探测任务状态
+        self.job_status = {'running': False, 'total': 0, 'done': 0, 'probed': 0, 'failed': 0,
+                           'started_at': None, 'finished_at': None}
+        self._job_thread = None
+        
+        if not self.ffprobe_available:
+            print(f"警告: 找不到 {FFPROBE_BIN}，视频元数据探测不可用")
+        self.load_cache()
+    
+    def load_cache(self):
+        """从缓存日志加载探测结果"""
+        self.metadata = {}
+        self._log_entries = 0
+        if not os.path.exists(self.cache_file_path):
+            return
+        try:
+            with open(self.cache_file_path, 'r', encoding='utf-8') as f:
+                for line_num, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程中断可能留下不完整的最后一行
+                        print(f"跳过损坏的元数据缓存行 {line_num}")
+                        continue
+                    self.metadata[entry['path']] = entry
+                    self._log_entries += 1
+            print(f"已加载 {len(self.metadata)} 条视频元数据缓存")
+        except Exception as e:
+            print(f"加载视频元数据缓存失败: {e}")
+            self.metadata = {}
+    
+    def _append_entry(self, entry: Dict):
+        """追加一条探测结果，日志过长时压缩"""
+        with self._lock:
+            self.metadata[entry['path']] = entry
+            try:
+                os.makedirs(os.path.dirname(self.cache_file_path) or '.', exist_ok=True)
+                with open(self.cache_file_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                self._log_entries += 1
+            except Exception as e:
+                print(f"写入视频元数据缓存失败: {e}")
+                return
+            if self._log_entries > max(1000, 2 * len(self.metadata)):
+                self.compact_cache()
+    
+    def compact_cache(self) -> bool:
+        """把缓存日志重写为每个文件一行"""
+        with self._lock:
+            try:
+                tmp_path = f"{self.cache_file_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for entry in self.metadata.values():
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                os.replace(tmp_path, self.cache_file_path)
+                self._log_entries = len(self.metadata)
+                return True
+            except Exception as e:
+                print(f"压缩视频元数据缓存失败: {e}")
+                return False
+    
+    def probe(self, video_path: str) -> Optional[Dict]:
+        """
+        调用ffprobe探测单个视频文件（不使用缓存）
+        
+        Returns:
+            Dict: {duration, fps, width, height, codec, bit_rate, format, keyframe_interval}，失败返回None
+        """
+        if not self.ffprobe_available:
+            return None
+        try:
+            cmd = [
+                FFPROBE_BIN,
+                '-v', 'quiet',
+                '-print_format', 'json',
+                '-show_format',
+                '-show_streams',
+                '-select_streams', 'v:0',
+                video_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=FFPROBE_TIMEOUT)
+            if result.returncode != 0:
+                print(f"ffprobe探测失败 {video_path}: {result.stderr}")
+                return None
+            
+            info = json.loads(result.stdout)
+            streams = info.get('streams', [])
+            if not streams:
+                print(f"文件不包含视频流: {video_path}")
+                return None
+            stream = streams[0]
+            format_info = info.get('format', {})
+            
+            duration = _parse_float(format_info.get('duration')) or _parse_float(stream.get('duration'))
+            fps = _parse_rate(stream.get('avg_frame_rate')) or _parse_rate(stream.get('r_frame_rate'))
+            
+            return {
+                'duration': duration,
+                'fps': fps,
+                'width': stream.get('width'),
+                'height': stream.get('height'),
+                'codec': stream.get('codec_name'),
+                'bit_rate': _parse_float(format_info.get('bit_rate')),
+                'format': format_info.get('format_name'),
+                'keyframe_interval': self._probe_keyframe_interval(video_path)
+            }
+        except subprocess.TimeoutExpired:
+            print(f"ffprobe探测超时: {video_path}")
+            return None
+        except Exception as e:
+            print(f"ffprobe探测失败 {video_path}: {e}")
+            return None
+    
+    def _probe_keyframe_interval(self, video_path: str) -> Optional[float]:
+        """根据开头一段packet的关键帧标记估算平均关键帧间隔（秒）"""
+        try:
+            cmd = [
+                FFPROBE_BIN,
+                '-v', 'quiet',
+                '-print_format', 'json',
+                '-select_streams', 'v:0',
+                '-read_intervals', f'%+{KEYFRAME_PROBE_SECONDS}',
+                '-show_entries', 'packet=pts_time,flags',
+                video_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=FFPROBE_TIMEOUT)
+            if result.returncode != 0:
+                return None
+            packets = json.loads(result.stdout).get('packets', [])
+            key_times = sorted(
+                t for t in (_parse_float(p.get('pts_time')) for p in packets if 'K' in p.get('flags', ''))
+                if t is not None
+            )
+            if len(key_times) < 2:
+                return None
+            return round((key_times[-1] - key_times[0]) / (len(key_times) - 1), 3)
+        except Exception:
+            return None
+    
+    def find_keyframe_before(self, video_path: str, time_seconds: float) -> Optional[float]:
+        """
+        查找time_seconds处或之前最近的视频关键帧时间（秒，相对文件起点，与ffmpeg -ss一致）
+        
+        只读取 [time_seconds - KEYFRAME_PROBE_SECONDS, time_seconds] 的packet，不解码；找不到返回None
+        """
+        if not self.ffprobe_available:
+            return None
+        try:
+            cmd = [
+                FFPROBE_BIN,
+                '-v', 'quiet',
+                '-print_format', 'json',
+                '-select_streams', 'v:0',
+                '-read_intervals', f'{max(0.0, time_seconds - KEYFRAME_PROBE_SECONDS):.3f}%{time_seconds + 0.001:.3f}',
+                '-show_entries', 'packet=pts_time,flags:format=start_time',
+                video_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=FFPROBE_TIMEOUT)
+            if result.returncode != 0:
+                return None
+            info = json.loads(result.stdout)
+            start_time = _parse_float(info.get('format', {}).get('start_time')) or 0.0
+            key_times = [
+                t - start_time
+                for t in (_parse_float(p.get('pts_time')) for p in info.get('packets', []) if 'K' in p.get('flags', ''))
+                if t is not None and t - start_time <= time_seconds + 0.001
+            ]
+            return max(0.0, max(key_times)) if key_times else None
+        except Exception as e:
+            print(f"查找关键帧失败 {video_path} @{time_seconds}: {e}")
+            return None
+    
+    def get_metadata(self, video_path: str) -> Optional[Dict]:
+        """
+        获取单个文件的元数据：缓存的 (大小, mtime) 与文件一致时直接返回，否则探测并写入缓存
+        """
+        path = os.path.abspath(video_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        
+        while True:
+            with self._lock:
+                entry = self.metadata.get(path)
+                if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                    return entry['metadata']
+                event = self._inflight.get(path)
+                if event is None:
+                    # 由当前线程负责探测
+                    event = threading.Event()
+                    self._inflight[path] = event
+                    break
+            # 其他线程正在探测同一文件，等待其结果
+            event.wait()
+            with self._lock:
+                entry = self.metadata.get(path)
+                if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                    return entry['metadata']
+                if path not in self._inflight:
+                    # 探测失败，不重复尝试
+                    return None
+        
+        try:
+            metadata = self.probe(path)
+            if metadata is not None:
+                self._append_entry({
+                    'path': path,
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'probed_at': time.time(),
+                    'metadata': metadata
+                })
+            return metadata
+        finally:
+            with self._lock:
+                self._inflight.pop(path, None)
+            event.set()
+    
+    def _perspective_files(self, video_name: str) -> Dict[str, str]:
+        """video_name -> {视角文件名: 路径}"""
+        video_info = video_path_manager.get_video_info(video_name)
+        if not video_info:
+            return {}
+        if video_info['type'] == 'single':
+            return {video_info['files'][0]: video_info['path']}
+        return {f: os.path.join(video_info['path'], f) for f in video_info['files']}
+    
+    def get_video_metadata(self, video_name: str, perspective: str = None) -> Optional[Dict]:
+        """
+        获取视频各视角的元数据（缺失的按需探测）
+        
+        Returns:
+            Dict: {视角文件名: 元数据或None}；视频不存在返回None
+        """
+        files = self._perspective_files(video_name)
+        if not files:
+            return None
+        if perspective:
+            if perspective not in files:
+                return None
+            files = {perspective: files[perspective]}
+        return {name: self.get_metadata(path) for name, path in files.items()}
+    
+    def start_background_probe(self, video_names: List[str] = None, workers: int = None) -> bool:
+        """
+        后台并行探测所有（或指定）视频的视角文件，已缓存且未变化的文件直接跳过
+        
+        Returns:
+            bool: 是否启动了新任务（已有任务运行或ffprobe不可用时返回False）
+        """
+        if not self.ffprobe_available:
+            return False
+        with self._lock:
+            if self.job_status['running']:
+                return False
+            if video_names is None:
+                if not video_path_manager.video_cache:
+                    video_path_manager.scan_video_directory()
+                video_names = list(video_path_manager.video_cache.keys())
+            paths = []
+            for video_name in video_names:
+                paths.extend(self._perspective_files(video_name).values())
+            self.job_status = {'running': True, 'total': len(paths), 'done': 0, 'probed': 0, 'failed': 0,
+                               'started_at': time.time(), 'finished_at': None}
+        
+        self._job_thread = threading.Thread(
+            target=self._run_background_probe,
+            args=(paths, max(1, workers or METADATA_PROBE_WORKERS)),
+            name='video-metadata-probe',
+            daemon=True
+        )
+        self._job_thread.start()
+        print(f"开始后台探测视频元数据，共 {len(paths)} 个文件")
+        return True
+    
+    def _run_background_probe(self, paths: List[str], workers: int):
+        def probe_one(path):
+            cached = self.is_cached(path)
+            metadata = self.get_metadata(path)
+            with self._lock:
+                self.job_status['done'] += 1
+                if metadata is None:
+                    self.job_status['failed'] += 1
+                elif not cached:
+                    self.job_status['probed'] += 1
+        
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(probe_one, paths))
+        except Exception as e:
+            print(f"后台探测视频元数据失败: {e}")
+        finally:
+            with self._lock:
+                self.job_status['running'] = False
+                self.job_status['finished_at'] = time.time()
+            print(f"视频元数据探测完成: 新探测 {self.job_status['probed']}，失败 {self.job_status['failed']}")
+    
+    def is_cached(self, video_path: str) -> bool:
+        """文件的元数据是否已缓存且仍然有效"""
+        path = os.path.abspath(video_path)
+        entry = self.metadata.get(path)
+        if not entry:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+    
+    def get_status(self) -> Dict:
+        """返回缓存与后台任务状态"""
+        return {
+            'ffprobe_available': self.ffprobe_available,
+            'cached_files': len(self.metadata),
+            'job': dict(self.job_status)
+        }
+
+# 全局视频元数据管理器实例
+video_metadata_manager = VideoMetadataManager()
@@ -0,0 +1,235 @@
+"""
+多视角拼接预览管理器
+把同一video_name的所有视角按时间对齐拼成一个带视角标签的低分辨率网格视频（每个视频缓存一份），
+构造模式选择主视角/提问视角时只需播放一路视频，浏览器无需同时打开N个解码器
+"""
+
+import os
+import re
+import json
+import math
+import time
+import shutil
+import hashlib
+import subprocess
+from typing import Dict, List, Optional
+
+from .ffmpeg_job_manager import FFmpegJobManager, FFMPEG_BIN
+from .video_path_manager import video_path_manager, CACHE_DIR
+from .video_metadata_manager import video_metadata_manager
+
+# 拼接参数：单格宽度（像素，高度按第一个视角的宽高比）、输出帧率、最多拼接的视角数
+MOSAIC_TILE_WIDTH = int(os.environ.get('MOSAIC_TILE_WIDTH', 480))
+MOSAIC_FPS = int(os.environ.get('MOSAIC_FPS', 15))
+MOSAIC_MAX_TILES = int(os.environ.get('MOSAIC_MAX_TILES', 16))
+MOSAIC_CRF = int(os.environ.get('MOSAIC_CRF', 30))
+# drawtext使用的字体文件（中文视角名需要指定支持中文的字体），为空时使用ffmpeg默认字体
+MOSAIC_FONT_FILE = os.environ.get('MOSAIC_FONT_FILE', '')
+# 同时运行的ffmpeg拼接任务数
+MOSAIC_WORKERS = int(os.environ.get('MOSAIC_WORKERS', 1))
+MOSAIC_FFMPEG_TIMEOUT = int(os.environ.get('MOSAIC_FFMPEG_TIMEOUT', 4 * 3600))
+
+MOSAIC_NAME_PATTERN = re.compile(r'^[0-9a-f]{24}\.mp4$')
+
+
+def _quote_filter_path(path: str) -> str:
+    """把文件路径包在filtergraph的单引号中（引号内的单引号需先闭合再转义）"""
+    return "'" + path.replace('\\', '/').replace("'", "'\\''") + "'"
+
+
+class VideoMosaicManager(FFmpegJobManager):
+    """多视角拼接预览管理器"""
+    
+    feature_name = '多视角拼接预览'
+    
+    def __init__(self, cache_dir: str = None, workers: int = None):
+        super().__init__(workers or MOSAIC_WORKERS, 'mosaic')
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'mosaics')
+        self._index_cache = {}  # key -> index
+    
+    def _sources(self, video_name: str) -> List[Dict]:
+        """video_name -> [{perspective, path, stat}]，按视角文件名排序，最多MOSAIC_MAX_TILES个"""
+        sources = []
+        for perspective in sorted(video_path_manager.get_available_perspectives(video_name))[:MOSAIC_MAX_TILES]:
+            path = video_path_manager.get_media_file(video_name, perspective)
+            if not path:
+                continue
+            try:
+                sources.append({'perspective': perspective, 'path': path, 'stat': os.stat(path)})
+            except OSError:
+                continue
+        return sources
+    
+    def _key(self, video_name: str, sources: List[Dict]) -> str:
+        # 所有视角文件与拼接参数都参与计算，任一视角被替换或增减都会重新拼接
+        parts = [video_name, f"{MOSAIC_TILE_WIDTH}|{MOSAIC_FPS}|{MOSAIC_CRF}|{MOSAIC_FONT_FILE}"]
+        for source in sources:
+            parts.append(f"{os.path.abspath(source['path'])}|{source['stat'].st_size}|{source['stat'].st_mtime}")
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:24]
+    
+    def _load_index(self, key: str) -> Optional[Dict]:
+        if key in self._index_cache:
+            return self._index_cache[key]
+        index_path = os.path.join(self.cache_dir, f"{key}.json")
+        if not os.path.exists(index_path) or not os.path.exists(os.path.join(self.cache_dir, f"{key}.mp4")):
+            return None
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self._index_cache[key] = index
+            return index
+        except Exception as e:
+            print(f"读取拼接预览索引失败 {key}: {e}")
+            return None
+    
+    def get_mosaic(self, video_name: str, generate: bool = True) -> Optional[Dict]:
+        """
+        获取视频的多视角拼接预览；尚未生成时提交后台任务
+        
+        Returns:
+            Dict: {status: 'ready'|'pending'|'running'|'failed'|'unavailable'|'missing', ...索引字段}
+                  视频不存在或没有可用视角返回None
+        """
+        sources = self._sources(video_name)
+        if not sources:
+            return None
+        key = self._key(video_name, sources)
+        
+        index = self._load_index(key)
+        if index:
+            return {'status': 'ready', **index}
+        if not self.ffmpeg_available:
+            return {'status': 'unavailable'}
+        
+        with self._lock:
+            state = self.jobs.get(key)
+            if state is None and generate:
+                state = self._submit_job(key, self._generate, key, video_name, sources)
+        return {'status': state or 'missing'}
+    
+    def _layout(self, count: int, tile_width: int, tile_height: int) -> List[Dict]:
+        """接近正方形的网格：列数 ceil(sqrt(N))，按行优先排列"""
+        columns = int(math.ceil(math.sqrt(count)))
+        return [{'x': (i % columns) * tile_width, 'y': (i // columns) * tile_height,
+                 'width': tile_width, 'height': tile_height} for i in range(count)]
+    
+    def _generate(self, key: str, video_name: str, sources: List[Dict]) -> bool:
+        """调用ffmpeg把各视角缩放、加标签后用xstack拼成网格视频，并写出JSON索引"""
+        # 单格高度按第一个视角的宽高比计算，其他视角等比缩放后居中补黑边
+        metadata = video_metadata_manager.get_metadata(sources[0]['path']) or {}
+        if metadata.get('width') and metadata.get('height'):
+            tile_height = max(2, int(round(MOSAIC_TILE_WIDTH * metadata['height'] / metadata['width'] / 2)) * 2)
+        else:
+            tile_height = max(2, int(round(MOSAIC_TILE_WIDTH * 9 / 16 / 2)) * 2)
+        tile_width = MOSAIC_TILE_WIDTH
+        tiles = self._layout(len(sources), tile_width, tile_height)
+        columns = int(math.ceil(math.sqrt(len(sources))))
+        rows = int(math.ceil(len(sources) / columns))
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = os.path.join(self.cache_dir, f"{key}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir, exist_ok=True)
+        
+        cmd = [FFMPEG_BIN, '-v', 'error', '-y']
+        filters = []
+        font = f":fontfile={_quote_filter_path(MOSAIC_FONT_FILE)}" if MOSAIC_FONT_FILE else ''
+        for i, source in enumerate(sources):
+            cmd += ['-i', source['path']]
+            # 标签写入文件再用textfile引用，避免视角名中的特殊字符破坏filtergraph
+            label_path = os.path.join(tmp_dir, f"label_{i}.txt")
+            with open(label_path, 'w', encoding='utf-8') as f:
+                f.write(os.path.splitext(source['perspective'])[0])
+            filters.append(
+                f"[{i}:v]fps={MOSAIC_FPS},"
+                f"scale={tile_width}:{tile_height}:force_original_aspect_ratio=decrease,"
+                f"pad={tile_width}:{tile_height}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+                f"drawtext=textfile={_quote_filter_path(os.path.abspath(label_path))}{font}:"
+                f"x=6:y=6:fontsize=18:fontcolor=white:box=1:boxcolor=black@0.6:boxborderw=4[v{i}]"
+            )
+        if len(sources) > 1:
+            layout = '|'.join(f"{tile['x']}_{tile['y']}" for tile in tiles)
+            inputs = ''.join(f"[v{i}]" for i in range(len(sources)))
+            filters.append(f"{inputs}xstack=inputs={len(sources)}:layout={layout}:fill=black[out]")
+            output_label = '[out]'
+        else:
+            output_label = '[v0]'
+        
+        tmp_path = os.path.join(tmp_dir, 'mosaic.mp4')
+        cmd += [
+            '-filter_complex', ';'.join(filters),
+            '-map', output_label, '-an',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(MOSAIC_CRF),
+            '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            tmp_path
+        ]
+        
+        started = time.time()
+        try:
+            try:
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=MOSAIC_FFMPEG_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                print(f"生成拼接预览超时: {video_name}")
+                return False
+            if result.returncode != 0 or not os.path.exists(tmp_path):
+                print(f"生成拼接预览失败 {video_name}: {result.stderr.strip()}")
+                return False
+            
+            index = {
+                'key': key,
+                'url': f"/mosaics/{key}.mp4",
+                'width': columns * tile_width,
+                'height': rows * tile_height,
+                'tiles': [{'perspective': source['perspective'], **tile} for source, tile in zip(sources, tiles)]
+            }
+            os.replace(tmp_path, os.path.join(self.cache_dir, f"{key}.mp4"))
+            index_tmp_path = os.path.join(self.cache_dir, f"{key}.json.tmp")
+            with open(index_tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(index_tmp_path, os.path.join(self.cache_dir, f"{key}.json"))
+            with self._lock:
+                self._index_cache[key] = index
+            print(f"已生成拼接预览 {video_name}: {len(sources)} 个视角，耗时 {time.time() - started:.1f}s")
+            return True
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    def start_background_job(self, video_names: List[str] = None) -> int:
+        """
+        为所有（或指定）多视角视频提交拼接任务，已生成的跳过，失败的重试
+        
+        Returns:
+            int: 排队中/生成中的任务数
+        """
+        if not self.ffmpeg_available:
+            return 0
+        if video_names is None:
+            if not video_path_manager.video_cache:
+                video_path_manager.scan_video_directory()
+            video_names = [name for name, info in video_path_manager.video_cache.items()
+                           if info['type'] == 'multi']
+        
+        self._clear_failed_jobs()
+        
+        queued = 0
+        for video_name in video_names:
+            result = self.get_mosaic(video_name)
+            if result and result['status'] in ('pending', 'running'):
+                queued += 1
+        print(f"拼接预览任务: {queued} 个排队中")
+        return queued
+    
+    def get_file_path(self, file_name: str) -> Optional[str]:
+        """返回拼接视频文件路径（校验文件名，避免路径穿越）"""
+        if not MOSAIC_NAME_PATTERN.match(file_name):
+            return None
+        path = os.path.join(self.cache_dir, file_name)
+        return path if os.path.exists(path) else None
+    
+    def get_status(self) -> Dict:
+        """返回后台任务状态"""
+        return {**self._job_counts(), **super().get_status()}
+
+# 全局多视角拼接预览管理器实例
+video_mosaic_manager = VideoMosaicManager()
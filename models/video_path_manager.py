@@ -7,8 +7,50 @@
 
 import os
 import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
+from urllib.parse import quote
+
+# 可选依赖：watchdog（Linux下基于inotify）；不可用时回退为定时轮询
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+    FileSystemEventHandler = object
+
+# 缓存目录（视频目录索引等派生数据），与config.py中的CACHE_DIR一致
+CACHE_DIR = os.environ.get('CACHE_DIR', 'cache')
+# 目录索引文件格式版本，结构变化时递增以丢弃旧缓存
+CATALOG_FORMAT_VERSION = 2
+# 目录监听：轮询间隔（秒，仅在watchdog不可用时使用）与事件合并等待时间
+VIDEO_WATCH_POLL_INTERVAL = float(os.environ.get('VIDEO_WATCH_POLL_INTERVAL', 60))
+VIDEO_WATCH_DEBOUNCE = float(os.environ.get('VIDEO_WATCH_DEBOUNCE', 0.5))
+# 并行扫描顶层目录的线程数（网络存储上可适当调大）
+VIDEO_SCAN_WORKERS = int(os.environ.get('VIDEO_SCAN_WORKERS', 8))
+
+
+class _VideoDirEventHandler(FileSystemEventHandler):
+    """把watchdog事件转换为受影响的顶层条目，交给VideoPathManager合并处理"""
+    
+    def __init__(self, manager: 'VideoPathManager'):
+        self.manager = manager
+    
+    def on_any_event(self, event):
+        # 文件内容修改（如下载中写入）不影响目录索引，只关心增删与改名
+        if event.event_type not in ('created', 'deleted', 'moved'):
+            return
+        paths = [event.src_path]
+        if getattr(event, 'dest_path', None):
+            paths.append(event.dest_path)
+        for path in paths:
+            if event.is_directory or self.manager._is_video_file(path):
+                self.manager._on_path_changed(path)
 
 class VideoPathManager:
     """视频路径管理器"""
@@ -25,81 +67,478 @@ class VideoPathManager:
         # 严格模式：仅识别 <base>/<video_name>/*.mp4 这种结构
         # 将单文件视为单视角；不再递归 group 层（除非关闭严格模式）
         self.strict_structure = True
+        # 持久化的目录索引：记录每个顶层目录的mtime及扫描结果，重启后只重扫发生变化的目录
+        self.catalog_dir = os.path.join(CACHE_DIR, 'video_catalog')
+        self._catalog = None
+        # 目录索引版本：video_cache内容每次变化时递增，客户端据此判断是否需要重新获取视角
+        self.catalog_version = 0
+        self._lock = threading.RLock()
+        # Web路径解析缓存：(base_dir, video_name, perspective) -> web路径，随目录索引版本失效
+        self._web_path_cache = {}
+        # 目录监听状态
+        self._watch_mode = None  # None | 'inotify' | 'polling'
+        self._observer = None
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+        self._watch_wakeup = threading.Event()
+        self._pending_items = set()
+        self._pending_full_scan = False
+        # 并行扫描：线程池宽度与最近一次扫描进度
+        self.scan_workers = max(1, VIDEO_SCAN_WORKERS)
+        self.scan_progress = {'running': False, 'total': 0, 'done': 0, 'rescanned': 0,
+                              'started_at': None, 'finished_at': None}
+        self._progress_step = 1
         
     def set_base_video_dir(self, video_dir: str):
         """设置视频文件基础目录"""
-        self.base_video_dir = video_dir
-        self.video_cache.clear()  # 清除缓存
+        with self._lock:
+            self.base_video_dir = video_dir
+            self.video_cache.clear()  # 清除缓存
+            self._web_path_cache = {}
+            self._catalog = None  # 切换到新目录对应的持久化索引
         print(f"视频目录设置为: {video_dir}")
+        if self._watch_mode:
+            # 监听跟随新目录
+            self.stop_watching()
+            self.start_watching()
 
     def set_strict_structure(self, enabled: bool):
         """设置是否启用严格目录结构(<base>/<video_name>/*.mp4)"""
-        self.strict_structure = enabled
-        self.video_cache.clear()
+        with self._lock:
+            self.strict_structure = enabled
+            self.video_cache.clear()
+            self._web_path_cache = {}
+            self._catalog = None
         print(f"严格目录结构已{'启用' if enabled else '禁用'}")
         
-    def scan_video_directory(self) -> Dict[str, Dict]:
+    def _catalog_file_path(self) -> str:
+        """当前视频目录+目录结构模式对应的持久化索引文件"""
+        key = f"{os.path.abspath(self.base_video_dir)}|{'strict' if self.strict_structure else 'group'}"
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.catalog_dir, f"catalog_{digest}.json")
+    
+    def _load_catalog(self) -> Dict:
+        """读取持久化索引；不存在或不匹配时返回空索引"""
+        empty = {'format': CATALOG_FORMAT_VERSION, 'base_dir': os.path.abspath(self.base_video_dir),
+                 'strict': self.strict_structure, 'top_files': {}, 'dirs': {}, 'order': []}
+        path = self._catalog_file_path()
+        if not os.path.exists(path):
+            return empty
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                catalog = json.load(f)
+            if (catalog.get('format') != CATALOG_FORMAT_VERSION
+                    or catalog.get('base_dir') != empty['base_dir']
+                    or catalog.get('strict') != self.strict_structure):
+                return empty
+            return catalog
+        except Exception as e:
+            print(f"读取视频目录索引失败，将全量扫描: {e}")
+            return empty
+    
+    def _save_catalog(self):
+        """把目录索引写入缓存文件（原子替换）"""
+        path = self._catalog_file_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._catalog, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"保存视频目录索引失败: {e}")
+    
+    def _scan_top_level_dir(self, item: str, item_path: str, mtime: Optional[float] = None) -> Dict:
+        """
+        扫描一个顶层目录，返回可持久化的目录记录
+        
+        使用os.scandir复用目录项自带的类型信息，避免逐个文件stat
+        
+        Args:
+            item: 顶层目录名
+            item_path: 顶层目录路径
+            mtime: 已知的目录mtime（需在列目录之前获取），为None时自行stat
+        
+        Returns:
+            Dict: {mtime: float, sub_mtimes: {子目录: mtime}, entries: {video_name: info}}
+        """
+        if mtime is None:
+            mtime = os.stat(item_path).st_mtime
+        record = {'mtime': mtime, 'sub_mtimes': {}, 'entries': {}}
+        entries = record['entries']
+        
+        with os.scandir(item_path) as it:
+            dir_entries = list(it)
+        
+        # 严格模式：仅识别 <base>/<video_name>/*.mp4 结构
+        # 目录名即 video_name，目录内所有视频文件为视角文件
+        direct_video_files = [entry.name for entry in dir_entries if self._is_video_file(entry.name)]
+        if direct_video_files:
+            entries[item] = {
+                'type': 'multi',
+                'path': item_path,
+                'files': direct_video_files
+            }
+        
+        # 非严格模式下，兼容 group 层：<base>/<group>/<video_name>/<cam*.ext>
+        if not self.strict_structure:
+            for entry in dir_entries:
+                sub_item = entry.name
+                sub_item_path = os.path.join(item_path, sub_item)
+                if entry.is_dir():
+                    record['sub_mtimes'][sub_item] = entry.stat().st_mtime
+                    with os.scandir(sub_item_path) as sub_it:
+                        video_files = [sub_entry.name for sub_entry in sub_it if self._is_video_file(sub_entry.name)]
+                    if video_files:
+                        entries[sub_item] = {
+                            'type': 'multi',
+                            'path': sub_item_path,
+                            'files': video_files
+                        }
+                elif entry.is_file() and self._is_video_file(sub_item):
+                    video_name = os.path.splitext(sub_item)[0]
+                    entries[video_name] = {
+                        'type': 'single',
+                        'path': sub_item_path,
+                        'files': [sub_item]
+                    }
+        return record
+    
+    def _is_dir_record_fresh(self, item_path: str, record: Optional[Dict], mtime: Optional[float] = None) -> bool:
+        """比较目录（及group模式下的子目录）mtime，判断缓存记录是否仍然有效"""
+        if not record:
+            return False
+        try:
+            if mtime is None:
+                mtime = os.stat(item_path).st_mtime
+            if mtime != record.get('mtime'):
+                return False
+            # group模式下子目录内容变化不会改变顶层目录mtime，需要逐个比较
+            for sub_item, sub_mtime in record.get('sub_mtimes', {}).items():
+                if os.stat(os.path.join(item_path, sub_item)).st_mtime != sub_mtime:
+                    return False
+            return True
+        except OSError:
+            return False
+    
+    def _refresh_dir_record(self, entry, record: Optional[Dict]) -> Tuple[Dict, bool]:
+        """
+        校验单个顶层目录的缓存记录，过期时重新扫描（在扫描线程池中执行）
+        
+        Returns:
+            Tuple[Dict, bool]: (目录记录, 是否重新扫描)
+        """
+        # 先取mtime再列目录，扫描期间发生的变化会在下次扫描时被发现
+        mtime = entry.stat().st_mtime
+        if self._is_dir_record_fresh(entry.path, record, mtime):
+            return record, False
+        return self._scan_top_level_dir(entry.name, entry.path, mtime), True
+    
+    def _build_video_map(self) -> Dict[str, Dict]:
+        """
+        由内存中的目录索引合成 video_name -> 信息 映射
+        
+        按基础目录的遍历顺序合并顶层文件和目录，同名时后遍历到的条目覆盖先遍历到的，
+        与逐项扫描（os.listdir顺序）的结果一致
+        """
+        top_files = self._catalog['top_files']
+        dirs = self._catalog['dirs']
+        order = self._catalog.get('order') or []
+        listed = set(order)
+        items = order + [item for item in list(top_files) + list(dirs) if item not in listed]
+        
+        video_map = {}
+        for item in items:
+            if item in top_files:
+                video_name, info = top_files[item]
+                video_map[video_name] = info
+            elif item in dirs:
+                video_map.update(dirs[item]['entries'])
+        return video_map
+    
+    def _set_video_cache(self, video_map: Dict[str, Dict]):
+        """替换video_cache，内容有变化时递增目录索引版本"""
+        if video_map != self.video_cache or self.catalog_version == 0:
+            self.catalog_version += 1
+            self._web_path_cache = {}
+        self.video_cache = video_map
+    
+    def _start_scan_progress(self, total: int):
+        self.scan_progress = {
+            'running': True,
+            'total': total,
+            'done': 0,
+            'rescanned': 0,
+            'started_at': time.time(),
+            'finished_at': None
+        }
+        self._progress_step = max(1, total // 10)
+    
+    def _advance_scan_progress(self, was_rescanned: bool, progress_callback=None, verbose: bool = True):
+        progress = self.scan_progress
+        progress['done'] += 1
+        progress['rescanned'] += int(was_rescanned)
+        if progress_callback:
+            progress_callback(dict(progress))
+        # 只在较大的目录树上打印进度，避免刷屏
+        if (verbose and progress['total'] >= 100 and progress['rescanned']
+                and progress['done'] % self._progress_step == 0):
+            print(f"扫描进度: {progress['done']}/{progress['total']} 个目录（重新扫描 {progress['rescanned']}）")
+    
+    def _finish_scan_progress(self):
+        self.scan_progress['running'] = False
+        self.scan_progress['finished_at'] = time.time()
+    
+    def scan_video_directory(self, force: bool = False, verbose: bool = True,
+                             progress_callback=None) -> Dict[str, Dict]:
         """
         扫描视频目录，建立video_name到文件路径的映射
         
+        首次扫描结果持久化到缓存目录；之后只重新扫描mtime发生变化的目录
+        
+        Args:
+            force: 忽略持久化索引，全量重新扫描
+            verbose: 是否打印扫描结果（后台轮询时仅在有变化时打印）
+            progress_callback: 每完成一个顶层目录时回调，参数为进度字典
+        
         Returns:
             Dict: {video_name: {type: 'single'|'multi', path: str, files: List[str]}}
         """
         if not os.path.exists(self.base_video_dir):
             print(f"警告: 视频目录不存在: {self.base_video_dir}")
             return {}
-            
-        video_map = {}
         
-        # 遍历基础目录
-        for item in os.listdir(self.base_video_dir):
-            item_path = os.path.join(self.base_video_dir, item)
+        with self._lock:
+            if self._catalog is None or force:
+                self._catalog = self._load_catalog()
+                if force:
+                    self._catalog['dirs'] = {}
+            
+            old_dirs = self._catalog['dirs']
+            old_top_files = self._catalog['top_files']
+            new_dirs = {}
+            new_top_files = {}
+            new_order = []
+            dir_entries = []
+            
+            # 遍历基础目录
+            with os.scandir(self.base_video_dir) as it:
+                for entry in it:
+                    if entry.is_file() and self._is_video_file(entry.name):
+                        # 顶层单个视频文件：<base>/<video_name>.ext
+                        # 严格模式下仍然支持，方便单视角文件逐步迁移
+                        new_top_files[entry.name] = self._top_file_entry(entry.name, entry.path)
+                        new_order.append(entry.name)
+                    elif entry.is_dir():
+                        dir_entries.append(entry)
+                        new_order.append(entry.name)
             
-            if os.path.isfile(item_path) and self._is_video_file(item):
-                # 顶层单个视频文件：<base>/<video_name>.ext
-                # 严格模式下仍然支持，方便单视角文件逐步迁移
-                video_name = os.path.splitext(item)[0]
-                video_map[video_name] = {
-                    'type': 'single',
-                    'path': item_path,
-                    'files': [item]
+            # 各顶层目录相互独立，分发到线程池并行校验/扫描（网络存储上每次stat都是一次往返）
+            results = [None] * len(dir_entries)
+            rescanned = 0
+            self._start_scan_progress(len(dir_entries))
+            with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+                futures = {
+                    executor.submit(self._refresh_dir_record, entry, old_dirs.get(entry.name)): i
+                    for i, entry in enumerate(dir_entries)
                 }
-                
-            elif os.path.isdir(item_path):
-                # 严格模式：仅识别 <base>/<video_name>/*.mp4 结构
-                # 目录名即 video_name，目录内所有视频文件为视角文件
-                direct_video_files = [f for f in os.listdir(item_path) if self._is_video_file(f)]
-                if direct_video_files:
-                    video_map[item] = {
-                        'type': 'multi',
-                        'path': item_path,
-                        'files': direct_video_files
-                    }
-
-                # 非严格模式下，兼容 group 层：<base>/<group>/<video_name>/<cam*.ext>
-                if not self.strict_structure:
-                    for sub_item in os.listdir(item_path):
-                        sub_item_path = os.path.join(item_path, sub_item)
-                        if os.path.isdir(sub_item_path):
-                            video_files = [file for file in os.listdir(sub_item_path) if self._is_video_file(file)]
-                            if video_files:
-                                video_map[sub_item] = {
-                                    'type': 'multi',
-                                    'path': sub_item_path,
-                                    'files': video_files
-                                }
-                        elif os.path.isfile(sub_item_path) and self._is_video_file(sub_item):
-                            video_name = os.path.splitext(sub_item)[0]
-                            video_map[video_name] = {
-                                'type': 'single',
-                                'path': sub_item_path,
-                                'files': [sub_item]
-                            }
-        
-        self.video_cache = video_map
-        print(f"扫描完成，找到 {len(video_map)} 个视频源")
+                for future in as_completed(futures):
+                    record, was_rescanned = future.result()
+                    results[futures[future]] = record
+                    rescanned += int(was_rescanned)
+                    self._advance_scan_progress(was_rescanned, progress_callback, verbose)
+            self._finish_scan_progress()
+            
+            # 保持目录遍历顺序，与串行扫描结果一致
+            for entry, record in zip(dir_entries, results):
+                new_dirs[entry.name] = record
+            
+            catalog_changed = (rescanned > 0 or set(new_dirs) != set(old_dirs)
+                               or set(new_top_files) != set(old_top_files)
+                               or new_order != self._catalog.get('order'))
+            self._catalog['dirs'] = new_dirs
+            self._catalog['top_files'] = new_top_files
+            self._catalog['order'] = new_order
+            if catalog_changed:
+                self._save_catalog()
+            
+            video_map = self._build_video_map()
+            self._set_video_cache(video_map)
+        if verbose or catalog_changed:
+            print(f"扫描完成，找到 {len(video_map)} 个视频源（重新扫描 {rescanned}/{len(new_dirs)} 个目录）")
         return video_map
     
+    def _top_file_entry(self, item: str, item_path: str) -> List:
+        """顶层单视频文件的索引条目: [video_name, info]"""
+        video_name = os.path.splitext(item)[0]
+        return [video_name, {
+            'type': 'single',
+            'path': item_path,
+            'files': [item]
+        }]
+    
+    def refresh_items(self, items) -> bool:
+        """
+        只刷新基础目录下指定的顶层条目（文件或目录），用于监听事件的增量更新
+        
+        Args:
+            items: 顶层条目名称集合
+            
+        Returns:
+            bool: video_cache是否发生变化
+        """
+        with self._lock:
+            if self._catalog is None or not self.video_cache:
+                # 尚未建立索引，直接走一次完整（增量）扫描
+                before = self.catalog_version
+                self.scan_video_directory()
+                return self.catalog_version != before
+            
+            for item in items:
+                item_path = os.path.join(self.base_video_dir, item)
+                self._catalog['top_files'].pop(item, None)
+                self._catalog['dirs'].pop(item, None)
+                try:
+                    if os.path.isfile(item_path) and self._is_video_file(item):
+                        self._catalog['top_files'][item] = self._top_file_entry(item, item_path)
+                    elif os.path.isdir(item_path):
+                        self._catalog['dirs'][item] = self._scan_top_level_dir(item, item_path)
+                except OSError as e:
+                    # 扫描过程中目录被删除等竞态，视为条目不存在
+                    print(f"刷新视频目录条目失败 {item}: {e}")
+            
+            # 同名条目的覆盖顺序取决于基础目录的遍历顺序，重新读取一次（只列顶层，不stat）
+            try:
+                self._catalog['order'] = [name for name in os.listdir(self.base_video_dir)
+                                          if name in self._catalog['top_files'] or name in self._catalog['dirs']]
+            except OSError as e:
+                print(f"读取视频目录失败 {self.base_video_dir}: {e}")
+            
+            before = self.catalog_version
+            self._set_video_cache(self._build_video_map())
+            changed = self.catalog_version != before
+            self._save_catalog()
+            return changed
+    
+    def get_catalog_status(self) -> Dict:
+        """返回目录索引版本与监听状态"""
+        return {
+            'catalog_version': self.catalog_version,
+            'video_count': len(self.video_cache),
+            'video_dir': self.base_video_dir,
+            'watch_mode': self._watch_mode,
+            'web_path_cache_size': len(self._web_path_cache),
+            'scan_progress': dict(self.scan_progress)
+        }
+    
+    def start_watching(self, use_inotify: bool = True) -> Optional[str]:
+        """
+        启动目录监听：优先使用watchdog(inotify)，不可用时退回定时轮询
+        
+        Returns:
+            str: 实际使用的监听方式 'inotify' | 'polling'，目录不存在时返回None
+        """
+        if self._watch_mode:
+            return self._watch_mode
+        if not os.path.isdir(self.base_video_dir):
+            print(f"警告: 视频目录不存在，无法监听: {self.base_video_dir}")
+            return None
+        
+        self._watch_stop.clear()
+        self._watch_wakeup.clear()
+        self._pending_items = set()
+        self._pending_full_scan = False
+        mode = 'polling'
+        if use_inotify and WATCHDOG_AVAILABLE:
+            try:
+                observer = Observer()
+                observer.schedule(_VideoDirEventHandler(self), self.base_video_dir, recursive=True)
+                observer.daemon = True
+                observer.start()
+                self._observer = observer
+                mode = 'inotify'
+            except Exception as e:
+                # 如inotify watch数量超限，退回轮询
+                print(f"目录监听启动失败，改用轮询: {e}")
+                self._observer = None
+        
+        self._watch_mode = mode
+        self._watch_thread = threading.Thread(target=self._watch_loop, name='video-catalog-watch', daemon=True)
+        self._watch_thread.start()
+        print(f"视频目录监听已启动（{mode}）: {self.base_video_dir}")
+        return mode
+    
+    def stop_watching(self):
+        """停止目录监听"""
+        if not self._watch_mode:
+            return
+        self._watch_stop.set()
+        self._watch_wakeup.set()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=5)
+            except Exception as e:
+                print(f"停止目录监听失败: {e}")
+            self._observer = None
+        if self._watch_thread is not None:
+            self._watch_thread.join(timeout=5)
+            self._watch_thread = None
+        self._watch_mode = None
+    
+    def _on_path_changed(self, path: str):
+        """记录变化路径对应的顶层条目，唤醒后台线程合并处理"""
+        try:
+            rel_path = os.path.relpath(path, self.base_video_dir)
+        except ValueError:
+            return
+        parts = rel_path.split(os.sep)
+        with self._lock:
+            if rel_path == '.' or parts[0] == '..':
+                self._pending_full_scan = True
+            else:
+                self._pending_items.add(parts[0])
+        self._watch_wakeup.set()
+    
+    def _watch_loop(self):
+        """后台线程：inotify模式下合并处理事件，轮询模式下定时增量扫描"""
+        # 首次扫描在后台线程中进行，不阻塞启动监听的调用方
+        if not self.video_cache:
+            try:
+                self.scan_video_directory()
+            except Exception as e:
+                print(f"扫描视频目录失败: {e}")
+        while not self._watch_stop.is_set():
+            if self._watch_mode == 'polling':
+                self._watch_wakeup.wait(VIDEO_WATCH_POLL_INTERVAL)
+                if self._watch_stop.is_set():
+                    break
+                self._watch_wakeup.clear()
+                try:
+                    self.scan_video_directory(verbose=False)
+                except Exception as e:
+                    print(f"轮询扫描视频目录失败: {e}")
+                continue
+            
+            self._watch_wakeup.wait()
+            if self._watch_stop.is_set():
+                break
+            # 合并短时间内的连续事件（如批量下载、解压）
+            time.sleep(VIDEO_WATCH_DEBOUNCE)
+            self._watch_wakeup.clear()
+            with self._lock:
+                items = self._pending_items
+                full_scan = self._pending_full_scan
+                self._pending_items = set()
+                self._pending_full_scan = False
+            try:
+                if full_scan:
+                    self.scan_video_directory()
+                elif items:
+                    self.refresh_items(items)
+            except Exception as e:
+                print(f"处理视频目录变化失败: {e}")
+    
     def find_video_path(self, video_name: str, perspective: str = None) -> Optional[str]:
         """
         根据video_name和视角找到具体的视频文件路径
@@ -186,7 +625,7 @@ class VideoPathManager:
     
     def get_relative_video_path(self, video_name: str, perspective: str = None) -> Optional[str]:
         """
-        获取相对于web根目录的视频路径（用于前端显示）
+        获取相对于项目根目录的视频文件路径
         
         Args:
             video_name: 视频名称
@@ -215,32 +654,107 @@ class VideoPathManager:
     
     def get_web_video_path(self, video_name: str, perspective: str = None) -> Optional[str]:
         """
-        获取用于Web显示的视频路径（包含static/videos前缀）
+        获取用于Web播放的视频地址（/media 路由，不暴露文件系统路径）
         
         Args:
             video_name: 视频名称
             perspective: 视角文件名
             
         Returns:
-            str: Web路径，如 "/static/videos/..."
+            str: Web路径，如 "/media/<video_name>/<perspective>"
         """
-        absolute_path = self.find_video_path(video_name, perspective)
-        if not absolute_path:
+        return self._resolve_web_path(video_name, perspective)
+    
+    def get_media_url(self, video_name: str, file_name: str) -> str:
+        """构造 /media/<video_name>/<file_name> 地址"""
+        return f"/media/{quote(video_name, safe='')}/{quote(file_name, safe='')}"
+    
+    def get_media_file(self, video_name: str, perspective: str) -> Optional[str]:
+        """
+        /media 路由使用的严格解析：视角必须是目录索引中登记的文件，不做回退
+        
+        Returns:
+            str: 视频文件路径，不存在返回None
+        """
+        if not self.video_cache:
+            self.scan_video_directory()
+        
+        video_info = self.video_cache.get(video_name)
+        if not video_info or perspective not in video_info['files']:
             return None
+        if video_info['type'] == 'single':
+            return video_info['path']
+        return os.path.join(video_info['path'], perspective)
+    
+    def resolve_many(self, pairs: List[Tuple[str, Optional[str]]]) -> List[Dict]:
+        """
+        批量解析 (video_name, perspective) 对
         
-        # 获取相对于项目根目录的路径
-        project_root = os.path.abspath('.')
+        Args:
+            pairs: [(video_name, perspective), ...]，perspective可为None
+            
+        Returns:
+            List[Dict]: 与输入顺序一致，每项包含
+                video_name, perspective, video_path（找不到或多视角未指定视角时为None）,
+                perspectives（该视频全部视角文件）, missing（视频或指定视角不存在）
+        """
+        if not self.video_cache:
+            self.scan_video_directory()
+        
+        results = []
+        for video_name, perspective in pairs:
+            video_info = self.video_cache.get(video_name)
+            if video_info is None:
+                missing = True
+                video_path = self._resolve_web_path(video_name, perspective)
+            elif video_info['type'] == 'multi' and not perspective:
+                # 多视角视频未指定视角：只返回视角列表
+                missing = False
+                video_path = None
+            else:
+                missing = video_info['type'] == 'multi' and perspective not in video_info['files']
+                video_path = self._resolve_web_path(video_name, perspective)
+            results.append({
+                'video_name': video_name,
+                'perspective': perspective,
+                'video_path': video_path,
+                'perspectives': video_info['files'] if video_info else [],
+                'missing': missing
+            })
+        return results
+    
+    def _resolve_web_path(self, video_name: str, perspective: str = None) -> Optional[str]:
+        """
+        解析Web播放地址并缓存结果
+        
+        列表接口对每个QA都会调用，命中缓存时不产生任何文件系统调用；
+        目录索引变化（catalog_version递增）或切换目录时整体失效
+        """
+        key = (self.base_video_dir, video_name, perspective)
         try:
-            relative_path = os.path.relpath(absolute_path, project_root)
-            # 确保路径使用正斜杠（web标准）
-            relative_path = relative_path.replace('\\', '/')
-            # 确保路径以 / 开头
-            if not relative_path.startswith('/'):
-                relative_path = '/' + relative_path
-            return relative_path
-        except ValueError:
-            # 如果无法计算相对路径，返回绝对路径
-            return absolute_path
+            return self._web_path_cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # 视角字段格式异常（不可哈希），不缓存
+            return self._compute_web_path(video_name, perspective)
+        
+        if not self.video_cache:
+            self.scan_video_directory()
+        version = self.catalog_version
+        web_path = self._compute_web_path(video_name, perspective)
+        with self._lock:
+            # 计算期间目录索引若已变化，结果可能过期，不写入缓存
+            if version == self.catalog_version:
+                self._web_path_cache[key] = web_path
+        return web_path
+    
+    def _compute_web_path(self, video_name: str, perspective: str = None) -> Optional[str]:
+        absolute_path = self.find_video_path(video_name, perspective)
+        if not absolute_path:
+            return None
+        # 使用实际解析到的文件（视角不存在时find_video_path会回退到第一个文件）
+        return self.get_media_url(video_name, os.path.basename(absolute_path))
     
     def list_all_videos(self) -> List[Dict]:
         """
@@ -0,0 +1,284 @@
+"""
+视频代理文件管理器
+把高码率视角文件转码为小尺寸H.264代理文件供标注界面播放；
+转码在有上限的ffmpeg进程池中执行，任务状态持久化，代理文件与源文件一致时跳过
+"""
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+import subprocess
+from typing import Dict, List, Optional
+
+from .ffmpeg_job_manager import FFmpegJobManager, FFMPEG_BIN
+from .video_path_manager import video_path_manager, CACHE_DIR
+
+# 代理参数：高度（像素，宽度按比例）、CRF质量、x264 preset
+PROXY_HEIGHT = int(os.environ.get('PROXY_HEIGHT', 480))
+PROXY_CRF = int(os.environ.get('PROXY_CRF', 28))
+PROXY_PRESET = os.environ.get('PROXY_PRESET', 'veryfast')
+# 同时运行的ffmpeg转码进程数
+PROXY_WORKERS = int(os.environ.get('PROXY_WORKERS', 2))
+PROXY_FFMPEG_TIMEOUT = int(os.environ.get('PROXY_FFMPEG_TIMEOUT', 4 * 3600))
+# 任务状态变化后延迟写盘的间隔（秒），期间的多次变化合并为一次写入
+PROXY_STATE_FLUSH_INTERVAL = float(os.environ.get('PROXY_STATE_FLUSH_INTERVAL', 2.0))
+
+
+class VideoProxyManager(FFmpegJobManager):
+    """代理文件转码管理器"""
+    
+    feature_name = '代理转码'
+    
+    def __init__(self, cache_dir: str = None, workers: int = None):
+        super().__init__(workers or PROXY_WORKERS, 'proxy')
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'proxies')
+        # 任务状态文件：{job_key: {video_name, perspective, source, source_size, source_mtime,
+        #                         proxy_file, status, error, updated_at}}
+        # 任务记录单独保存在records中并持久化（基类的jobs只保存状态字符串），重启后恢复未完成的任务
+        self.state_file_path = os.path.join(self.cache_dir, 'jobs.json')
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._flush_timer = None
+        self._resumed = False
+        atexit.register(self.save_state)
+        self.load_state()
+    
+    def load_state(self):
+        """加载持久化的任务状态（未完成的任务在第一次使用代理时才重新排队，见resume_interrupted）"""
+        self.records = {}
+        if os.path.exists(self.state_file_path):
+            try:
+                with open(self.state_file_path, 'r', encoding='utf-8') as f:
+                    self.records = json.load(f)
+            except Exception as e:
+                print(f"加载代理任务状态失败: {e}")
+                self.records = {}
+    
+    def resume_interrupted(self):
+        """
+        上次未完成的任务重新排队（只执行一次）
+        
+        不在构造时执行：导入app（debug模式reloader的监控进程、其他导入app的脚本）不会启动ffmpeg，
+        避免两个进程同时转码同一个代理临时文件
+        """
+        with self._lock:
+            if self._resumed:
+                return
+            self._resumed = True
+            if not self.ffmpeg_available:
+                return
+            interrupted = [key for key, job in self.records.items() if job['status'] in ('pending', 'running')]
+            for key in interrupted:
+                self.records[key]['status'] = 'pending'
+        if interrupted:
+            print(f"恢复 {len(interrupted)} 个未完成的代理转码任务")
+        for key in interrupted:
+            self._executor.submit(self._run_job, key)
+    
+    def save_state(self):
+        """原子写入任务状态（锁内只复制快照，序列化与写盘在锁外进行）"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = {key: dict(job) for key, job in self.records.items()}
+                self._dirty = False
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{self.state_file_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self.state_file_path)
+            except Exception as e:
+                print(f"保存代理任务状态失败: {e}")
+                with self._lock:
+                    self._dirty = True
+    
+    def _mark_dirty(self):
+        """标记任务状态有变化，PROXY_STATE_FLUSH_INTERVAL秒后合并写盘一次"""
+        with self._lock:
+            self._dirty = True
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(PROXY_STATE_FLUSH_INTERVAL, self._flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def _flush(self):
+        with self._lock:
+            self._flush_timer = None
+        self.save_state()
+    
+    def _job_key(self, source_path: str) -> str:
+        return hashlib.sha1(os.path.abspath(source_path).encode('utf-8')).hexdigest()[:24]
+    
+    def _is_fresh(self, job: Optional[Dict], source_stat) -> bool:
+        """代理已完成且源文件自转码后未变化"""
+        return bool(job
+                    and job['status'] == 'done'
+                    and job['source_size'] == source_stat.st_size
+                    and job['source_mtime'] == source_stat.st_mtime
+                    and os.path.exists(os.path.join(self.cache_dir, job['proxy_file'])))
+    
+    def get_proxy_path(self, video_name: str, perspective: str, enqueue: bool = True) -> Optional[str]:
+        """
+        返回可用的代理文件路径；不存在或已过期时（可选）提交转码任务并返回None
+        """
+        self.resume_interrupted()
+        source_path = video_path_manager.get_media_file(video_name, perspective)
+        if not source_path:
+            return None
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return None
+        
+        key = self._job_key(source_path)
+        with self._lock:
+            job = self.records.get(key)
+            if self._is_fresh(job, source_stat):
+                return os.path.join(self.cache_dir, job['proxy_file'])
+        if enqueue:
+            self.enqueue(video_name, perspective)
+        return None
+    
+    def enqueue(self, video_name: str, perspective: str, retry_failed: bool = False) -> Optional[str]:
+        """
+        提交单个视角的转码任务
+        
+        Returns:
+            str: 任务状态（'done'表示代理已是最新无需转码），视角不存在返回None
+        """
+        if not self.ffmpeg_available:
+            return 'unavailable'
+        self.resume_interrupted()
+        source_path = video_path_manager.get_media_file(video_name, perspective)
+        if not source_path:
+            return None
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return None
+        
+        key = self._job_key(source_path)
+        with self._lock:
+            job = self.records.get(key)
+            if self._is_fresh(job, source_stat):
+                return 'done'
+            if job and job['status'] in ('pending', 'running'):
+                return job['status']
+            if job and job['status'] == 'failed' and not retry_failed \
+                    and job['source_size'] == source_stat.st_size and job['source_mtime'] == source_stat.st_mtime:
+                # 同一源文件转码失败过，避免每次播放都重试
+                return 'failed'
+            self.records[key] = {
+                'video_name': video_name,
+                'perspective': perspective,
+                'source': os.path.abspath(source_path),
+                'source_size': source_stat.st_size,
+                'source_mtime': source_stat.st_mtime,
+                'proxy_file': f"{key}.mp4",
+                'status': 'pending',
+                'error': None,
+                'updated_at': time.time()
+            }
+            self._mark_dirty()
+        self._executor.submit(self._run_job, key)
+        return 'pending'
+    
+    def _set_status(self, key: str, status: str, error: str = None):
+        with self._lock:
+            job = self.records.get(key)
+            if not job:
+                return
+            job['status'] = status
+            job['error'] = error
+            job['updated_at'] = time.time()
+            self._mark_dirty()
+    
+    def _run_job(self, key: str):
+        """执行转码（在进程池线程中运行，每个线程同一时刻只占用一个ffmpeg进程）"""
+        with self._lock:
+            job = dict(self.records.get(key) or {})
+        if not job or job.get('status') != 'pending':
+            return
+        self._set_status(key, 'running')
+        
+        proxy_path = os.path.join(self.cache_dir, job['proxy_file'])
+        tmp_path = proxy_path[:-len('.mp4')] + '.tmp.mp4'
+        cmd = [
+            FFMPEG_BIN, '-v', 'error', '-y',
+            '-i', job['source'],
+            '-vf', f"scale=-2:'min({PROXY_HEIGHT},ih)'",
+            '-c:v', 'libx264', '-preset', PROXY_PRESET, '-crf', str(PROXY_CRF),
+            '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', '96k',
+            '-movflags', '+faststart',
+            tmp_path
+        ]
+        started = time.time()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=PROXY_FFMPEG_TIMEOUT)
+            if result.returncode != 0 or not os.path.exists(tmp_path):
+                raise RuntimeError(result.stderr.strip() or f"ffmpeg退出码 {result.returncode}")
+            os.replace(tmp_path, proxy_path)
+            self._set_status(key, 'done')
+            with self._lock:
+                self.stats['generated'] += 1
+            print(f"代理转码完成 {job['video_name']}/{job['perspective']}，耗时 {time.time() - started:.1f}s")
+        except Exception as e:
+            print(f"代理转码失败 {job['video_name']}/{job['perspective']}: {e}")
+            self._set_status(key, 'failed', str(e)[:500])
+            with self._lock:
+                self.stats['failed'] += 1
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    def start_background_job(self, video_names: List[str] = None) -> Dict:
+        """
+        为所有（或指定）视频的每个视角提交转码任务，代理已是最新的跳过，失败的重试
+        
+        Returns:
+            Dict: {queued: 新提交或排队中的数量, fresh: 已是最新的数量}
+        """
+        if video_names is None:
+            if not video_path_manager.video_cache:
+                video_path_manager.scan_video_directory()
+            video_names = list(video_path_manager.video_cache.keys())
+        
+        summary = {'queued': 0, 'fresh': 0}
+        for video_name in video_names:
+            for perspective in video_path_manager.get_available_perspectives(video_name):
+                status = self.enqueue(video_name, perspective, retry_failed=True)
+                if status == 'done':
+                    summary['fresh'] += 1
+                elif status in ('pending', 'running'):
+                    summary['queued'] += 1
+        # 整批提交后立即写一次，进程意外退出也能恢复排队中的任务
+        self.save_state()
+        print(f"代理转码任务: 排队 {summary['queued']}，已是最新 {summary['fresh']}")
+        return summary
+    
+    def get_status(self) -> Dict:
+        """返回各状态的任务数量"""
+        with self._lock:
+            counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+            for job in self.records.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return {
+                **super().get_status(),
+                'workers': self.workers,
+                'proxy_height': PROXY_HEIGHT,
+                **counts
+            }
+
+# 全局代理文件管理器实例
+video_proxy_manager = VideoProxyManager()
@@ -0,0 +1,235 @@
+"""
+视频缩略图管理器
+为每个视角文件生成缩略图雪碧图（默认每秒一帧，只解码关键帧）和WebVTT索引，
+前端拖动/输入时间点时直接显示对应缩略图，无需在原视频中来回seek
+"""
+
+import os
+import re
+import json
+import math
+import time
+import shutil
+import hashlib
+import subprocess
+from typing import Dict, List, Optional
+
+from .ffmpeg_job_manager import FFmpegJobManager, FFMPEG_BIN
+from .video_path_manager import video_path_manager, CACHE_DIR
+from .video_metadata_manager import video_metadata_manager
+
+# 缩略图参数：时间间隔（秒）、单张宽度（像素）、每张雪碧图的行列数
+THUMBNAIL_INTERVAL = float(os.environ.get('THUMBNAIL_INTERVAL', 1))
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', 160))
+THUMBNAIL_COLUMNS = int(os.environ.get('THUMBNAIL_COLUMNS', 10))
+THUMBNAIL_ROWS = int(os.environ.get('THUMBNAIL_ROWS', 10))
+# 同时运行的ffmpeg生成任务数
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+THUMBNAIL_FFMPEG_TIMEOUT = int(os.environ.get('THUMBNAIL_FFMPEG_TIMEOUT', 1800))
+
+THUMBNAIL_KEY_PATTERN = re.compile(r'^[0-9a-f]{24}$')
+THUMBNAIL_FILE_PATTERN = re.compile(r'^(sheet_\d{3}\.jpg|sprite\.vtt)$')
+
+
+def _format_vtt_time(seconds: float) -> str:
+    hours = int(seconds // 3600)
+    minutes = int(seconds % 3600 // 60)
+    secs = seconds % 60
+    return f"{hours:02d}:{minutes:02d}:{secs:06.3f}"
+
+
+class VideoThumbnailManager(FFmpegJobManager):
+    """缩略图雪碧图管理器"""
+    
+    feature_name = '缩略图生成'
+    
+    def __init__(self, cache_dir: str = None, workers: int = None):
+        super().__init__(workers or THUMBNAIL_WORKERS, 'thumbnail')
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'thumbnails')
+        self._index_cache = {}  # key -> index
+    
+    def _key(self, source_path: str, source_stat) -> str:
+        # 源文件与缩略图参数都参与计算，任一变化都会生成新的雪碧图
+        raw = (f"{os.path.abspath(source_path)}|{source_stat.st_size}|{source_stat.st_mtime}|"
+               f"{THUMBNAIL_INTERVAL}|{THUMBNAIL_WIDTH}|{THUMBNAIL_COLUMNS}x{THUMBNAIL_ROWS}")
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+    
+    def _load_index(self, key: str) -> Optional[Dict]:
+        if key in self._index_cache:
+            return self._index_cache[key]
+        index_path = os.path.join(self.cache_dir, key, 'index.json')
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self._index_cache[key] = index
+            return index
+        except Exception as e:
+            print(f"读取缩略图索引失败 {key}: {e}")
+            return None
+    
+    def get_thumbnails(self, video_name: str, perspective: str, generate: bool = True) -> Optional[Dict]:
+        """
+        获取视角的缩略图索引；尚未生成时提交后台任务
+        
+        Returns:
+            Dict: {status: 'ready'|'pending'|'running'|'failed'|'unavailable', ...索引字段}
+                  视频或视角不存在返回None
+        """
+        source_path = video_path_manager.get_media_file(video_name, perspective)
+        if not source_path:
+            return None
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            return None
+        key = self._key(source_path, source_stat)
+        
+        index = self._load_index(key)
+        if index:
+            return {'status': 'ready', **index}
+        if not self.ffmpeg_available:
+            return {'status': 'unavailable'}
+        
+        with self._lock:
+            state = self.jobs.get(key)
+            if state is None and generate:
+                state = self._submit_job(key, self._generate, key, source_path)
+        return {'status': state or 'missing'}
+    
+    def _generate(self, key: str, source_path: str) -> bool:
+        """调用ffmpeg生成雪碧图，并写出WebVTT与JSON索引"""
+        metadata = video_metadata_manager.get_metadata(source_path)
+        if not metadata or not metadata.get('duration') or not metadata.get('width') or not metadata.get('height'):
+            print(f"缺少视频时长/分辨率，无法生成缩略图: {source_path}")
+            return False
+        
+        duration = metadata['duration']
+        tile_width = THUMBNAIL_WIDTH
+        tile_height = max(2, int(round(THUMBNAIL_WIDTH * metadata['height'] / metadata['width'] / 2)) * 2)
+        per_sheet = THUMBNAIL_COLUMNS * THUMBNAIL_ROWS
+        
+        output_dir = os.path.join(self.cache_dir, key)
+        tmp_dir = f"{output_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir, exist_ok=True)
+        
+        started = time.time()
+        # -skip_frame nokey 只解码关键帧，fps滤镜按固定间隔取最近的关键帧
+        cmd = [
+            FFMPEG_BIN, '-v', 'error', '-y',
+            '-skip_frame', 'nokey',
+            '-i', source_path,
+            '-an',
+            '-vf', (f"fps=1/{THUMBNAIL_INTERVAL},scale={tile_width}:{tile_height},"
+                    f"tile={THUMBNAIL_COLUMNS}x{THUMBNAIL_ROWS}"),
+            '-vsync', 'vfr',
+            '-q:v', '5',
+            os.path.join(tmp_dir, 'sheet_%03d.jpg')
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=THUMBNAIL_FFMPEG_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print(f"生成缩略图超时: {source_path}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        if result.returncode != 0:
+            print(f"生成缩略图失败 {source_path}: {result.stderr.strip()}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        
+        # ffmpeg的图片序列从1开始编号，统一改为从0开始
+        produced = sorted(f for f in os.listdir(tmp_dir) if f.startswith('sheet_') and f.endswith('.jpg'))
+        sheets = []
+        for i, file_name in enumerate(produced):
+            target = f"sheet_{i:03d}.jpg"
+            os.replace(os.path.join(tmp_dir, file_name), os.path.join(tmp_dir, target))
+            sheets.append(target)
+        if not sheets:
+            print(f"生成缩略图失败（没有输出）: {source_path}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        
+        count = min(int(math.ceil(duration / THUMBNAIL_INTERVAL)), len(sheets) * per_sheet)
+        cues = self._build_cues(count, duration, tile_width, tile_height)
+        with open(os.path.join(tmp_dir, 'sprite.vtt'), 'w', encoding='utf-8') as f:
+            f.write('WEBVTT\n\n')
+            for cue in cues:
+                f.write(f"{_format_vtt_time(cue['start'])} --> {_format_vtt_time(cue['end'])}\n")
+                f.write(f"{sheets[cue['sheet']]}#xywh={cue['x']},{cue['y']},{tile_width},{tile_height}\n\n")
+        
+        index = {
+            'key': key,
+            'interval': THUMBNAIL_INTERVAL,
+            'duration': duration,
+            'count': count,
+            'tile_width': tile_width,
+            'tile_height': tile_height,
+            'columns': THUMBNAIL_COLUMNS,
+            'rows': THUMBNAIL_ROWS,
+            'sheets': [f"/thumbnails/{key}/{sheet}" for sheet in sheets],
+            'vtt_url': f"/thumbnails/{key}/sprite.vtt"
+        }
+        with open(os.path.join(tmp_dir, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(tmp_dir, output_dir)
+        with self._lock:
+            self._index_cache[key] = index
+        print(f"已生成缩略图 {source_path}: {count} 帧 / {len(sheets)} 张，耗时 {time.time() - started:.1f}s")
+        return True
+    
+    def _build_cues(self, count: int, duration: float, tile_width: int, tile_height: int) -> List[Dict]:
+        per_sheet = THUMBNAIL_COLUMNS * THUMBNAIL_ROWS
+        cues = []
+        for i in range(count):
+            position = i % per_sheet
+            cues.append({
+                'start': i * THUMBNAIL_INTERVAL,
+                'end': min((i + 1) * THUMBNAIL_INTERVAL, duration),
+                'sheet': i // per_sheet,
+                'x': (position % THUMBNAIL_COLUMNS) * tile_width,
+                'y': (position // THUMBNAIL_COLUMNS) * tile_height
+            })
+        return cues
+    
+    def start_background_job(self, video_names: List[str] = None) -> int:
+        """
+        为所有（或指定）视频的每个视角提交缩略图生成任务，已生成的跳过，失败的重试
+        
+        Returns:
+            int: 排队中/生成中的任务数
+        """
+        if not self.ffmpeg_available:
+            return 0
+        if video_names is None:
+            if not video_path_manager.video_cache:
+                video_path_manager.scan_video_directory()
+            video_names = list(video_path_manager.video_cache.keys())
+        
+        self._clear_failed_jobs()
+        
+        queued = 0
+        for video_name in video_names:
+            for perspective in video_path_manager.get_available_perspectives(video_name):
+                result = self.get_thumbnails(video_name, perspective)
+                if result and result['status'] in ('pending', 'running'):
+                    queued += 1
+        print(f"缩略图生成任务: {queued} 个排队中")
+        return queued
+    
+    def get_file_path(self, key: str, file_name: str) -> Optional[str]:
+        """返回缩略图文件路径（校验文件名，避免路径穿越）"""
+        if not THUMBNAIL_KEY_PATTERN.match(key) or not THUMBNAIL_FILE_PATTERN.match(file_name):
+            return None
+        path = os.path.join(self.cache_dir, key, file_name)
+        return path if os.path.exists(path) else None
+    
+    def get_status(self) -> Dict:
+        """返回后台任务状态"""
+        return {**self._job_counts(), **super().get_status()}
+
+# 全局缩略图管理器实例
+video_thumbnail_manager = VideoThumbnailManager()
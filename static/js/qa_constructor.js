@@ -10,11 +10,28 @@ class QAConstructorApp {
         this.selectedQuestionPerspective = null; // 提问视角
         this.currentPlayingPerspective = null; // 当前播放的视角
         this.pendingPerspective = null; // 待添加的视角（用于对话框）
+        this.perspectivesCache = {}; // video_name -> {version, perspectives}，目录索引版本不变时复用
+        this.thumbnails = null; // 当前播放视角的缩略图索引（雪碧图），用于时间点预览
+        this.useProxy = localStorage.getItem('useProxy') !== 'false'; // 默认播放低分辨率代理文件
+        this.mosaic = null; // 正在播放的多视角拼接预览索引（null表示播放单个视角）
         this.init();
     }
     
     init() {
         // 不自动加载，等待用户选择文件
+        const proxyToggle = document.getElementById('useProxyToggle');
+        if (proxyToggle) {
+            proxyToggle.checked = this.useProxy;
+        }
+    }
+    
+    // 切换代理/原始视频播放，并重新加载当前视角
+    setUseProxy(enabled) {
+        this.useProxy = enabled;
+        localStorage.setItem('useProxy', enabled ? 'true' : 'false');
+        if (this.currentQA && this.currentPlayingPerspective) {
+            this.loadVideo(this.currentPlayingPerspective);
+        }
     }
     
     // ==================== 文件加载 ====================
@@ -94,7 +111,7 @@ class QAConstructorApp {
             const result = await response.json();
             
             if (result.success) {
-                alert('✓ 保存成功');
+                alert(`✓ 保存成功（已写盘至版本 ${result.persisted_version}）`);
             } else {
                 alert('❌ 保存失败');
             }
@@ -115,12 +132,34 @@ class QAConstructorApp {
                 this.videos = data.videos;
                 this.renderVideoList();
                 this.updateStatistics();
+                this.prefetchPerspectives();
             }
         } catch (error) {
             console.error('加载Video列表失败:', error);
         }
     }
     
+    // 一次请求预取所有video的视角列表，填充视角缓存
+    async prefetchPerspectives() {
+        if (this.videos.length === 0) return;
+        try {
+            const response = await fetch('/api/video/resolve', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({pairs: this.videos.map(v => [v.video_name, null])})
+            });
+            const data = await response.json();
+            if (!data.results) return;
+            
+            data.results.forEach(result => {
+                const perspectives = (result.perspectives || []).filter(p => p && String(p).trim() !== '');
+                this.perspectivesCache[result.video_name] = {version: data.catalog_version, perspectives};
+            });
+        } catch (error) {
+            console.error('预取视角列表失败:', error);
+        }
+    }
+    
     renderVideoList() {
         const listEl = document.getElementById('videoList');
         if (!listEl) return;
@@ -374,6 +413,10 @@ class QAConstructorApp {
                             style="padding: 10px 15px; border: none; border-radius: 8px; cursor: pointer; font-size: 13px; font-weight: 700; transition: all 0.3s; background: linear-gradient(135deg, #dc3545 0%, #c82333 100%); color: white; box-shadow: 0 2px 8px rgba(220, 53, 69, 0.3);">
                         <i class="fas fa-play"></i> 播放后半段
                     </button>
+                    <button id="mosaicToggleBtn" onclick="constructorApp.toggleMosaic()" 
+                            style="grid-column: 1 / span 2; padding: 10px 15px; border: none; border-radius: 8px; cursor: pointer; font-size: 13px; font-weight: 700; transition: all 0.3s; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; box-shadow: 0 2px 8px rgba(102, 126, 234, 0.3);">
+                        <i class="fas fa-th"></i> 多视角对比
+                    </button>
                 </div>
             </div>
                 
@@ -481,6 +524,8 @@ class QAConstructorApp {
                     <label class="form-label">Cut Point (MM:SS.XX)</label>
                     <input type="text" class="form-input" id="cutPointInput" 
                            value="${qa.cut_point || ''}"
+                           onfocus="constructorApp.previewThumbnail(this.value)"
+                           oninput="constructorApp.previewThumbnail(this.value)"
                            onchange="constructorApp.updateField('cut_point', this.value)">
                 </div>
                 
@@ -489,8 +534,13 @@ class QAConstructorApp {
                     <input type="text" class="form-input" id="questionPerspectiveTimeInput" 
                            value="${qa.提问视角_time || ''}"
                            placeholder="例如：01:34.50"
+                           onfocus="constructorApp.previewThumbnail(this.value)"
+                           oninput="constructorApp.previewThumbnail(this.value)"
                            onchange="constructorApp.updateField('提问视角_time', this.value)">
                 </div>
+                
+                <!-- 时间点缩略图预览（来自雪碧图，无需seek原视频） -->
+                <div id="thumbnailPreview" style="display: none; margin: 0 auto 10px; border-radius: 6px; border: 1px solid #ddd; background-repeat: no-repeat;"></div>
             </div>
             
             <!-- 选项编辑 -->
@@ -605,18 +655,26 @@ class QAConstructorApp {
                 }
             }
             
-            // 构建视频路径
+            // 构建视频路径（/media 路由支持拖动进度时的Range请求）
             let videoPath = '';
             if (perspective) {
-                videoPath = `/static/videos/${videoName}/${perspective}`;
+                videoPath = `/media/${encodeURIComponent(videoName)}/${encodeURIComponent(perspective)}`;
                 this.currentPlayingPerspective = perspective;
             } else {
                 // 单视角视频
-                videoPath = `/static/videos/${videoName}/${videoName}.mp4`;
+                videoPath = `/media/${encodeURIComponent(videoName)}/${encodeURIComponent(videoName + '.mp4')}`;
                 this.currentPlayingPerspective = `${videoName}.mp4`;
                 console.log('[loadVideo] 使用单视角模式');
             }
             
+            if (this.useProxy) {
+                // 代理未生成时服务端返回原文件并在后台转码
+                videoPath += '?quality=proxy';
+            }
+            
+            this.exitMosaicMode();
+            this.loadThumbnails(videoName, this.currentPlayingPerspective);
+            
             if (this.videoPlayer) {
                 const currentTime = this.videoPlayer.currentTime || 0;
                 this.videoPlayer.src = videoPath;
@@ -736,6 +794,115 @@ class QAConstructorApp {
         alert(`✓ 提问视角时间已设置为: ${timeStr}`);
     }
     
+    // 切换多视角拼接预览：所有视角按时间对齐拼在一路视频中，点击画面中的某个视角可加入主视角/提问视角
+    async toggleMosaic() {
+        if (!this.currentQA || !this.videoPlayer) return;
+        if (this.mosaic) {
+            this.loadVideo(this.currentPlayingPerspective);
+            return;
+        }
+        
+        try {
+            const response = await fetch(`/api/video/${encodeURIComponent(this.currentQA.video_name)}/mosaic`);
+            const data = await response.json();
+            if (data.status !== 'ready') {
+                const messages = {
+                    pending: '拼接预览正在排队生成，请稍后再试',
+                    running: '拼接预览正在生成，请稍后再试',
+                    failed: '拼接预览生成失败',
+                    unavailable: '服务器未安装ffmpeg，无法生成拼接预览'
+                };
+                alert('⚠️ ' + (messages[data.status] || data.error || '无法获取拼接预览'));
+                return;
+            }
+            
+            const currentTime = this.videoPlayer.currentTime || 0;
+            this.mosaic = data;
+            this.videoPlayer.src = data.url;
+            this.videoPlayer.onloadeddata = () => {
+                if (currentTime > 0) {
+                    this.videoPlayer.currentTime = currentTime;
+                }
+            };
+            this.videoPlayer.onclick = (e) => this.clickMosaicTile(e);
+            const btn = document.getElementById('mosaicToggleBtn');
+            if (btn) btn.innerHTML = '<i class="fas fa-video"></i> 返回单视角';
+        } catch (error) {
+            console.error('加载拼接预览失败:', error);
+        }
+    }
+    
+    exitMosaicMode() {
+        this.mosaic = null;
+        if (this.videoPlayer) this.videoPlayer.onclick = null;
+        const btn = document.getElementById('mosaicToggleBtn');
+        if (btn) btn.innerHTML = '<i class="fas fa-th"></i> 多视角对比';
+    }
+    
+    // 把点击位置换算到拼接视频的像素坐标（考虑播放器内的黑边），打开对应视角的选择对话框
+    clickMosaicTile(event) {
+        const mosaic = this.mosaic;
+        const player = this.videoPlayer;
+        if (!mosaic || !player.videoWidth) return;
+        
+        const rect = player.getBoundingClientRect();
+        const scale = Math.min(rect.width / player.videoWidth, rect.height / player.videoHeight);
+        const offsetX = (rect.width - player.videoWidth * scale) / 2;
+        const offsetY = (rect.height - player.videoHeight * scale) / 2;
+        const x = (event.clientX - rect.left - offsetX) / scale;
+        const y = (event.clientY - rect.top - offsetY) / scale;
+        
+        const tile = mosaic.tiles.find(t => x >= t.x && x < t.x + t.width && y >= t.y && y < t.y + t.height);
+        if (!tile) return;
+        const index = this.allPerspectives.indexOf(tile.perspective);
+        if (index >= 0) {
+            event.preventDefault();
+            this.clickPerspectiveByIndex(index);
+        }
+    }
+    
+    // 加载当前视角的缩略图索引（未生成时服务端会在后台生成，下次加载即可使用）
+    async loadThumbnails(videoName, perspective) {
+        this.thumbnails = null;
+        if (!perspective) return;
+        try {
+            const response = await fetch(`/api/video/${encodeURIComponent(videoName)}/thumbnails?perspective=${encodeURIComponent(perspective)}`);
+            const data = await response.json();
+            if (data.status === 'ready') {
+                this.thumbnails = data;
+            } else {
+                console.log('[loadThumbnails] 缩略图状态:', data.status || data.error);
+            }
+        } catch (error) {
+            console.error('加载缩略图失败:', error);
+        }
+    }
+    
+    // 根据输入的时间点显示雪碧图中对应的缩略图
+    previewThumbnail(timeStr) {
+        const previewEl = document.getElementById('thumbnailPreview');
+        if (!previewEl) return;
+        
+        const thumbs = this.thumbnails;
+        const seconds = this.timeToSeconds(timeStr);
+        if (!thumbs || !timeStr || seconds < 0 || seconds > thumbs.duration) {
+            previewEl.style.display = 'none';
+            return;
+        }
+        
+        const index = Math.min(Math.floor(seconds / thumbs.interval), thumbs.count - 1);
+        const perSheet = thumbs.columns * thumbs.rows;
+        const position = index % perSheet;
+        const x = (position % thumbs.columns) * thumbs.tile_width;
+        const y = Math.floor(position / thumbs.columns) * thumbs.tile_height;
+        
+        previewEl.style.width = `${thumbs.tile_width}px`;
+        previewEl.style.height = `${thumbs.tile_height}px`;
+        previewEl.style.backgroundImage = `url(${thumbs.sheets[Math.floor(index / perSheet)]})`;
+        previewEl.style.backgroundPosition = `-${x}px -${y}px`;
+        previewEl.style.display = 'block';
+    }
+    
     // 时间格式转换：MM:SS.XX → 秒数
     timeToSeconds(timeStr) {
         if (!timeStr) return 0;
@@ -813,9 +980,18 @@ class QAConstructorApp {
             const videoName = this.currentQA.video_name;
             console.log(`[loadPerspectivesData] 加载video ${videoName} 的视角`);
             
-            const response = await fetch(`/api/constructor/video/${videoName}/perspectives`);
+            const cached = this.perspectivesCache[videoName];
+            const query = cached ? `?catalog_version=${cached.version}` : '';
+            const response = await fetch(`/api/constructor/video/${videoName}/perspectives${query}`);
             const data = await response.json();
             
+            if (data.unchanged && cached) {
+                // 视频目录自上次获取后没有变化
+                data.perspectives = cached.perspectives;
+            } else if (data.perspectives && data.catalog_version !== undefined) {
+                this.perspectivesCache[videoName] = {version: data.catalog_version, perspectives: data.perspectives};
+            }
+            
             console.log('[loadPerspectivesData] API返回的视角:', data.perspectives);
             
             if (data.perspectives) {
@@ -1295,7 +1471,7 @@ class QAConstructorApp {
             console.log('9. 服务器返回数据:', result);
             
             if (result.success) {
-                console.log(`✓ 字段 ${fieldName} 更新成功`);
+                console.log(`✓ 字段 ${fieldName} 更新成功 (版本 ${result.version}, 已写盘 ${result.persisted_version})`);
                 console.log('=== updateField 结束 (成功) ===\n');
                 return true;
             } else {
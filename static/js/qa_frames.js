@@ -0,0 +1,54 @@
+// QA关键时间点截图：切分点(cut_point)与提问视角时间(提问视角_time)
+// 截图由 /api/video/<video_name>/frame 生成并按内容缓存，无需在视频中seek
+const QAFrames = {
+    frameUrl(videoName, perspective, time, width = 480) {
+        return `/api/video/${encodeURIComponent(videoName)}/frame?perspective=${encodeURIComponent(perspective)}&time=${encodeURIComponent(time)}&width=${width}`;
+    },
+    
+    firstPerspective(value) {
+        if (Array.isArray(value)) return value[0] || null;
+        return value || null;
+    },
+    
+    // 返回QA需要展示的截图列表：[{label, perspective, time, url}]
+    // perspective为切分点使用的视角（默认QA的主视角/视角）
+    collect(qa, perspective = null) {
+        const frames = [];
+        if (!qa || !qa.video_name) return frames;
+        const cutPerspective = perspective || this.firstPerspective(qa.主视角 || qa.视角);
+        if (qa.cut_point && cutPerspective) {
+            frames.push({
+                label: '切分点',
+                perspective: cutPerspective,
+                time: qa.cut_point,
+                url: this.frameUrl(qa.video_name, cutPerspective, qa.cut_point)
+            });
+        }
+        const questionPerspective = this.firstPerspective(qa.提问视角);
+        if (qa.提问视角_time && questionPerspective) {
+            frames.push({
+                label: '提问视角',
+                perspective: questionPerspective,
+                time: qa.提问视角_time,
+                url: this.frameUrl(qa.video_name, questionPerspective, qa.提问视角_time)
+            });
+        }
+        return frames;
+    },
+    
+    // 在容器中渲染截图，截图加载失败（如缺少ffmpeg）时隐藏对应项
+    render(container, qa, perspective = null) {
+        const el = typeof container === 'string' ? document.getElementById(container) : container;
+        if (!el) return;
+        const frames = this.collect(qa, perspective);
+        el.style.display = frames.length ? 'flex' : 'none';
+        el.innerHTML = frames.map(frame => `
+            <figure class="qa-frame" style="display: none; margin: 0; text-align: center;">
+                <img src="${frame.url}" alt="${frame.label}画面" title="${frame.label} ${frame.time}（${frame.perspective}）"
+                     style="max-width: 240px; border-radius: 6px; border: 1px solid #ddd;"
+                     onload="this.parentElement.style.display='block'" onerror="this.parentElement.style.display='none'">
+                <figcaption style="font-size: 12px; color: #666;">${frame.label} ${frame.time}</figcaption>
+            </figure>
+        `).join('');
+    }
+};
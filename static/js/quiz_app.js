@@ -7,12 +7,27 @@ class QuizApp {
         this.videoPlayer = null;
         this.showingGT = false;
         this.availablePerspectives = [];
+        this.clipOffset = 0; // 当前加载的片段在原视频中的起始时间（秒），播放完整视频时为0
+        this.useProxy = localStorage.getItem('useProxy') !== 'false'; // 默认播放低分辨率代理文件
         this.init();
     }
     
     init() {
         this.videoPlayer = document.getElementById('videoPlayer');
         // 不自动加载，等待用户选择文件
+        const proxyToggle = document.getElementById('useProxyToggle');
+        if (proxyToggle) {
+            proxyToggle.checked = this.useProxy;
+        }
+    }
+    
+    // 切换代理/原始视频播放，并重新加载当前视频
+    setUseProxy(enabled) {
+        this.useProxy = enabled;
+        localStorage.setItem('useProxy', enabled ? 'true' : 'false');
+        if (this.currentQA) {
+            this.loadVideo();
+        }
     }
     
     // ==================== 文件加载 ====================
@@ -233,17 +248,37 @@ class QuizApp {
             // 构造视频路径
             let videoPath = '';
             if (perspective) {
-                // 多视角：/static/videos/{video_name}/{perspective}
-                videoPath = `/static/videos/${videoName}/${perspective}`;
+                // 多视角：/media/{video_name}/{perspective}
+                videoPath = `/media/${encodeURIComponent(videoName)}/${encodeURIComponent(perspective)}`;
             } else {
-                // 单视角：/static/videos/{video_name}/{video_name}.mp4
-                videoPath = `/static/videos/${videoName}/${videoName}.mp4`;
+                // 单视角：/media/{video_name}/{video_name}.mp4
+                videoPath = `/media/${encodeURIComponent(videoName)}/${encodeURIComponent(videoName + '.mp4')}`;
+            }
+            if (this.useProxy) {
+                videoPath += '?quality=proxy';
+            }
+            
+            // 优先使用只包含本题时间窗口的片段，失败时回退到完整视频
+            this.clipOffset = 0;
+            try {
+                const query = perspective ? `?perspective=${encodeURIComponent(perspective)}` : '';
+                const response = await fetch(`/api/quiz/qa/${this.currentQA.qa_id}/video${query}`);
+                const data = await response.json();
+                if (data.clip_url) {
+                    videoPath = data.clip_url;
+                    this.clipOffset = data.clip_start || 0;
+                }
+            } catch (clipError) {
+                console.warn('获取视频片段失败，使用完整视频:', clipError);
             }
             
             if (this.videoPlayer) {
                 this.videoPlayer.src = videoPath;
                 console.log('加载视频:', videoPath);
             }
+            
+            // 切分点（当前视角）与提问视角时间点的截图
+            QAFrames.render('qaFrames', this.currentQA, perspective);
         } catch (error) {
             console.error('加载视频失败:', error);
         }
@@ -293,6 +328,7 @@ class QuizApp {
                         ` : ''}
                     </span>
                 </div>
+                <div id="qaFrames" class="qa-frames" style="display: none; gap: 12px; justify-content: center; margin: 8px auto 0;"></div>
                 <div class="perspective-selection">
                     <span class="perspective-header">
                         <span class="perspective-label">
@@ -479,9 +515,9 @@ class QuizApp {
     setupTimeDisplay() {
         if (!this.videoPlayer) return;
         
-        // 更新当前播放时间
+        // 更新当前播放时间（加载片段时换算回原视频时间）
         this.videoPlayer.addEventListener('timeupdate', () => {
-            const currentTime = this.videoPlayer.currentTime;
+            const currentTime = this.videoPlayer.currentTime + (this.clipOffset || 0);
             const currentTimeEl = document.getElementById('currentTimeDisplay');
             if (currentTimeEl) {
                 currentTimeEl.textContent = this.formatTimeWithDecimals(currentTime);
@@ -1026,12 +1062,14 @@ class QuizApp {
             playEnd = endTime;
         }
         
-        this.videoPlayer.currentTime = playStart;
+        // 播放片段时，原视频时间需减去片段起点
+        const offset = this.clipOffset || 0;
+        this.videoPlayer.currentTime = Math.max(0, playStart - offset);
         this.videoPlayer.play();
         
         // 监听播放进度，到达结束时间时停止
         const checkTime = () => {
-            if (this.videoPlayer.currentTime >= playEnd) {
+            if (this.videoPlayer.currentTime + offset >= playEnd) {
                 this.videoPlayer.pause();
                 this.videoPlayer.removeEventListener('timeupdate', checkTime);
             }